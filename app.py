@@ -5,20 +5,66 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+import atexit
+
 from flask import Flask
-from database import init_database, add_sample_data
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+from database import (
+    init_database, add_sample_data, configure_database, close_db_pool,
+    POOL_SIZE, BOOK_CACHE_SIZE, BOOK_CACHE_TTL
+)
 from routes import register_blueprints
+from commands import register_commands
+from records import Record
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes Book and Loan records like the dicts they replace."""
 
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
-def create_app():
+
+def create_app(config=None):
     """
     Application factory function to create and configure Flask app.
     
+    Args:
+        config: Optional mapping of settings applied on top of the defaults
+                (e.g. DATABASE_POOL_SIZE, DATABASE_PRAGMAS to override
+                SQLite pragmas such as journal_mode or busy_timeout, or
+                BOOK_CACHE_SIZE = 0 to turn off the book lookup cache, or
+                METRICS_ENABLED = False to stop timing requests and queries)
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
+    app.json = RecordJSONProvider(app)
     app.secret_key = "super secret key"
+    app.config['DATABASE_POOL_SIZE'] = POOL_SIZE
+    app.config['DATABASE_PRAGMAS'] = {}
+    app.config['BOOK_CACHE_SIZE'] = BOOK_CACHE_SIZE
+    app.config['BOOK_CACHE_TTL'] = BOOK_CACHE_TTL
+    app.config['METRICS_ENABLED'] = True
+    if config:
+        app.config.update(config)
+    
+    # Configure storage (pool size, pragmas, book cache) and close the pool cleanly on shutdown
+    configure_database(pool_size=app.config['DATABASE_POOL_SIZE'],
+                       pragmas=app.config['DATABASE_PRAGMAS'],
+                       book_cache_size=app.config['BOOK_CACHE_SIZE'],
+                       book_cache_ttl=app.config['BOOK_CACHE_TTL'])
+    atexit.unregister(close_db_pool)
+    atexit.register(close_db_pool)
+    
+    # Turn request, query and gateway timing on or off (see metrics.py)
+    metrics.ENABLED = app.config['METRICS_ENABLED']
     
     # Initialize the database
     init_database()
@@ -26,8 +72,9 @@ def create_app():
     # Add sample data for testing and demonstration
     add_sample_data()
     
-    # Register all route blueprints
+    # Register all route blueprints and CLI commands
     register_blueprints(app)
+    register_commands(app)
     
     return app
 
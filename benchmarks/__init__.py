@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Library Management System.
+
+Run a benchmark from the repository root, e.g. `python -m benchmarks.bench_wal_concurrency`.
+"""
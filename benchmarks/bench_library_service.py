@@ -0,0 +1,157 @@
+"""
+Latency of the core library_service operations at several catalog sizes.
+
+For each scale, seeds a temporary library with that many books and that many loans,
+then times add_book_to_catalog, borrow_book_by_patron, return_book_by_patron,
+search_books_in_catalog and get_patron_status_report call by call. Results are
+written as JSON so runs on different commits can be compared:
+
+    python -m benchmarks.bench_library_service --scales 10000,100000 --output before.json
+    python -m benchmarks.bench_library_service --scales 10000,100000 --compare before.json
+
+Scales up to 10,000,000 work but take a while (and a few GB of disk) to seed.
+With --compare, the exit status is 1 if any operation's median got slower than
+the baseline by more than --threshold.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from benchmarks.common import temporary_database, seed_books, seed_loans, summarize
+from services.library_service import (
+    add_book_to_catalog, borrow_book_by_patron, return_book_by_patron,
+    search_books_in_catalog, get_patron_status_report
+)
+
+OPERATIONS = ['add_book', 'borrow_book', 'return_book', 'search_books', 'patron_status_report']
+
+
+def time_calls(calls: List[Callable[[], object]]) -> Dict:
+    """Time each call; calls returning (False, ...) or None are counted as failed."""
+    samples, failed = [], 0
+    for call in calls:
+        start = time.perf_counter()
+        result = call()
+        samples.append(time.perf_counter() - start)
+        if result is None or (isinstance(result, tuple) and not result[0]):
+            failed += 1
+    stats = summarize(samples)
+    stats['failed'] = failed
+    return stats
+
+
+def run_scale(scale: int, iterations: int, seed: int) -> Dict:
+    """Seed a library with `scale` books and loans, then time each operation."""
+    rng = random.Random(seed)
+    patrons = max(scale // 20, 100)
+    with temporary_database():
+        seed_books(scale, copies=50)
+        seed_loans(scale, scale, patrons)
+
+        new_isbns = [f'9{scale + i:012d}' for i in range(iterations)]
+        # fresh patrons, so no borrow is refused for hitting the five-book limit
+        loans = [(f'{900000 + i:06d}', rng.randrange(1, scale + 1)) for i in range(iterations)]
+        search_terms = [rng.choice([
+            (f'Book {rng.randrange(scale)}', 'title'),
+            (f'Author {rng.randrange(1000)}', 'author'),
+            (f'{rng.randrange(scale):013d}'[:8], 'isbn'),
+        ]) for _ in range(iterations)]
+        report_patrons = [f'{rng.randrange(patrons):06d}' for _ in range(iterations)]
+
+        return {
+            'add_book': time_calls([
+                lambda isbn=isbn: add_book_to_catalog('Benchmark Book', 'Bench Author', isbn, 2)
+                for isbn in new_isbns]),
+            'borrow_book': time_calls([
+                lambda loan=loan: borrow_book_by_patron(*loan) for loan in loans]),
+            'return_book': time_calls([
+                lambda loan=loan: return_book_by_patron(*loan) for loan in loans]),
+            'search_books': time_calls([
+                lambda term=term: search_books_in_catalog(*term) for term in search_terms]),
+            'patron_status_report': time_calls([
+                lambda patron=patron: get_patron_status_report(patron) for patron in report_patrons]),
+        }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print median changes against a baseline run; return the regressed operations."""
+    regressions = []
+    for scale, operations in results['results'].items():
+        for operation, stats in operations.items():
+            before = baseline.get('results', {}).get(scale, {}).get(operation)
+            if not before:
+                continue
+            change = stats['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append(f'{operation}@{scale}')
+            print(f"{scale:>10} {operation:<22} p50 {before['p50_ms']:8.3f} -> {stats['p50_ms']:8.3f} ms "
+                  f"({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='10000,100000',
+                        help='comma-separated numbers of books (and loans) to seed')
+    parser.add_argument('--iterations', type=int, default=200, help='calls timed per operation')
+    parser.add_argument('--seed', type=int, default=327, help='random seed for the workload')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help='slowdown of the median (0.20 = 20%%) reported as a regression')
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+    for scale in scales:
+        results['results'][str(scale)] = run_scale(scale, args.iterations, args.seed)
+        for operation in OPERATIONS:
+            stats = results['results'][str(scale)][operation]
+            print(f"{scale:>10} {operation:<22} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                  f"p99 {stats['p99_ms']:8.3f} ms  {stats['ops_per_second']:10,.0f} ops/s  "
+                  f"{stats['failed']} failed")
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\ncompared with {baseline.get('meta', {}).get('commit', '?')}:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
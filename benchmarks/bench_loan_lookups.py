@@ -0,0 +1,67 @@
+"""
+Per-patron loan lookups as the borrow_records history grows.
+
+Seeds the loan history in steps up to several million rows, keeping the number of
+loans per patron constant, and times the per-patron helpers at each size. With the
+indexes from schema migration 1 the timings stay flat; pass --no-indexes to see the
+full-table-scan behaviour they replace.
+
+    python -m benchmarks.bench_loan_lookups --sizes 10000 100000 1000000 2000000
+"""
+
+import argparse
+import random
+import time
+
+import database
+from benchmarks.common import temporary_database, seed_books, seed_loans
+
+LOOKUPS = {
+    'get_patron_borrow_count': database.get_patron_borrow_count,
+    'get_patron_borrowed_books': database.get_patron_borrowed_books,
+    'get_patron_history': database.get_patron_history,
+}
+
+
+def time_lookup(func, patrons: int, repeat: int) -> float:
+    """Average milliseconds per call over `repeat` random patrons."""
+    ids = [f'{random.randrange(patrons):06d}' for _ in range(repeat)]
+    start = time.perf_counter()
+    for patron_id in ids:
+        func(patron_id)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 2000000])
+    parser.add_argument('--loans-per-patron', type=int, default=100)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--no-indexes', action='store_true', help='drop the loan indexes before timing')
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_books(args.books)
+        if args.no_indexes:
+            conn = database.get_db_connection()
+            conn.execute('DROP INDEX idx_borrow_records_open_loans')
+            conn.execute('DROP INDEX idx_borrow_records_patron_history')
+            conn.close()
+
+        print(f"{'loans':>10} " + ' '.join(f'{name:>27}' for name in LOOKUPS) + '   (ms per call)')
+        seeded = 0
+        for size in sorted(args.sizes):
+            patrons = max(1, size // args.loans_per_patron)
+            seed_loans(size - seeded, args.books, patrons, start=seeded)
+            seeded = size
+            conn = database.get_db_connection()
+            conn.execute('ANALYZE')
+            conn.close()
+
+            timings = [time_lookup(func, patrons, args.repeat) for func in LOOKUPS.values()]
+            print(f'{size:>10} ' + ' '.join(f'{ms:>27.3f}' for ms in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Memory used by large catalog and history reads: Book/Loan records versus dict rows.
+
+Seeds a temporary library, then reads the whole catalog, an ISBN prefix search matching
+every book and one patron's full borrowing history, once through database.py (which
+returns __slots__ records) and once the way it used to (one dict per sqlite3.Row).
+tracemalloc reports the bytes the result keeps alive and the peak while reading it:
+
+    python -m benchmarks.bench_memory --books 100000 --loans 100000
+    python -m benchmarks.bench_memory --output memory.json
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import database
+from benchmarks.common import temporary_database, seed_books, seed_loans
+
+BOOKS_SQL = f'SELECT {database.BOOK_COLUMNS} FROM books ORDER BY title'
+SEARCH_SQL = f"SELECT {database.BOOK_COLUMNS} FROM books WHERE isbn >= '0' AND isbn < '1' ORDER BY isbn"
+HISTORY_SQL = '''
+    SELECT br.*, b.title, b.author
+    FROM borrow_records br
+    JOIN books b ON br.book_id = b.id
+    WHERE br.patron_id = ?
+    ORDER BY br.borrow_date
+'''
+
+
+def dict_books(sql: str) -> List[Dict]:
+    conn = database.get_db_connection()
+    books = [dict(row) for row in conn.execute(sql)]
+    conn.close()
+    return books
+
+
+def dict_history(patron_id: str) -> List[Dict]:
+    conn = database.get_db_connection()
+    records = conn.execute(HISTORY_SQL, (patron_id,)).fetchall()
+    conn.close()
+    now = datetime.now()
+    return [{
+        'book_id': record['book_id'],
+        'title': record['title'],
+        'author': record['author'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'return_date': datetime.fromisoformat(record['return_date']) if record['return_date'] else None,
+        'is_overdue': now > datetime.fromisoformat(record['due_date']),
+    } for record in records]
+
+
+def measure(read: Callable[[], List]) -> Dict:
+    """Run one read under tracemalloc; report rows, retained and peak bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        rows = read()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'rows': len(rows),
+        'retained_bytes': retained,
+        'peak_bytes': peak,
+        'retained_bytes_per_row': retained / len(rows) if rows else 0.0,
+    }
+
+
+def run(books: int, loans: int) -> Dict:
+    """Seed `books` books and a `loans`-loan history for patron 000000, then measure each read."""
+    reads = {
+        'all_books': (database.get_all_books, lambda: dict_books(BOOKS_SQL)),
+        'isbn_search': (lambda: database.search_books('0', 'isbn'), lambda: dict_books(SEARCH_SQL)),
+        'patron_history': (lambda: database.get_patron_history('000000'), lambda: dict_history('000000')),
+    }
+    with temporary_database():
+        seed_books(books)
+        seed_loans(loans, books, patrons=1)
+        results = {}
+        for name, (records, dicts) in reads.items():
+            results[name] = {'records': measure(records), 'dicts': measure(dicts)}
+            results[name]['retained_ratio'] = (results[name]['records']['retained_bytes']
+                                               / results[name]['dicts']['retained_bytes'])
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--loans', type=int, default=50000, help='loans in the measured patron history')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    results = run(args.books, args.loans)
+    for name, result in results.items():
+        for kind in ('records', 'dicts'):
+            stats = result[kind]
+            print(f"{name:<15} {kind:<8} {stats['rows']:>9,} rows  "
+                  f"retained {stats['retained_bytes'] / 2**20:8.2f} MiB ({stats['retained_bytes_per_row']:6.1f} B/row)  "
+                  f"peak {stats['peak_bytes'] / 2**20:8.2f} MiB")
+        print(f"{name:<15} records keep {result['retained_ratio']:.0%} of the dict rows' memory")
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'books': args.books, 'loans': args.loans, 'results': results}, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Library-wide overdue sweep versus pricing each open loan on its own.
+
+Seeds open loans, times sweep_overdue_fees over all of them, and times
+calculate_late_fee_for_book on a sample of loans to extrapolate what the
+per-loan approach would cost for the same library.
+
+    python -m benchmarks.bench_overdue_sweep --loans 1000000
+"""
+
+import argparse
+import time
+
+import database
+from benchmarks.common import temporary_database, seed_books, seed_loans
+from services.fee_service import sweep_overdue_fees
+from services.library_service import calculate_late_fee_for_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--patrons', type=int, default=100000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--sample', type=int, default=1000, help='loans priced one by one for comparison')
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_books(args.books)
+        # every loan is open; loans are a minute apart, so most are well past due
+        seed_loans(args.loans, args.books, args.patrons, open_every=1)
+
+        start = time.perf_counter()
+        result = sweep_overdue_fees(chunk_size=args.chunk_size)
+        sweep_seconds = time.perf_counter() - start
+
+        conn = database.get_db_connection()
+        sample = conn.execute('SELECT patron_id, book_id FROM borrow_records LIMIT ?', (args.sample,)).fetchall()
+        conn.close()
+        start = time.perf_counter()
+        for loan in sample:
+            calculate_late_fee_for_book(loan['patron_id'], loan['book_id'])
+        per_loan_seconds = (time.perf_counter() - start) / len(sample)
+
+    print(f"sweep: {result['loans']} overdue loans, {result['patrons']} patrons, "
+          f"${result['total_late_fees']:.2f} in {sweep_seconds:.2f}s "
+          f"({result['loans'] / sweep_seconds:,.0f} loans/s)")
+    print(f"per-loan calculate_late_fee_for_book: {per_loan_seconds * 1000:.3f} ms/loan, "
+          f"~{per_loan_seconds * args.loans:.1f}s extrapolated to {args.loans} loans")
+
+
+if __name__ == '__main__':
+    main()
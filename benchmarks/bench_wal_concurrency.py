@@ -0,0 +1,84 @@
+"""
+Read throughput while borrow/return writers run concurrently.
+
+Compares the previous defaults (rollback journal, synchronous=FULL) with the
+WAL configuration in database.SQLITE_PRAGMAS.
+
+    python -m benchmarks.bench_wal_concurrency --readers 4 --writers 2 --seconds 5
+"""
+
+import argparse
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+from benchmarks.common import temporary_database, seed_books
+
+CONFIGURATIONS = {
+    'rollback-journal': {'busy_timeout': 5000, 'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'wal': dict(database.SQLITE_PRAGMAS),
+}
+
+
+def run(pragmas, readers: int, writers: int, seconds: float, books: int):
+    with temporary_database(pragmas):
+        seed_books(books)
+        stop = threading.Event()
+        counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+
+        def bump(key):
+            with lock:
+                counts[key] += 1
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    database.get_book_by_id(random.randint(1, books))
+                    bump('reads')
+                except sqlite3.OperationalError:
+                    bump('read_errors')
+
+        def writer(n):
+            patron_id = f'{n:06d}'
+            while not stop.is_set():
+                book_id = random.randint(1, books)
+                now = datetime.now()
+                ok = database.insert_borrow_record(patron_id, book_id, now, now + timedelta(days=14))
+                ok = database.update_book_availability(book_id, -1) and ok
+                ok = database.update_borrow_record_return_date(patron_id, book_id, now) and ok
+                ok = database.update_book_availability(book_id, 1) and ok
+                bump('writes' if ok else 'write_errors')
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    counts['reads_per_second'] = round(counts['reads'] / seconds, 1)
+    counts['writes_per_second'] = round(counts['writes'] / seconds, 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--books', type=int, default=10000)
+    args = parser.parse_args()
+
+    for name, pragmas in CONFIGURATIONS.items():
+        result = run(pragmas, args.readers, args.writers, args.seconds, args.books)
+        print(f'{name:>18}: ' + ', '.join(f'{key}={value}' for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Shared helpers for the benchmark scripts: temporary databases and synthetic data.
+"""
+
+import os
+import shutil
+import statistics
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import database
+
+
+@contextmanager
+def temporary_database(pragmas: Optional[Dict] = None):
+    """
+    Point the database layer at a fresh library.db in a temporary directory.
+
+    Args:
+        pragmas: Replacement for database.SQLITE_PRAGMAS while the context is active
+    """
+    directory = tempfile.mkdtemp(prefix='library-bench-')
+    saved = (database.DATABASE, database.get_sqlite_pragmas())
+    database.close_db_pool()
+    database.DATABASE = os.path.join(directory, 'library.db')
+    if pragmas is not None:
+        database.configure_database(pragmas=_replacing(pragmas))
+    try:
+        database.init_database()
+        yield database.DATABASE
+    finally:
+        database.close_db_pool()
+        database.DATABASE = saved[0]
+        database.configure_database(pragmas=_replacing(saved[1]))
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _replacing(pragmas: Dict) -> Dict:
+    """Overrides for configure_database that turn the default pragmas into exactly `pragmas`."""
+    overrides = {name: None for name in database.SQLITE_PRAGMAS if name not in pragmas}
+    overrides.update(pragmas)
+    return overrides
+
+
+def seed_books(count: int, copies: int = 3):
+    """Insert `count` synthetic books in a single transaction."""
+    conn = database.get_db_connection()
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', ((f'Book {i}', f'Author {i % 1000}', f'{i:013d}', copies, copies) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def seed_loans(count: int, books: int, patrons: int, start: int = 0, open_every: int = 40):
+    """
+    Insert `count` synthetic borrow records spread over `patrons` patrons and `books` books.
+
+    Loans are dated one minute apart going back from now; every `open_every`-th loan
+    is still open, the rest have been returned. `start` offsets the sequence so that
+    repeated calls keep extending the same history.
+    """
+    now = datetime.now()
+
+    def rows():
+        for i in range(start, start + count):
+            borrowed = now - timedelta(minutes=i)
+            due = borrowed + timedelta(days=14)
+            returned = None if i % open_every == 0 else (borrowed + timedelta(days=7)).isoformat()
+            yield (f'{i % patrons:06d}', i % books + 1, borrowed.isoformat(), due.isoformat(), returned)
+
+    conn = database.get_db_connection()
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows())
+    conn.commit()
+    conn.close()
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency statistics, in milliseconds, for a list of call durations in seconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'calls': 0}
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        'calls': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+        'ops_per_second': len(ordered) / sum(ordered) if sum(ordered) else 0.0,
+    }
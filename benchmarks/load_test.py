@@ -0,0 +1,222 @@
+"""
+HTTP load test of one create_app instance.
+
+Seeds a temporary library, serves create_app on a local port with werkzeug's
+threaded server, and drives it from concurrent clients with a mix of borrows,
+returns, searches and API searches. Reports throughput and p50/p95/p99 latency per
+request type and overall:
+
+    python -m benchmarks.load_test --concurrency 16 --duration 30
+    python -m benchmarks.load_test --mix borrow=1,return=1,search=4,api_search=4 --output load.json
+
+Clients do not follow the redirect after a borrow, so each timing covers one request.
+Whether a borrow went through is read from the message flashed into the session cookie
+of that redirect; a return renders its page directly, so its outcome is read from the
+flashed message in the page. Refused borrows and returns are reported as failures per
+request type, and only loans that were actually made are returned later.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app
+from benchmarks.common import temporary_database, seed_books, seed_loans, summarize
+
+DEFAULT_MIX = 'borrow=2,return=2,search=3,api_search=3'
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def parse_mix(mix: str) -> Tuple[List[str], List[float]]:
+    """Parse 'borrow=2,search=3' into request types and weights."""
+    kinds, weights = [], []
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('borrow', 'return', 'search', 'api_search'):
+            raise ValueError(f'Unknown request type in mix: {kind!r}')
+        kinds.append(kind)
+        weights.append(float(weight or 1))
+    return kinds, weights
+
+
+class Client(threading.Thread):
+    """One simulated user sending requests back to back until the deadline."""
+
+    def __init__(self, base_url: str, seed: int, args, deadline: float, app):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.session_cookie = app.config['SESSION_COOKIE_NAME']
+        self.session_serializer = app.session_interface.get_signing_serializer(app)
+        self.rng = random.Random(seed)
+        self.args = args
+        self.deadline = deadline
+        self.kinds, self.weights = parse_mix(args.mix)
+        self.opener = urllib.request.build_opener(_NoRedirect)
+        self.borrowed = []  # (patron_id, book_id) this client may return
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)  # transport errors and HTTP 4xx/5xx
+        self.failures = defaultdict(int)  # borrows and returns the library refused
+
+    def _patron(self) -> str:
+        return f'{self.rng.randrange(self.args.patrons):06d}'
+
+    def _search_term(self) -> Tuple[str, str]:
+        book = self.rng.randrange(self.args.books)
+        return self.rng.choice([(f'Book {book}', 'title'), (f'Author {book % 1000}', 'author'),
+                                (f'{book:013d}', 'isbn')])
+
+    def _request(self, kind: str) -> Tuple[str, urllib.request.Request, Optional[Tuple[str, int]]]:
+        """Build the next request; borrows and returns also give the (patron_id, book_id) loan."""
+        if kind == 'return' and not self.borrowed:
+            kind = 'borrow'
+        if kind == 'borrow':
+            loan = (self._patron(), self.rng.randrange(1, self.args.books + 1))
+            return kind, urllib.request.Request(
+                self.base_url + '/borrow', method='POST',
+                data=urllib.parse.urlencode({'patron_id': loan[0], 'book_id': loan[1]}).encode()), loan
+        if kind == 'return':
+            loan = self.borrowed.pop(self.rng.randrange(len(self.borrowed)))
+            return kind, urllib.request.Request(
+                self.base_url + '/return', method='POST',
+                data=urllib.parse.urlencode({'patron_id': loan[0], 'book_id': loan[1]}).encode()), loan
+        term, search_type = self._search_term()
+        query = {'q': term, 'type': search_type}
+        if kind == 'api_search':
+            query['limit'] = 20
+            return kind, urllib.request.Request(
+                self.base_url + '/api/search?' + urllib.parse.urlencode(query)), None
+        return kind, urllib.request.Request(self.base_url + '/search?' + urllib.parse.urlencode(query)), None
+
+    def _refused(self, headers, body: bytes) -> bool:
+        """True if the response flashed an error, i.e. the borrow or return did not happen."""
+        if b'class="flash-' in body:
+            return b'class="flash-error"' in body  # a rendered page (return)
+        for cookie in headers.get_all('Set-Cookie') or []:  # a redirect (borrow)
+            name, _, value = cookie.partition(';')[0].partition('=')
+            if name == self.session_cookie:
+                flashes = self.session_serializer.loads(value).get('_flashes', [])
+                return any(category == 'error' for category, _ in flashes)
+        return True  # no flash at all: the request never reached the service
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            kind, request, loan = self._request(self.rng.choices(self.kinds, self.weights)[0])
+            start = time.perf_counter()
+            headers = body = None
+            try:
+                with self.opener.open(request, timeout=30) as response:
+                    headers, body = response.headers, response.read()
+            except urllib.error.HTTPError as e:
+                body = e.read()
+                if e.code >= 400:
+                    self.errors[kind] += 1
+                else:
+                    headers = e.headers  # the redirect after a borrow
+            except OSError:
+                self.errors[kind] += 1
+            self.samples[kind].append(time.perf_counter() - start)
+
+            if loan is not None and headers is not None:
+                if self._refused(headers, body):
+                    self.failures[kind] += 1
+                elif kind == 'borrow':
+                    self.borrowed.append(loan)
+
+
+def run_load(base_url: str, args, app) -> Dict:
+    """Run the clients against base_url (serving `app`) and summarize what they measured."""
+    start = time.monotonic()
+    clients = [Client(base_url, args.seed + n, args, start + args.duration, app)
+               for n in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - start
+
+    samples, errors, failures = defaultdict(list), defaultdict(int), defaultdict(int)
+    for client in clients:
+        for kind, durations in client.samples.items():
+            samples[kind] += durations
+            samples['all'] += durations
+        for kind, count in client.errors.items():
+            errors[kind] += count
+            errors['all'] += count
+        for kind, count in client.failures.items():
+            failures[kind] += count
+            failures['all'] += count
+
+    report = {'concurrency': args.concurrency, 'duration_seconds': elapsed, 'requests': {}}
+    for kind in sorted(samples, key=lambda kind: kind == 'all'):
+        stats = summarize(samples[kind])
+        stats['errors'] = errors[kind]
+        stats['failures'] = failures[kind]
+        stats['requests_per_second'] = len(samples[kind]) / elapsed
+        report['requests'][kind] = stats
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--patrons', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=20000, help='loan history seeded before the run')
+    parser.add_argument('--concurrency', type=int, default=8, help='simultaneous clients')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to generate load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='request types and their relative weights')
+    parser.add_argument('--pool-size', type=int, help='DATABASE_POOL_SIZE for the app (default: concurrency)')
+    parser.add_argument('--no-metrics', action='store_true', help='run the app with METRICS_ENABLED = False')
+    parser.add_argument('--seed', type=int, default=327)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with temporary_database():
+        seed_books(args.books, copies=5)
+        seed_loans(args.loans, args.books, args.patrons)
+        app = create_app({'DATABASE_POOL_SIZE': args.pool_size or args.concurrency,
+                          'METRICS_ENABLED': not args.no_metrics})
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            report = run_load(f'http://127.0.0.1:{server.server_port}', args, app)
+        finally:
+            server.shutdown()
+            thread.join()
+
+    for kind, stats in report['requests'].items():
+        if not stats['calls']:
+            continue
+        print(f"{kind:<11} {stats['calls']:>7} requests  {stats['requests_per_second']:8.1f} req/s  "
+              f"p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  "
+              f"{stats['errors']} errors  {stats['failures']} refused")
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Command-line maintenance tasks, run through the Flask CLI, e.g.
+
+    flask --app app sweep-overdue-fees
+"""
+
+import csv
+
+import click
+
+from database import EXPORT_DATASETS, rebuild_patron_loan_counters
+from services.fee_service import sweep_overdue_fees
+from services.batch_payment_service import create_late_fee_batch, run_late_fee_batch
+from services.export_service import EXPORT_FORMATS, export_dataset
+from services.import_service import (
+    IMPORT_FORMATS, IMPORT_CHUNK_SIZE, detect_import_format, import_catalog_feed
+)
+
+
+@click.command('sweep-overdue-fees')
+@click.option('--chunk-size', default=10000, show_default=True, help='Open loans fetched per query.')
+def sweep_overdue_fees_command(chunk_size):
+    """Compute outstanding late fees for every open loan and store per-patron totals."""
+    result = sweep_overdue_fees(chunk_size=chunk_size)
+    click.echo(f"Swept {result['loans']} overdue loans for {result['patrons']} patrons: "
+               f"${result['total_late_fees']:.2f} outstanding as of {result['as_of']}.")
+
+
+@click.command('collect-late-fees')
+@click.option('--batch-id', type=int, help='Resume an existing batch instead of creating a new one.')
+@click.option('--workers', default=4, show_default=True, help='Charges submitted in parallel.')
+@click.option('--rate', default=10.0, show_default=True, help='Maximum charges per second.')
+def collect_late_fees_command(batch_id, workers, rate):
+    """Charge every patron's outstanding late fees, one payment per patron."""
+    if batch_id is None:
+        success, message, batch_id = create_late_fee_batch()
+        click.echo(message)
+        if not success:
+            raise click.exceptions.Exit(1)
+    
+    success, message, _ = run_late_fee_batch(batch_id, workers=workers, rate_limit=rate)
+    click.echo(message)
+    if not success:
+        raise click.exceptions.Exit(1)
+
+
+@click.command('rebuild-loan-counters')
+def rebuild_loan_counters_command():
+    """Recompute every patron's open-loan counter from the borrow records."""
+    fixed = rebuild_patron_loan_counters()
+    if fixed is None:
+        click.echo("Could not rebuild open-loan counters: database error.")
+        raise click.exceptions.Exit(1)
+    click.echo(f"Rebuilt open-loan counters; {fixed} patrons were out of step.")
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+              help='Feed format; guessed from the file extension if omitted.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Books inserted per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write every rejected row (line, isbn, reason) to this CSV file.')
+def import_books_command(path, fmt, chunk_size, rejects):
+    """Bulk-import books from a CSV or JSONL feed."""
+    fmt = fmt or detect_import_format(path)
+    if fmt is None:
+        raise click.BadParameter("cannot guess the format from the file name; pass --format",
+                                 param_hint='--format')
+    
+    with open(path, encoding='utf-8-sig', newline='') as feed:
+        try:
+            report = import_catalog_feed(feed, fmt, chunk_size, max_rejects=None if rejects else 20)
+        except RuntimeError as e:
+            click.echo(str(e))
+            raise click.exceptions.Exit(1)
+    
+    click.echo(f"Imported {report['imported']} of {report['rows']} rows; "
+               f"{report['rejected_count']} rejected.")
+    if rejects:
+        with open(rejects, 'w', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=['line', 'isbn', 'reason'])
+            writer.writeheader()
+            writer.writerows(report['rejected'])
+    else:
+        for row in report['rejected']:
+            click.echo(f"  line {row['line']}: {row['reason']}")
+
+
+@click.command('export-data')
+@click.argument('dataset', type=click.Choice(list(EXPORT_DATASETS)))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--since', default=0, show_default=True,
+              help='Only export rows inserted or changed after this watermark (from the previous run).')
+@click.option('--patron-id', help="Only export this patron's loans.")
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Output file (default: stdout).')
+def export_data_command(dataset, fmt, since, patron_id, output):
+    """Stream books, borrow_records or patron_history to CSV, NDJSON or columnar JSON."""
+    try:
+        stats = export_dataset(output, dataset, fmt, since, patron_id)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    click.echo(f"Exported {stats['rows']} rows; next --since {stats['watermark']}.", err=True)
+
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app."""
+    app.cli.add_command(sweep_overdue_fees_command)
+    app.cli.add_command(collect_late_fees_command)
+    app.cli.add_command(rebuild_loan_counters_command)
+    app.cli.add_command(import_books_command)
+    app.cli.add_command(export_data_command)
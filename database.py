@@ -3,143 +3,851 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import base64
+import calendar
+import inspect
+import json
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from records import Book, Loan
 
 # Database configuration
 DATABASE = 'library.db'
 
+# Connection pool configuration
+POOL_SIZE = 5
+HEALTH_CHECK_INTERVAL = 30.0  # seconds a connection may sit idle before it is re-checked
+
+# Default pragmas applied to every new connection. WAL lets catalog readers keep reading
+# while borrow/return writers commit; busy_timeout makes writers wait for each other
+# instead of failing with "database is locked". Order matters: busy_timeout is set first.
+# Read-only: overrides are passed to configure_database and merged in per pool.
+SQLITE_PRAGMAS = MappingProxyType({
+    'busy_timeout': 5000,       # milliseconds
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',    # safe with WAL; only the last commits may be lost on power loss
+    'mmap_size': 268435456,     # 256 MiB of the file memory-mapped for reads
+    'cache_size': -16000,       # negative means KiB, i.e. ~16 MiB page cache per connection
+})
+
+# Book lookup cache configuration (a size of 0 turns the cache off)
+BOOK_CACHE_SIZE = 1024
+BOOK_CACHE_TTL = 60.0  # seconds a cached book may be served without re-reading it
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that hands itself back to its pool on close().
+
+    The helpers below all follow the pattern get_db_connection() ... conn.close(),
+    so overriding close() lets them reuse connections without any changes. The
+    close() is always in a finally block: a connection that is never handed back
+    keeps its pool slot taken for good.
+    """
+
+    pool = None
+    last_used = 0.0
+    checked_out = False
+
+    def close(self):
+        """Return the connection to its pool, or really close it if it is not pooled."""
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def execute(self, sql, parameters=()):
+        """Execute one statement, recording its duration (see metrics.py)."""
+        if not metrics.ENABLED:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        """Execute a statement for every parameter set, recording the total duration."""
+        if not metrics.ENABLED:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def dispose(self):
+        """Close the underlying sqlite3 connection."""
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of sqlite3 connections to a single database file.
+
+    Up to `size` connections are kept open and reused. If every pooled connection is
+    checked out, an overflow connection is handed out instead and closed when released,
+    so callers never block (and nested helper calls cannot deadlock).
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, pragmas: Optional[Dict] = None):
+        self.database = database
+        self.size = size
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+
+    def _connect(self, pooled: bool) -> PooledConnection:
+        conn = sqlite3.connect(self.database, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        apply_pragmas(conn, self.pragmas)
+        conn.pool = self if pooled else None
+        return conn
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: PooledConnection):
+        with self._lock:
+            self._open -= 1
+        try:
+            conn.dispose()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self) -> PooledConnection:
+        """Check a connection out of the pool, opening a new one if needed."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(conn):
+                conn.checked_out = True
+                return conn
+            self._discard(conn)
+
+        with self._lock:
+            pooled = not self._closed and self._open < self.size
+            if pooled:
+                self._open += 1
+        conn = self._connect(pooled)
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn: PooledConnection):
+        """Give a connection back to the pool, rolling back anything left uncommitted."""
+        if not conn.checked_out:
+            return  # already released; never queue the same connection twice
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+            return
+
+        conn.last_used = time.monotonic()
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection; connections still checked out close on release."""
+        self._closed = True
+        optimized = False
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not optimized:
+                # Refresh planner statistics so the loan indexes keep being chosen
+                try:
+                    conn.execute('PRAGMA optimize').fetchall()
+                except sqlite3.Error:
+                    pass
+                optimized = True
+            self._discard(conn)
+
+    def stats(self) -> Dict:
+        """Return the number of open and idle pooled connections."""
+        return {'size': self.size, 'open': self._open, 'idle': self._idle.qsize()}
+
+
+class BookCache:
+    """
+    Bounded LRU cache with a TTL for get_book_by_id / get_book_by_isbn.
+
+    Entries are keyed by book id with a secondary ISBN index. Helpers that change a
+    book call invalidate(); a lookup that raced with such a write is not stored,
+    because the write bumps the cache generation while the lookup is in flight.
+    Misses are not cached. Books are read-only records, so a hit returns the cached
+    instance itself rather than a copy.
+    """
+
+    def __init__(self, size: int = BOOK_CACHE_SIZE, ttl: float = BOOK_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._books = OrderedDict()  # book id -> (expires_at, book)
+        self._isbns = {}             # isbn -> book id
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _get(self, book_id) -> Optional[Book]:
+        entry = self._books.get(book_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(book_id)
+            return None
+        self._books.move_to_end(book_id)
+        return entry[1]
+
+    def _drop(self, book_id):
+        _, book = self._books.pop(book_id)
+        self._isbns.pop(book['isbn'], None)
+
+    def get(self, book_id=None, isbn=None) -> Optional[Book]:
+        """Return the cached book, or None (counted as a miss)."""
+        with self._lock:
+            if isbn is not None:
+                book_id = self._isbns.get(isbn)
+            book = self._get(book_id) if book_id is not None else None
+            if book is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return book
+
+    def put(self, book: Book, generation: int):
+        """Store a book read while the cache was at the given generation."""
+        with self._lock:
+            if not self.enabled or generation != self.generation:
+                return
+            if book['id'] in self._books:
+                self._drop(book['id'])
+            self._books[book['id']] = (time.monotonic() + self.ttl, book)
+            self._isbns[book['isbn']] = book['id']
+            while len(self._books) > self.size:
+                self._drop(next(iter(self._books)))
+
+    def invalidate(self, book_id: Optional[int] = None, isbn: Optional[str] = None):
+        """Forget a book (by id and/or ISBN)."""
+        with self._lock:
+            self.generation += 1
+            if isbn is not None and book_id is None:
+                book_id = self._isbns.get(isbn)
+            if book_id in self._books:
+                self._drop(book_id)
+
+    def clear(self):
+        """Forget every cached book."""
+        with self._lock:
+            self.generation += 1
+            self._books.clear()
+            self._isbns.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the number of cached books."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': self.size, 'cached': len(self._books), 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pragma_overrides: Dict = {}
+_book_cache = BookCache()
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: Dict):
+    """Apply PRAGMA settings to a connection."""
+    for name, value in pragmas.items():
+        if not name.isidentifier():
+            raise ValueError(f'Invalid pragma name: {name!r}')
+        if not isinstance(value, (int, float)) and not str(value).isidentifier():
+            raise ValueError(f'Invalid value for pragma {name}: {value!r}')
+        conn.execute(f'PRAGMA {name} = {value}').fetchall()
+
+def get_sqlite_pragmas() -> Dict:
+    """Return the pragmas new connections get: SQLITE_PRAGMAS with the configured overrides."""
+    pragmas = dict(SQLITE_PRAGMAS)
+    for name, value in _pragma_overrides.items():
+        if value is None:
+            pragmas.pop(name, None)
+        else:
+            pragmas[name] = value
+    return pragmas
+
+def get_pool() -> ConnectionPool:
+    """Get the shared connection pool, (re)creating it if DATABASE has changed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE:
+            if _pool is not None:
+                _pool.close()
+            _book_cache.clear()
+            _pool = ConnectionPool(DATABASE, POOL_SIZE, get_sqlite_pragmas())
+        return _pool
+
+def configure_database(pool_size: Optional[int] = None, pragmas: Optional[Dict] = None,
+                       book_cache_size: Optional[int] = None, book_cache_ttl: Optional[float] = None):
+    """
+    Apply storage settings; the pool is rebuilt on the next connection request.
+
+    Args:
+        pool_size: Number of connections kept open in the pool
+        pragmas: PRAGMA overrides applied on top of SQLITE_PRAGMAS (a value of None removes
+                 one); they replace any earlier overrides, so {} restores the defaults
+        book_cache_size: Maximum number of books in the lookup cache (0 turns it off)
+        book_cache_ttl: Seconds a cached book is served before it is read again
+    """
+    global POOL_SIZE, _pragma_overrides
+    if pool_size is not None:
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+        POOL_SIZE = pool_size
+    if book_cache_size is not None:
+        if book_cache_size < 0:
+            raise ValueError('book_cache_size must not be negative')
+        _book_cache.size = book_cache_size
+    if book_cache_ttl is not None:
+        _book_cache.ttl = book_cache_ttl
+    if pragmas is not None:
+        _pragma_overrides = dict(pragmas)
+    close_db_pool()
+
+def close_db_pool():
+    """Close all pooled connections. Registered as a shutdown hook by create_app."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    _book_cache.clear()
+
+def get_book_cache_stats() -> Dict:
+    """Return hit/miss statistics for the book lookup cache."""
+    return _book_cache.stats()
+
+def clear_book_cache():
+    """Drop every cached book, e.g. after changing the books table directly."""
+    _book_cache.clear()
+
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+    """Get a database connection from the shared pool. Call close() to hand it back."""
+    return get_pool().acquire()
 
 def init_database():
     """Initialize the database with required tables."""
     conn = get_db_connection()
-    
-    # Create books table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT UNIQUE NOT NULL,
-            total_copies INTEGER NOT NULL,
-            available_copies INTEGER NOT NULL
-        )
-    ''')
-    
-    # Create borrow_records table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patron_id TEXT NOT NULL,
-            book_id INTEGER NOT NULL,
-            borrow_date TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            return_date TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    try:
+        # Create books table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                isbn TEXT UNIQUE NOT NULL,
+                total_copies INTEGER NOT NULL,
+                available_copies INTEGER NOT NULL
+            )
+        ''')
+        
+        # Create borrow_records table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS borrow_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                borrow_date TEXT NOT NULL,
+                due_date TEXT NOT NULL,
+                return_date TEXT,
+                FOREIGN KEY (book_id) REFERENCES books (id)
+            )
+        ''')
+        
+        conn.commit()
+        
+        # Bring the schema up to date (indexes, later tables and columns)
+        apply_migrations(conn)
+    finally:
+        conn.close()
+
+# Versioned schema migrations, applied in order on top of the base tables above.
+# The current version is stored in PRAGMA user_version, so each migration runs once per
+# database file. Append new migrations to the end; never edit or reorder released ones.
+# A step is either an SQL statement or a callable taking the connection.
+MIGRATIONS = [
+    # 1: indexes for per-patron loan lookups (borrow count, open loans, returns, history).
+    #    Until ANALYZE has run, SQLite breaks ties between indexes by creation order, so
+    #    the partial open-loan index is created last to be preferred for open-loan queries.
+    [
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_history
+           ON borrow_records (patron_id, borrow_date)''',
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_open_loans
+           ON borrow_records (patron_id, book_id) WHERE return_date IS NULL''',
+    ],
+    # 2: full-text index over book titles and authors, kept in sync by triggers
+    [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+               title, author, content='books', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2')''',
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+               INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+               INSERT INTO books_fts (books_fts, rowid, title, author)
+               VALUES ('delete', old.id, old.title, old.author);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+               INSERT INTO books_fts (books_fts, rowid, title, author)
+               VALUES ('delete', old.id, old.title, old.author);
+               INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+           END''',
+        "INSERT INTO books_fts (books_fts) VALUES ('rebuild')",
+    ],
+    # 3: index backing keyset pagination of the catalog in (title, id) order
+    [
+        'CREATE INDEX IF NOT EXISTS idx_books_title_id ON books (title, id)',
+    ],
+    # 4: per-patron outstanding late fees, rebuilt by the nightly overdue sweep
+    [
+        '''CREATE TABLE IF NOT EXISTS patron_fee_summary (
+               patron_id TEXT PRIMARY KEY,
+               overdue_loans INTEGER NOT NULL,
+               total_late_fees REAL NOT NULL,
+               swept_at TEXT NOT NULL
+           )''',
+    ],
+    # 5: end-of-day fee collection batches, one item (charge) per patron
+    [
+        '''CREATE TABLE IF NOT EXISTS payment_batches (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               created_at TEXT NOT NULL,
+               status TEXT NOT NULL DEFAULT 'open'
+           )''',
+        '''CREATE TABLE IF NOT EXISTS payment_batch_items (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               batch_id INTEGER NOT NULL,
+               patron_id TEXT NOT NULL,
+               amount REAL NOT NULL,
+               loan_count INTEGER NOT NULL,
+               status TEXT NOT NULL DEFAULT 'pending',
+               transaction_id TEXT,
+               message TEXT,
+               attempts INTEGER NOT NULL DEFAULT 0,
+               updated_at TEXT,
+               UNIQUE (batch_id, patron_id),
+               FOREIGN KEY (batch_id) REFERENCES payment_batches (id)
+           )''',
+        '''CREATE INDEX IF NOT EXISTS idx_payment_batch_items_status
+           ON payment_batch_items (batch_id, status)''',
+    ],
+    # 6: local ledger of gateway charges and refunds, keyed by idempotency key
+    [
+        '''CREATE TABLE IF NOT EXISTS payments (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               idempotency_key TEXT UNIQUE NOT NULL,
+               kind TEXT NOT NULL,
+               patron_id TEXT,
+               book_id INTEGER,
+               amount REAL NOT NULL,
+               status TEXT NOT NULL DEFAULT 'pending',
+               transaction_id TEXT,
+               message TEXT,
+               gateway_status TEXT,
+               created_at TEXT NOT NULL,
+               updated_at TEXT NOT NULL
+           )''',
+        '''CREATE INDEX IF NOT EXISTS idx_payments_transaction_id
+           ON payments (transaction_id) WHERE transaction_id IS NOT NULL''',
+    ],
+    # 7: per-patron open-loan counter, kept in step with borrow_records by triggers so
+    # the borrowing-limit check is a primary-key lookup instead of a COUNT(*)
+    [
+        '''CREATE TABLE IF NOT EXISTS patrons (
+               patron_id TEXT PRIMARY KEY,
+               open_loans INTEGER NOT NULL DEFAULT 0
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS borrow_records_open_loans_ai
+           AFTER INSERT ON borrow_records WHEN new.return_date IS NULL BEGIN
+               INSERT OR IGNORE INTO patrons (patron_id) VALUES (new.patron_id);
+               UPDATE patrons SET open_loans = open_loans + 1 WHERE patron_id = new.patron_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS borrow_records_open_loans_ad
+           AFTER DELETE ON borrow_records WHEN old.return_date IS NULL BEGIN
+               UPDATE patrons SET open_loans = open_loans - 1 WHERE patron_id = old.patron_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS borrow_records_open_loans_au
+           AFTER UPDATE OF patron_id, return_date ON borrow_records BEGIN
+               UPDATE patrons SET open_loans = open_loans - 1
+               WHERE patron_id = old.patron_id AND old.return_date IS NULL;
+               INSERT OR IGNORE INTO patrons (patron_id)
+               SELECT new.patron_id WHERE new.return_date IS NULL;
+               UPDATE patrons SET open_loans = open_loans + 1
+               WHERE patron_id = new.patron_id AND new.return_date IS NULL;
+           END''',
+        lambda conn: rebuild_open_loan_counters(conn),
+    ],
+    # 8: extend the open-loan index with borrow_date, so a return finds the patron's
+    #    oldest open loan of a book without scanning the patron's whole history
+    [
+        'DROP INDEX IF EXISTS idx_borrow_records_open_loans',
+        '''CREATE INDEX idx_borrow_records_open_loans
+           ON borrow_records (patron_id, book_id, borrow_date) WHERE return_date IS NULL''',
+    ],
+    # 9: integer epoch-second twins of the loan timestamps (see to_epoch), generated from
+    #    the ISO text columns so existing rows and writers need no changes, and an index
+    #    on the due time of open loans so overdue loans are an indexed range query
+    [
+        '''ALTER TABLE borrow_records ADD COLUMN borrow_ts INTEGER
+           GENERATED ALWAYS AS (CAST(strftime('%s', borrow_date) AS INTEGER)) VIRTUAL''',
+        '''ALTER TABLE borrow_records ADD COLUMN due_ts INTEGER
+           GENERATED ALWAYS AS (CAST(strftime('%s', due_date) AS INTEGER)) VIRTUAL''',
+        '''ALTER TABLE borrow_records ADD COLUMN return_ts INTEGER
+           GENERATED ALWAYS AS (CAST(strftime('%s', return_date) AS INTEGER)) VIRTUAL''',
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_overdue
+           ON borrow_records (due_ts) WHERE return_date IS NULL''',
+    ],
+    # 10: the loans (and the fee on each) that a batch item charged for, so the next
+    #     batch only bills the part of a loan's late fee that has not been billed yet
+    [
+        '''CREATE TABLE IF NOT EXISTS payment_batch_item_loans (
+            item_id INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (item_id, loan_id),
+            FOREIGN KEY (item_id) REFERENCES payment_batch_items (id),
+            FOREIGN KEY (loan_id) REFERENCES borrow_records (id)
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_payment_batch_item_loans_loan
+           ON payment_batch_item_loans (loan_id)''',
+    ],
+    # 11: a per-table change sequence on books and borrow_records, bumped by trigger on
+    #     every insert and update, so incremental exports also pick up rows that changed
+    #     after they were first exported (a returned loan, a book's copy counts)
+    [
+        'ALTER TABLE books ADD COLUMN change_seq INTEGER',
+        'UPDATE books SET change_seq = id',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_books_change_seq ON books (change_seq)',
+        '''CREATE TRIGGER IF NOT EXISTS books_change_seq_ai AFTER INSERT ON books BEGIN
+               UPDATE books SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM books)
+               WHERE id = new.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS books_change_seq_au
+           AFTER UPDATE OF title, author, isbn, total_copies, available_copies ON books BEGIN
+               UPDATE books SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM books)
+               WHERE id = new.id;
+           END''',
+        'ALTER TABLE borrow_records ADD COLUMN change_seq INTEGER',
+        'UPDATE borrow_records SET change_seq = id',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_borrow_records_change_seq ON borrow_records (change_seq)',
+        '''CREATE TRIGGER IF NOT EXISTS borrow_records_change_seq_ai AFTER INSERT ON borrow_records BEGIN
+               UPDATE borrow_records SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM borrow_records)
+               WHERE id = new.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS borrow_records_change_seq_au
+           AFTER UPDATE OF patron_id, book_id, borrow_date, due_date, return_date ON borrow_records BEGIN
+               UPDATE borrow_records SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM borrow_records)
+               WHERE id = new.id;
+           END''',
+    ],
+    # 12: the loan a late fee charge pays for, so a loan's fee is charged once in total
+    #     however many times (and on however many days) the patron pays it
+    [
+        'ALTER TABLE payments ADD COLUMN loan_id INTEGER REFERENCES borrow_records (id)',
+        '''CREATE INDEX IF NOT EXISTS idx_payments_loan
+           ON payments (loan_id) WHERE loan_id IS NOT NULL''',
+    ],
+    # 13: one record of how much of each loan's late fee has been billed, by a payment
+    #     at the desk (pay_late_fees) or by a collection batch, so each path subtracts
+    #     what the other already charged. Charges that may have taken the money count:
+    #     desk charges unless declined or errored before sending, batch items unless declined.
+    [
+        '''CREATE VIEW IF NOT EXISTS late_fee_billings (loan_id, amount) AS
+               SELECT loan_id, amount FROM payments
+               WHERE kind = 'charge' AND loan_id IS NOT NULL AND status NOT IN ('failed', 'error')
+               UNION ALL
+               SELECT l.loan_id, l.amount FROM payment_batch_item_loans l
+               JOIN payment_batch_items i ON i.id = l.item_id
+               WHERE i.status != 'declined' ''',
+    ],
+]
+
+SECONDS_PER_DAY = 86400
+
+# SQL predicate for loans that are open and overdue at an epoch time (bind to_epoch(as_of));
+# it matches the partial idx_borrow_records_overdue index
+OVERDUE_LOAN_PREDICATE = 'return_date IS NULL AND due_ts < ?'
+
+def to_epoch(value: datetime) -> int:
+    """
+    Convert a (naive) timestamp to whole seconds since 1970-01-01, the unit of the
+    borrow_ts, due_ts and return_ts columns.
+    """
+    return calendar.timegm(value.timetuple())
+
+def from_epoch(seconds: int) -> datetime:
+    """Convert epoch seconds from a *_ts column back to a naive datetime."""
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the migration version of the database the connection points at."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Apply any pending MIGRATIONS, each in its own transaction. Returns the new version."""
+    version = get_schema_version(conn)
+    for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= number:
+                conn.rollback()  # another process migrated in the meantime
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
 
 def add_sample_data():
     """Add sample data to the database if it's empty."""
     conn = get_db_connection()
-    book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-    
-    if book_count == 0:
-        # Add sample books
-        sample_books = [
-            ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
-            ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
-            ('1984', 'George Orwell', '9780451524935', 1)
-        ]
+    try:
+        book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
         
-        for title, author, isbn, copies in sample_books:
+        if book_count == 0:
+            # Add sample books
+            sample_books = [
+                ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
+                ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
+                ('1984', 'George Orwell', '9780451524935', 1)
+            ]
+            
+            for title, author, isbn, copies in sample_books:
+                conn.execute('''
+                    INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (title, author, isbn, copies, copies))
+            
+            # Make 1984 unavailable by adding a borrow record
             conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
-        
-        # Make 1984 unavailable by adding a borrow record
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', ('123456', 3, 
-              (datetime.now() - timedelta(days=5)).isoformat(),
-              (datetime.now() + timedelta(days=9)).isoformat()))
-        
-        # Update available copies for 1984
-        conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
-        
-        conn.commit()
-    
-    conn.close()
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', ('123456', 3, 
+                  (datetime.now() - timedelta(days=5)).isoformat(),
+                  (datetime.now() + timedelta(days=9)).isoformat()))
+            
+            # Update available copies for 1984
+            conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
+            
+            conn.commit()
+            _book_cache.clear()
+    finally:
+        conn.close()
 
 # Helper Functions for Database Operations
 
-def get_all_books() -> List[Dict]:
+# Columns of the books table in Book field order, for queries read into Book records
+BOOK_COLUMNS = ', '.join(Book.__slots__)
+
+# Loan columns read by the patron loan and history helpers. Only the stored text dates
+# are selected: each is parsed once, and the generated *_ts columns (one strftime call
+# each per row) are left to the queries that filter or page on them.
+LOAN_COLUMNS = 'br.book_id, b.title, b.author, br.borrow_date, br.due_date, br.return_date'
+
+def _fetch_books(cursor: sqlite3.Cursor) -> List[Book]:
+    """Read the rows of a query selecting BOOK_COLUMNS straight into Book records."""
+    cursor.row_factory = Book.from_sqlite
+    return cursor.fetchall()
+
+def get_all_books() -> List[Book]:
     """Get all books from the database."""
     conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    conn.close()
-    return [dict(book) for book in books]
+    try:
+        books = _fetch_books(conn.execute(f'SELECT {BOOK_COLUMNS} FROM books ORDER BY title'))
+    finally:
+        conn.close()
+    return books
 
-def get_book_by_id(book_id: int) -> Optional[Dict]:
-    """Get a specific book by ID."""
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last row on a page as an opaque, URL-safe cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> List:
+    """Decode a cursor made by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor.') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor.')
+    return values
+
+def get_books_page(cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Book], Optional[str]]:
+    """
+    Get one page of the catalog in (title, id) order using keyset pagination.
+    
+    Returns:
+        tuple: (books, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    if cursor:
+        after_title, after_id = decode_cursor(cursor)
+        if not isinstance(after_title, str) or not isinstance(after_id, int):
+            raise ValueError('Invalid cursor.')
+    
     conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    try:
+        if cursor:
+            books = _fetch_books(conn.execute(f'''
+                SELECT {BOOK_COLUMNS} FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT ?
+            ''', (after_title, after_id, limit + 1)))
+        else:
+            books = _fetch_books(conn.execute(f'SELECT {BOOK_COLUMNS} FROM books ORDER BY title, id LIMIT ?',
+                                              (limit + 1,)))
+    finally:
+        conn.close()
+    
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_cursor(books[-1].title, books[-1].id)
+    return books, next_cursor
 
-def get_book_by_isbn(isbn: str) -> Optional[Dict]:
-    """Get a specific book by ISBN."""
+def _cached_book(query: str, key, **lookup) -> Optional[Book]:
+    """Serve a book from the lookup cache, reading (and caching) it on a miss."""
+    if _book_cache.enabled:
+        book = _book_cache.get(**lookup)
+        if book is not None:
+            return book
+    generation = _book_cache.generation
     conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    try:
+        books = _fetch_books(conn.execute(query, (key,)))
+    finally:
+        conn.close()
+    if not books:
+        return None
+    _book_cache.put(books[0], generation)
+    return books[0]
+
+def get_book_by_id(book_id: int) -> Optional[Book]:
+    """Get a specific book by ID."""
+    return _cached_book(f'SELECT {BOOK_COLUMNS} FROM books WHERE id = ?', book_id, book_id=book_id)
 
-def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
+def get_book_by_isbn(isbn: str) -> Optional[Book]:
+    """Get a specific book by ISBN."""
+    return _cached_book(f'SELECT {BOOK_COLUMNS} FROM books WHERE isbn = ?', isbn, isbn=isbn)
+
+def _loan_record(record: sqlite3.Row, now: datetime) -> Loan:
+    """Build a Loan from a row selected with LOAN_COLUMNS; overdue means due before `now`."""
+    due_date = datetime.fromisoformat(record['due_date'])
+    return Loan(record['book_id'], record['title'], record['author'],
+                datetime.fromisoformat(record['borrow_date']), due_date,
+                datetime.fromisoformat(record['return_date']) if record['return_date'] else None,
+                now > due_date)
+
+def get_patron_borrowed_books(patron_id: str) -> List[Loan]:
     """Get currently borrowed books for a patron."""
     conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.return_date IS NULL
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
-    
-    borrowed_books = []
-    for record in records:
-        borrowed_books.append({
-            'book_id': record['book_id'],
-            'title': record['title'],
-            'author': record['author'],
-            'borrow_date': datetime.fromisoformat(record['borrow_date']),
-            'due_date': datetime.fromisoformat(record['due_date']),
-            'is_overdue': datetime.now() > datetime.fromisoformat(record['due_date'])
-        })
-    
-    return borrowed_books
+    try:
+        records = conn.execute(f'''
+            SELECT {LOAN_COLUMNS} 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? AND br.return_date IS NULL
+            ORDER BY br.borrow_date
+        ''', (patron_id,)).fetchall()
+    finally:
+        conn.close()
+    
+    now = datetime.now()
+    return [_loan_record(record, now) for record in records]
+
+def _open_loan_count(conn: sqlite3.Connection, patron_id: str) -> int:
+    row = conn.execute('SELECT open_loans FROM patrons WHERE patron_id = ?', (patron_id,)).fetchone()
+    return row['open_loans'] if row else 0
 
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
     conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
-    conn.close()
+    try:
+        count = _open_loan_count(conn, patron_id)
+    finally:
+        conn.close()
     return count
 
+def rebuild_open_loan_counters(conn: sqlite3.Connection) -> int:
+    """
+    Recompute every patron's open-loan counter from borrow_records on the given
+    connection (inside the caller's transaction). Returns the number of corrected patrons.
+    """
+    conn.execute('''
+        INSERT OR IGNORE INTO patrons (patron_id) 
+        SELECT DISTINCT patron_id FROM borrow_records WHERE return_date IS NULL
+    ''')
+    return conn.execute('''
+        UPDATE patrons SET open_loans = (
+            SELECT COUNT(*) FROM borrow_records br 
+            WHERE br.patron_id = patrons.patron_id AND br.return_date IS NULL
+        )
+        WHERE open_loans != (
+            SELECT COUNT(*) FROM borrow_records br 
+            WHERE br.patron_id = patrons.patron_id AND br.return_date IS NULL
+        )
+    ''').rowcount
+
+def rebuild_patron_loan_counters() -> Optional[int]:
+    """Repair the open-loan counters from borrow_records. Returns the number of corrected patrons, or None on error."""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        fixed = rebuild_open_loan_counters(conn)
+        conn.commit()
+        return fixed
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
     conn = get_db_connection()
@@ -150,11 +858,52 @@ def insert_book(title: str, author: str, isbn: str, total_copies: int, available
         ''', (title, author, isbn, total_copies, available_copies))
         conn.commit()
         conn.close()
+        _book_cache.invalidate(isbn=isbn)
         return True
     except Exception as e:
         conn.close()
         return False
 
+# SQLite's default limit on bound parameters is 999; stay below it for IN (...) lists
+MAX_QUERY_PARAMS = 900
+
+def find_existing_isbns(conn: sqlite3.Connection, isbns: List[str]) -> set:
+    """Return which of the given ISBNs are already in the catalog, using the unique ISBN index."""
+    existing = set()
+    for start in range(0, len(isbns), MAX_QUERY_PARAMS):
+        batch = isbns[start:start + MAX_QUERY_PARAMS]
+        placeholders = ', '.join('?' * len(batch))
+        existing.update(row['isbn'] for row in conn.execute(
+            f'SELECT isbn FROM books WHERE isbn IN ({placeholders})', batch))
+    return existing
+
+def import_books(books: List[Tuple[str, str, str, int]]) -> Optional[Tuple[int, List[str]]]:
+    """
+    Insert a chunk of (title, author, isbn, total_copies) rows in one transaction,
+    skipping ISBNs that are already in the catalog.
+
+    Returns:
+        tuple: (number of books inserted, ISBNs skipped as duplicates), or None on error
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        existing = find_existing_isbns(conn, [isbn for _, _, isbn, _ in books])
+        new_books = [(title, author, isbn, copies, copies)
+                     for title, author, isbn, copies in books if isbn not in existing]
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', new_books)
+        conn.commit()
+        _book_cache.clear()
+        return len(new_books), [isbn for _, _, isbn, _ in books if isbn in existing]
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
     conn = get_db_connection()
@@ -179,6 +928,7 @@ def update_book_availability(book_id: int, change: int) -> bool:
         ''', (change, book_id))
         conn.commit()
         conn.close()
+        _book_cache.invalidate(book_id)
         return True
     except Exception as e:
         conn.close()
@@ -200,27 +950,743 @@ def update_borrow_record_return_date(patron_id: str, book_id: int, return_date:
         conn.close()
         return False
 
-def get_patron_history(patron_id: str) -> List[Dict]:
+def build_fts_query(search_term: str, column: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching every word as a prefix within one column,
+    e.g. ('great gat', 'title') -> 'title : "great"* AND title : "gat"*'.
+    Returns None if the text contains no searchable words.
+    """
+    words = re.findall(r'\w+', search_term.lower())
+    if not words:
+        return None
+    return ' AND '.join(f'{column} : "{word}"*' for word in words)
+
+def _search_query(search_term: str, field: str) -> Optional[Tuple[str, Tuple]]:
+    """Build the SQL for a book search, or None if the term cannot match anything."""
+    if field == 'isbn':
+        term = search_term.strip()
+        if not term:
+            return None
+        # Range scan on the unique index: every ISBN that starts with the term
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        return f'SELECT {BOOK_COLUMNS} FROM books WHERE isbn >= ? AND isbn < ? ORDER BY isbn', (term, upper)
+    
+    if field in ('title', 'author'):
+        query = build_fts_query(search_term, field)
+        if query is None:
+            return None
+        return '''
+            SELECT b.id, b.title, b.author, b.isbn, b.total_copies, b.available_copies FROM books_fts 
+            JOIN books b ON b.id = books_fts.rowid 
+            WHERE books_fts MATCH ? 
+            ORDER BY bm25(books_fts), b.title, b.id
+        ''', (query,)
+    
+    raise ValueError(f'Unknown search field: {field!r}')
+
+def iter_search_books(search_term: str, field: str, limit: Optional[int] = None, offset: int = 0,
+                      batch_size: int = 500) -> Iterator[Book]:
+    """
+    Lazily yield search results (see search_books), fetching `batch_size` rows at a time
+    so memory stays bounded however many books match. The connection is held until the
+    generator is exhausted or closed.
+    """
+    search = _search_query(search_term, field)
+    if search is None:
+        return
+    sql, params = search
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql + ' LIMIT ? OFFSET ?',
+                              params + (-1 if limit is None else limit, offset))
+        cursor.row_factory = Book.from_sqlite
+        while True:
+            books = cursor.fetchmany(batch_size)
+            if not books:
+                break
+            yield from books
+    finally:
+        conn.close()
+
+def search_books(search_term: str, field: str, limit: Optional[int] = None, offset: int = 0) -> List[Book]:
+    """
+    Search books by title or author through the full-text index, best matches first,
+    or by ISBN (exact or prefix) through the unique ISBN index.
+    """
+    return list(iter_search_books(search_term, field, limit, offset))
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+                            max_borrowed: int) -> Tuple[str, Optional[Book]]:
+    """
+    Borrow a book in one BEGIN IMMEDIATE transaction: check availability and the patron's
+    borrowing limit, take a copy and insert the borrow record.
+
+    Returns:
+        tuple: (status, book) where status is 'borrowed', 'not_found', 'unavailable',
+               'limit_reached' or 'error'
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        books = _fetch_books(conn.execute(f'SELECT {BOOK_COLUMNS} FROM books WHERE id = ?', (book_id,)))
+        if not books:
+            conn.rollback()
+            return 'not_found', None
+        book = books[0]
+        if book.available_copies <= 0:
+            conn.rollback()
+            return 'unavailable', book
+        
+        if _open_loan_count(conn, patron_id) >= max_borrowed:
+            conn.rollback()
+            return 'limit_reached', book
+        
+        # Conditional update so a copy can never be taken twice
+        taken = conn.execute('''
+            UPDATE books SET available_copies = available_copies - 1 
+            WHERE id = ? AND available_copies > 0
+        ''', (book_id,)).rowcount
+        if not taken:
+            conn.rollback()
+            return 'unavailable', book
+        
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+            VALUES (?, ?, ?, ?)
+        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+        conn.commit()
+        _book_cache.invalidate(book_id)
+        return 'borrowed', book
+    except sqlite3.Error:
+        conn.rollback()
+        return 'error', None
+    finally:
+        conn.close()
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[Dict]]:
+    """
+    Return a book in one BEGIN IMMEDIATE transaction: close the patron's open loan
+    and give the copy back.
+
+    Returns:
+        tuple: (status, loan) where status is 'returned', 'not_borrowed' or 'error' and
+               loan is the closed borrow record
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        loan = conn.execute('''
+            SELECT * FROM borrow_records 
+            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ORDER BY borrow_date LIMIT 1
+        ''', (patron_id, book_id)).fetchone()
+        if not loan:
+            conn.rollback()
+            return 'not_borrowed', None
+        
+        conn.execute('UPDATE borrow_records SET return_date = ? WHERE id = ?',
+                     (return_date.isoformat(), loan['id']))
+        conn.execute('''
+            UPDATE books SET available_copies = available_copies + 1 
+            WHERE id = ? AND available_copies < total_copies
+        ''', (book_id,))
+        conn.commit()
+        _book_cache.invalidate(book_id)
+        
+        loan = dict(loan)
+        loan['return_date'] = return_date.isoformat()
+        return 'returned', loan
+    except sqlite3.Error:
+        conn.rollback()
+        return 'error', None
+    finally:
+        conn.close()
+
+def get_patron_history(patron_id: str) -> List[Loan]:
     """Get all borrowed books from patron"""
     conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
+    try:
+        records = conn.execute(f'''
+            SELECT {LOAN_COLUMNS} 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ?
+            ORDER BY br.borrow_date
+        ''', (patron_id,)).fetchall()
+    finally:
+        conn.close()
+    
+    now = datetime.now()
+    return [_loan_record(record, now) for record in records]
+
+def get_patron_history_page(patron_id: str, cursor: Optional[str] = None,
+                            limit: int = 20) -> Tuple[List[Loan], Optional[str]]:
+    """
+    Get one page of a patron's loans, oldest first, using keyset pagination on
+    (borrow_date, id) so every page is a short range scan of the patron history index.
+
+    Returns:
+        tuple: (loans, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    params = [patron_id]
+    keyset = ''
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        if not isinstance(after_date, str) or not isinstance(after_id, int):
+            raise ValueError('Invalid cursor.')
+        keyset = 'AND (br.borrow_date, br.id) > (?, ?)'
+        params += [after_date, after_id]
+    
+    conn = get_db_connection()
+    try:
+        records = conn.execute(f'''
+            SELECT br.id, {LOAN_COLUMNS} 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? {keyset}
+            ORDER BY br.borrow_date, br.id
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+    finally:
+        conn.close()
+    
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1]['borrow_date'], records[-1]['id'])
+    now = datetime.now()
+    return [_loan_record(record, now) for record in records], next_cursor
+
+def iter_patron_history(patron_id: str, batch_size: int = 500) -> Iterator[Loan]:
+    """
+    Lazily yield a patron's loans, oldest first, fetching `batch_size` rows at a time.
+    The connection is held until the generator is exhausted or closed.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(f'''
+            SELECT {LOAN_COLUMNS} 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ?
+            ORDER BY br.borrow_date, br.id
+        ''', (patron_id,))
+        now = datetime.now()
+        while True:
+            records = cursor.fetchmany(batch_size)
+            if not records:
+                break
+            for record in records:
+                yield _loan_record(record, now)
+    finally:
+        conn.close()
+
+def count_patron_loans_by_year(patron_id: str) -> Dict[int, int]:
+    """Count a patron's loans per borrow year, from the patron history index alone."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT CAST(substr(borrow_date, 1, 4) AS INTEGER) AS year, COUNT(*) AS loans 
+            FROM borrow_records 
+            WHERE patron_id = ?
+            GROUP BY year ORDER BY year
+        ''', (patron_id,)).fetchall()
+    finally:
+        conn.close()
+    return {row['year']: row['loans'] for row in rows}
+
+def count_patron_overdue_days(patron_id: str, as_of: datetime) -> List[Tuple[int, int]]:
+    """
+    Group a patron's late loans by days overdue: returned loans count the days between
+    due and return date, open loans the days between due date and `as_of`.
+
+    Returns:
+        list: (days_overdue, number of loans) for every loan at least one day late
+    """
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT (COALESCE(return_ts, ?) - due_ts) / ? AS days, COUNT(*) AS loans 
+            FROM borrow_records 
+            WHERE patron_id = ?
+            GROUP BY days HAVING days > 0
+        ''', (to_epoch(as_of), SECONDS_PER_DAY, patron_id)).fetchall()
+    finally:
+        conn.close()
+    return [(row['days'], row['loans']) for row in rows]
+
+# Export datasets: (columns, query). Every dataset ends with the change_seq of its base
+# row (aliased as r), which is the incremental export watermark: it grows on every
+# insert and update, so a row is exported again after it changes. patron_history
+# follows borrow_records changes only; renaming a book does not re-export its loans.
+EXPORT_DATASETS = {
+    'books': (
+        ['id', 'title', 'author', 'isbn', 'total_copies', 'available_copies', 'change_seq'],
+        'SELECT r.id, r.title, r.author, r.isbn, r.total_copies, r.available_copies, r.change_seq FROM books r'
+    ),
+    'borrow_records': (
+        ['id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'change_seq'],
+        '''SELECT r.id, r.patron_id, r.book_id, r.borrow_date, r.due_date, r.return_date, r.change_seq 
+           FROM borrow_records r'''
+    ),
+    'patron_history': (
+        ['id', 'patron_id', 'book_id', 'title', 'author', 'borrow_date', 'due_date', 'return_date', 'change_seq'],
+        '''SELECT r.id, r.patron_id, r.book_id, b.title, b.author, r.borrow_date, r.due_date, r.return_date, 
+                  r.change_seq 
+           FROM borrow_records r JOIN books b ON r.book_id = b.id'''
+    ),
+}
+
+def iter_export_rows(dataset: str, since: int = 0, patron_id: Optional[str] = None,
+                     batch_size: int = 1000) -> Iterator[Tuple]:
+    """
+    Lazily yield the rows of an export dataset that were inserted or changed after the
+    change sequence `since`, in change_seq order.
+
+    Rows are tuples in EXPORT_DATASETS column order, fetched `batch_size` at a time from
+    one cursor, so memory stays constant and the export reads a single consistent
+    snapshot. The connection is held until the generator is exhausted or closed.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f'Unknown export dataset: {dataset!r}')
+    columns, sql = EXPORT_DATASETS[dataset]
+    sql += ' WHERE r.change_seq > ?'
+    params = [since]
+    if patron_id is not None:
+        if 'patron_id' not in columns:
+            raise ValueError(f'Dataset {dataset!r} cannot be filtered by patron')
+        sql += ' AND r.patron_id = ?'
+        params.append(patron_id)
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql + ' ORDER BY r.change_seq', params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        conn.close()
+
+def iter_overdue_loan_chunks(as_of: datetime, chunk_size: int = 10000) -> Iterator[List[Tuple[int, str, int]]]:
+    """
+    Stream every open loan that is overdue at `as_of` in chunks of (loan_id, patron_id, days_overdue),
+    walking the overdue index in (due_ts, id) order so each chunk is a fresh keyset
+    range query that never touches returned or not-yet-due loans.
+    """
+    as_of_ts = to_epoch(as_of)
+    conn = get_db_connection()
+    try:
+        last_due, last_id = -1 << 62, 0
+        while True:
+            rows = conn.execute(f'''
+                SELECT id, patron_id, due_ts, (? - due_ts) / ? AS days_overdue
+                FROM borrow_records 
+                WHERE {OVERDUE_LOAN_PREDICATE} AND (due_ts, id) > (?, ?)
+                ORDER BY due_ts, id LIMIT ?
+            ''', (as_of_ts, SECONDS_PER_DAY, as_of_ts, last_due, last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            last_due, last_id = rows[-1]['due_ts'], rows[-1]['id']
+            yield [(row['id'], row['patron_id'], row['days_overdue']) for row in rows]
+    finally:
+        conn.close()
+
+def get_overdue_loans_page(as_of: datetime, min_days: int = 0, max_days: Optional[int] = None,
+                           cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Get one page of open loans that are overdue at `as_of`, most overdue first.
+
+    The days-overdue filter is turned into a due_ts range, so the page is a keyset
+    range scan of the partial idx_borrow_records_overdue index.
+
+    Args:
+        as_of: Time the loans are overdue at
+        min_days: Only loans at least this many whole days overdue (0 = any overdue loan)
+        max_days: Only loans at most this many whole days overdue
+        cursor: `next_cursor` from the previous page
+        limit: Loans per page
+
+    Returns:
+        tuple: (loans, next_cursor) where each loan has id, patron_id, book_id, title,
+               borrow_date, due_date and days_overdue
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    as_of_ts = to_epoch(as_of)
+    sql = f'''
+        SELECT br.id, br.patron_id, br.book_id, b.title, br.borrow_date, br.due_date, br.due_ts, 
+               (? - br.due_ts) / ? AS days_overdue
         FROM borrow_records br 
         JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ?
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
-    
-    borrowed_books = []
-    for record in records:
-        borrowed_books.append({
-            'book_id': record['book_id'],
-            'title': record['title'],
-            'author': record['author'],
-            'borrow_date': datetime.fromisoformat(record['borrow_date']),
-            'due_date': datetime.fromisoformat(record['due_date']),
-            'is_overdue': datetime.now() > datetime.fromisoformat(record['due_date'])
-        })
-    
-    return borrowed_books
\ No newline at end of file
+        WHERE br.{OVERDUE_LOAN_PREDICATE}
+    '''
+    params = [as_of_ts, SECONDS_PER_DAY, as_of_ts]
+    if min_days > 0:
+        sql += ' AND br.due_ts <= ?'
+        params.append(as_of_ts - min_days * SECONDS_PER_DAY)
+    if max_days is not None:
+        sql += ' AND br.due_ts > ?'
+        params.append(as_of_ts - (max_days + 1) * SECONDS_PER_DAY)
+    if cursor:
+        after_due, after_id = decode_cursor(cursor)
+        if not isinstance(after_due, int) or not isinstance(after_id, int):
+            raise ValueError('Invalid cursor.')
+        sql += ' AND (br.due_ts, br.id) > (?, ?)'
+        params += [after_due, after_id]
+    
+    conn = get_db_connection()
+    try:
+        records = conn.execute(sql + ' ORDER BY br.due_ts, br.id LIMIT ?', params + [limit + 1]).fetchall()
+    finally:
+        conn.close()
+    
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1]['due_ts'], records[-1]['id'])
+    
+    return [{
+        'id': record['id'],
+        'patron_id': record['patron_id'],
+        'book_id': record['book_id'],
+        'title': record['title'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'days_overdue': record['days_overdue'],
+    } for record in records], next_cursor
+
+def replace_patron_fee_summary(totals: Dict[str, Tuple[int, float]], swept_at: datetime) -> bool:
+    """Replace the contents of patron_fee_summary with {patron_id: (overdue_loans, total_late_fees)}."""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM patron_fee_summary')
+        conn.executemany('''
+            INSERT INTO patron_fee_summary (patron_id, overdue_loans, total_late_fees, swept_at)
+            VALUES (?, ?, ?, ?)
+        ''', ((patron_id, loans, round(total, 2), swept_at.isoformat())
+              for patron_id, (loans, total) in totals.items()))
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def get_patron_fee_summary(patron_id: str) -> Optional[Dict]:
+    """Get a patron's outstanding late fees as of the last overdue sweep."""
+    conn = get_db_connection()
+    try:
+        summary = conn.execute('SELECT * FROM patron_fee_summary WHERE patron_id = ?', (patron_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(summary) if summary else None
+
+
+def create_payment_batch(charges: Dict[str, Dict[int, float]], created_at: datetime) -> Optional[int]:
+    """
+    Create a fee collection batch with one pending item per patron, recording the
+    loans each item charges for.
+    
+    Args:
+        charges: {patron_id: {loan_id: amount}}
+        
+    Returns:
+        The new batch ID, or None on a database error
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        batch_id = conn.execute('INSERT INTO payment_batches (created_at) VALUES (?)',
+                                (created_at.isoformat(),)).lastrowid
+        for patron_id, loans in charges.items():
+            item_id = conn.execute('''
+                INSERT INTO payment_batch_items (batch_id, patron_id, loan_count, amount, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (batch_id, patron_id, len(loans), round(sum(loans.values()), 2),
+                  created_at.isoformat())).lastrowid
+            conn.executemany('INSERT INTO payment_batch_item_loans (item_id, loan_id, amount) VALUES (?, ?, ?)',
+                             ((item_id, loan_id, round(amount, 2)) for loan_id, amount in loans.items()))
+        conn.commit()
+        return batch_id
+    except sqlite3.Error:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+def get_billed_late_fees() -> Dict[int, float]:
+    """
+    Get how much of each open loan's late fee has already been billed, at the desk or
+    by earlier batches (see the late_fee_billings view).
+    
+    Returns:
+        dict: {loan_id: amount billed}
+    """
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT f.loan_id, SUM(f.amount) AS amount
+            FROM late_fee_billings f
+            JOIN borrow_records br ON br.id = f.loan_id
+            WHERE br.return_date IS NULL
+            GROUP BY f.loan_id
+        ''').fetchall()
+    finally:
+        conn.close()
+    return {row['loan_id']: row['amount'] for row in rows}
+
+def get_billed_late_fee(loan_id: int) -> float:
+    """Get how much of one loan's late fee has already been billed, at the desk or by a batch."""
+    conn = get_db_connection()
+    try:
+        billed = conn.execute('SELECT TOTAL(amount) FROM late_fee_billings WHERE loan_id = ?',
+                              (loan_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    return round(billed, 2)
+
+def get_payment_batch(batch_id: int) -> Optional[Dict]:
+    """Get a batch with the number of its items in each status."""
+    conn = get_db_connection()
+    try:
+        batch = conn.execute('SELECT * FROM payment_batches WHERE id = ?', (batch_id,)).fetchone()
+        if not batch:
+            return None
+        counts = conn.execute('''
+            SELECT status, COUNT(*) as count, SUM(amount) as amount FROM payment_batch_items 
+            WHERE batch_id = ? GROUP BY status
+        ''', (batch_id,)).fetchall()
+    finally:
+        conn.close()
+    batch = dict(batch)
+    batch['items'] = {row['status']: row['count'] for row in counts}
+    batch['amounts'] = {row['status']: round(row['amount'], 2) for row in counts}
+    return batch
+
+def get_payment_batch_items(batch_id: int, statuses: Optional[List[str]] = None) -> List[Dict]:
+    """Get a batch's items, optionally only those in the given statuses."""
+    conn = get_db_connection()
+    try:
+        if statuses:
+            items = conn.execute(f'''
+                SELECT * FROM payment_batch_items 
+                WHERE batch_id = ? AND status IN ({', '.join('?' * len(statuses))})
+                ORDER BY id
+            ''', (batch_id, *statuses)).fetchall()
+        else:
+            items = conn.execute('SELECT * FROM payment_batch_items WHERE batch_id = ? ORDER BY id',
+                                 (batch_id,)).fetchall()
+    finally:
+        conn.close()
+    return [dict(item) for item in items]
+
+def claim_payment_batch_item(item_id: int, claimable: List[str], now: datetime) -> bool:
+    """Move an item to 'submitting' if it is still in a claimable status. Returns True if claimed."""
+    conn = get_db_connection()
+    try:
+        claimed = conn.execute(f'''
+            UPDATE payment_batch_items 
+            SET status = 'submitting', attempts = attempts + 1, updated_at = ? 
+            WHERE id = ? AND status IN ({', '.join('?' * len(claimable))})
+        ''', (now.isoformat(), item_id, *claimable)).rowcount
+        conn.commit()
+        return claimed == 1
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def update_payment_batch_item(item_id: int, status: str, transaction_id: Optional[str], message: str,
+                              now: datetime) -> bool:
+    """Record the outcome of a batch item."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE payment_batch_items 
+            SET status = ?, transaction_id = ?, message = ?, updated_at = ? 
+            WHERE id = ?
+        ''', (status, transaction_id, message, now.isoformat(), item_id))
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def mark_stale_payment_batch_items(batch_id: int, before: datetime, status: str) -> int:
+    """Move items stuck in 'submitting' since before `before` (e.g. after a crash) to `status`."""
+    conn = get_db_connection()
+    try:
+        count = conn.execute('''
+            UPDATE payment_batch_items 
+            SET status = ?, message = 'Interrupted while submitting; outcome unknown.' 
+            WHERE batch_id = ? AND status = 'submitting' AND updated_at < ?
+        ''', (status, batch_id, before.isoformat())).rowcount
+        conn.commit()
+        return count
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+def update_payment_batch_status(batch_id: int, status: str) -> bool:
+    """Set the status of a batch."""
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE payment_batches SET status = ? WHERE id = ?', (status, batch_id))
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+
+def insert_payment(idempotency_key: str, kind: str, patron_id: Optional[str], book_id: Optional[int],
+                   loan_id: Optional[int], amount: float, now: datetime) -> bool:
+    """Record a new pending payment. Returns False if the idempotency key is already used."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT INTO payments (idempotency_key, kind, patron_id, book_id, loan_id, amount, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (idempotency_key, kind, patron_id, book_id, loan_id, amount, now.isoformat(), now.isoformat()))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+def get_open_loan(patron_id: str, book_id: int) -> Optional[Dict]:
+    """Get the id and borrow date of a patron's open loan of a book, through the open-loan index."""
+    conn = get_db_connection()
+    try:
+        loan = conn.execute('''
+            SELECT id, borrow_date FROM borrow_records 
+            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ORDER BY borrow_date LIMIT 1
+        ''', (patron_id, book_id)).fetchone()
+    finally:
+        conn.close()
+    return dict(loan) if loan else None
+
+def get_payment_by_key(idempotency_key: str) -> Optional[Dict]:
+    """Get a ledger entry by idempotency key."""
+    conn = get_db_connection()
+    try:
+        payment = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+    finally:
+        conn.close()
+    return dict(payment) if payment else None
+
+def get_loan_charges(loan_id: int) -> List[Dict]:
+    """Get the ledger entries of every late fee charge made for a loan, oldest first."""
+    conn = get_db_connection()
+    try:
+        charges = conn.execute('''
+            SELECT * FROM payments WHERE loan_id = ? AND kind = 'charge' ORDER BY id
+        ''', (loan_id,)).fetchall()
+    finally:
+        conn.close()
+    return [dict(charge) for charge in charges]
+
+def get_payment_by_transaction(transaction_id: str) -> Optional[Dict]:
+    """Get the ledger entry of a gateway charge by its transaction ID."""
+    conn = get_db_connection()
+    try:
+        payment = conn.execute('''
+            SELECT * FROM payments WHERE transaction_id = ? AND kind = 'charge'
+        ''', (transaction_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(payment) if payment else None
+
+def reclaim_payment(idempotency_key: str, retryable: List[str], stale_before: datetime, now: datetime) -> bool:
+    """
+    Move a payment back to 'pending' so it can be retried, if it is in a retryable status
+    or has been pending since before `stale_before`. Returns True if it was reclaimed.
+    """
+    conn = get_db_connection()
+    try:
+        reclaimed = conn.execute(f'''
+            UPDATE payments SET status = 'pending', updated_at = ? 
+            WHERE idempotency_key = ? 
+              AND (status IN ({', '.join('?' * len(retryable))}) OR (status = 'pending' AND updated_at < ?))
+        ''', (now.isoformat(), idempotency_key, *retryable, stale_before.isoformat())).rowcount
+        conn.commit()
+        return reclaimed == 1
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def update_payment(idempotency_key: str, status: str, transaction_id: Optional[str], message: str,
+                   now: datetime, gateway_status: Optional[str] = None) -> bool:
+    """Record the outcome of a payment."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE payments 
+            SET status = ?, transaction_id = ?, message = ?, updated_at = ?, 
+                gateway_status = COALESCE(?, gateway_status) 
+            WHERE idempotency_key = ?
+        ''', (status, transaction_id, message, now.isoformat(), gateway_status, idempotency_key))
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+def update_payment_gateway_status(transaction_id: str, gateway_status: str, now: datetime) -> bool:
+    """Cache the gateway's status document for a charge."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE payments SET gateway_status = ?, updated_at = ? 
+            WHERE transaction_id = ? AND kind = 'charge'
+        ''', (gateway_status, now.isoformat(), transaction_id))
+        conn.commit()
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+
+# Instrumentation: time and count every data-access helper above (see metrics.py).
+# Pool and schema plumbing is left out; the SQL it runs is still timed per statement.
+_UNTIMED_HELPERS = {
+    'apply_pragmas', 'get_sqlite_pragmas', 'get_pool', 'configure_database', 'close_db_pool', 'get_book_cache_stats',
+    'clear_book_cache', 'get_db_connection', 'get_schema_version', 'encode_cursor', 'decode_cursor',
+    'build_fts_query', 'to_epoch', 'from_epoch',
+}
+
+for _name, _helper in list(globals().items()):
+    if (inspect.isfunction(_helper) and _helper.__module__ == __name__
+            and not _name.startswith('_') and _name not in _UNTIMED_HELPERS):
+        globals()[_name] = metrics.timed(metrics.DB_HELPER_SECONDS, helper=_name)(_helper)
+
+def _storage_gauges():
+    pool = _pool
+    if pool is not None:
+        stats = pool.stats()
+        yield 'library_db_pool_open_connections', 'gauge', 'Connections currently open in the pool.', stats['open']
+        yield 'library_db_pool_idle_connections', 'gauge', 'Idle connections waiting in the pool.', stats['idle']
+    cache = _book_cache.stats()
+    yield 'library_book_cache_hits_total', 'counter', 'Book lookups served from the cache.', cache['hits']
+    yield 'library_book_cache_misses_total', 'counter', 'Book lookups that went to the database.', cache['misses']
+    yield 'library_book_cache_entries', 'gauge', 'Books currently cached.', cache['cached']
+
+metrics.register_collector(_storage_gauges)
@@ -0,0 +1,194 @@
+"""
+Metrics module for the Library Management System
+In-process latency histograms and gauges, rendered in the Prometheus text format
+"""
+
+import functools
+import inspect
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Set to False (or METRICS_ENABLED = False in the app config) to skip all timing
+ENABLED = True
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histograms of the application
+HTTP_REQUEST_SECONDS = 'library_http_request_duration_seconds'
+DB_HELPER_SECONDS = 'library_db_helper_duration_seconds'
+DB_QUERY_SECONDS = 'library_db_query_duration_seconds'
+GATEWAY_CALL_SECONDS = 'library_gateway_call_duration_seconds'
+
+
+class Histogram:
+    """Cumulative latency histogram with one series per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {}  # sorted label items -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += seconds
+            series[-1] += 1
+
+    def series(self) -> Dict[Tuple, Dict]:
+        """Return {labels: {'count', 'sum', 'buckets': [(le, cumulative count)]}}."""
+        with self._lock:
+            snapshot = {key: list(values) for key, values in self._series.items()}
+        result = {}
+        for key, values in snapshot.items():
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            result[key] = {'count': values[-1], 'sum': values[-2], 'buckets': buckets}
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, data in sorted(self.series().items()):
+            for bound, count in data['buckets']:
+                lines.append(f'{self.name}_bucket{_labels(key, le=_number(bound))} {count}')
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {data["count"]}')
+            lines.append(f'{self.name}_sum{_labels(key)} {_number(data["sum"])}')
+            lines.append(f'{self.name}_count{_labels(key)} {data["count"]}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(key: Tuple, **extra) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+
+HISTOGRAMS = {
+    HTTP_REQUEST_SECONDS: Histogram(HTTP_REQUEST_SECONDS, 'Time spent handling HTTP requests.'),
+    DB_HELPER_SECONDS: Histogram(DB_HELPER_SECONDS, 'Time spent in database.py helper functions.'),
+    DB_QUERY_SECONDS: Histogram(DB_QUERY_SECONDS, 'Time spent executing SQL statements.'),
+    GATEWAY_CALL_SECONDS: Histogram(GATEWAY_CALL_SECONDS, 'Time spent in payment gateway calls.'),
+}
+
+# Callables returning (name, type, help, value) samples, collected when metrics are rendered
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record one observation in the named histogram."""
+    if ENABLED:
+        HISTOGRAMS[name].observe(seconds, **labels)
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, float]]]):
+    """
+    Register a callable reporting (name, type, help, value) samples at render time,
+    where type is 'gauge' or 'counter'.
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def render_prometheus() -> str:
+    """Render every histogram and gauge in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        for name, kind, help_text, value in collector():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {_number(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear all recorded observations."""
+    for histogram in HISTOGRAMS.values():
+        histogram.reset()
+
+
+def timed(name: str, **labels):
+    """
+    Decorator recording the call duration of a function in the named histogram,
+    with an `outcome` label of 'ok' or 'error' (the function raised). Generator
+    functions are timed from the first to the last item pulled from them.
+
+    Args:
+        name: Histogram name, e.g. DB_HELPER_SECONDS
+        labels: Fixed labels for every observation, e.g. helper='get_book_by_id'
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    yield from func(*args, **kwargs)
+                    return
+                start, outcome = time.perf_counter(), 'error'
+                try:
+                    yield from func(*args, **kwargs)
+                    outcome = 'ok'
+                except GeneratorExit:
+                    outcome = 'ok'  # the caller stopped early
+                    raise
+                finally:
+                    observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start, outcome = time.perf_counter(), 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+        return wrapper
+    return decorator
+
+
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def statement_label(sql: str) -> str:
+    """Reduce an SQL statement to a low-cardinality label such as 'SELECT books'."""
+    words = sql.split(None, 2)
+    if not words:
+        return 'OTHER'
+    verb = words[0].upper()
+    if verb == 'PRAGMA' and len(words) > 1:
+        return 'PRAGMA ' + re.match(r'\w*', words[1]).group()
+    table = _TABLE_RE.search(sql)
+    return f'{verb} {table.group(1)}' if table else verb
+
+
+def observe_query(sql: str, seconds: float):
+    """Record the execution time of one SQL statement."""
+    observe(DB_QUERY_SECONDS, seconds, statement=statement_label(sql))
@@ -0,0 +1,87 @@
+"""
+Records module for the Library Management System
+Compact, read-only row types for books and loans that still read like dicts
+"""
+
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class Record(Mapping):
+    """
+    Base class for rows kept in __slots__ instead of a per-row dict.
+
+    Subclasses list their columns in __slots__. A record supports record.title as well
+    as record['title'], .get(), `in`, iteration over its column names and dict(record),
+    and compares equal to a dict with the same items, so templates and callers written
+    for dict rows keep working. Records are immutable, since cached records are shared
+    between callers; use to_dict() for a mutable copy.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} records are read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} records are read-only')
+
+    def __reduce__(self):
+        # rebuild through __init__, so copy, deepcopy and pickle never set attributes
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+    def to_dict(self) -> Dict:
+        """Return the record as a plain (mutable) dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_sqlite(cls, cursor, row: tuple):
+        """sqlite3 row factory building a record from columns selected in __slots__ order."""
+        return cls(*row)
+
+
+class Book(Record):
+    """One row of the books table."""
+    __slots__ = ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies')
+
+    def __init__(self, id: int, title: str, author: str, isbn: str, total_copies: int,
+                 available_copies: int):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'title', title)
+        object.__setattr__(self, 'author', author)
+        object.__setattr__(self, 'isbn', isbn)
+        object.__setattr__(self, 'total_copies', total_copies)
+        object.__setattr__(self, 'available_copies', available_copies)
+
+
+class Loan(Record):
+    """A borrow record joined with its book's title and author; return_date is None while open."""
+    __slots__ = ('book_id', 'title', 'author', 'borrow_date', 'due_date', 'return_date', 'is_overdue')
+
+    def __init__(self, book_id: int, title: str, author: str, borrow_date: datetime, due_date: datetime,
+                 return_date: Optional[datetime], is_overdue: bool):
+        object.__setattr__(self, 'book_id', book_id)
+        object.__setattr__(self, 'title', title)
+        object.__setattr__(self, 'author', author)
+        object.__setattr__(self, 'borrow_date', borrow_date)
+        object.__setattr__(self, 'due_date', due_date)
+        object.__setattr__(self, 'return_date', return_date)
+        object.__setattr__(self, 'is_overdue', is_overdue)
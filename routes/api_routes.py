@@ -2,8 +2,20 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import io
+import json
+
+from flask import Blueprint, Response, jsonify, request
+from database import encode_cursor, decode_cursor
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog, iter_books_in_catalog,
+    get_patron_borrowing_history, get_patron_history_summary, get_overdue_loans,
+    HISTORY_PAGE_SIZE, OVERDUE_PAGE_SIZE
+)
+from services.export_service import EXPORT_MIMETYPES, iter_export
+from services.import_service import (
+    IMPORT_FORMATS, IMPORT_CHUNK_SIZE, detect_import_format, import_catalog_feed
+)
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -21,6 +33,12 @@ def search_books_api():
     """
     Search for books via API endpoint.
     Alternative API interface for R5: Book Search Functionality
+    
+    Query parameters:
+        q, type: search term and type (title, author or isbn)
+        limit, offset: return at most `limit` results starting at `offset`
+        cursor: continue from the `next_cursor` of a previous page
+        format: 'json' (default) or 'ndjson' to stream one book per line
     """
     search_term = request.args.get('q', '').strip()
     search_type = request.args.get('type', 'title')
@@ -28,12 +46,145 @@ def search_books_api():
     if not search_term:
         return jsonify({'error': 'Search term is required'}), 400
     
-    # Use business logic function
-    books = search_books_in_catalog(search_term, search_type)
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            offset, = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    if (limit is not None and limit < 1) or not isinstance(offset, int) or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset non-negative'}), 400
+    
+    if request.args.get('format', 'json') == 'ndjson':
+        books = iter_books_in_catalog(search_term, search_type, limit, offset)
+        if books is None:
+            return jsonify({'error': 'Unknown search type'}), 400
+        # Stream straight from the database cursor, one JSON document per line
+        return Response((json.dumps(dict(book)) + '\n' for book in books), mimetype='application/x-ndjson')
+    
+    # Use business logic function; fetch one extra row to know if there is a next page
+    books = search_books_in_catalog(search_term, search_type,
+                                    None if limit is None else limit + 1, offset)
+    if books is None:
+        return jsonify({'error': 'Unknown search type'}), 400
+    
+    next_cursor = None
+    if limit is not None and len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_cursor(offset + limit)
     
     return jsonify({
         'search_term': search_term,
         'search_type': search_type,
         'results': books,
-        'count': len(books)
+        'count': len(books),
+        'next_cursor': next_cursor
+    })
+
+@api_bp.route('/patron/<patron_id>/history')
+def patron_history_api(patron_id):
+    """
+    One page of a patron's borrowing history, oldest loan first.
+    
+    Query parameters:
+        limit: loans per page (default 20, at most 200)
+        cursor: continue from the `next_cursor` of a previous page
+    """
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    if limit < 1 or limit > 200:
+        return jsonify({'error': 'limit must be between 1 and 200'}), 400
+    
+    try:
+        page = get_patron_borrowing_history(patron_id, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    if page is None:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    
+    loans, next_cursor = page
+    return jsonify({'patron_id': patron_id, 'loans': loans, 'count': len(loans), 'next_cursor': next_cursor})
+
+@api_bp.route('/patron/<patron_id>/history/summary')
+def patron_history_summary_api(patron_id):
+    """Loans per year and lifetime late fees for a patron."""
+    summary = get_patron_history_summary(patron_id)
+    if summary is None:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    return jsonify(summary)
+
+@api_bp.route('/overdue')
+def overdue_loans_api():
+    """
+    List open overdue loans across the library, most overdue first.
+    
+    Query parameters:
+        min_days, max_days: only loans overdue by this many days
+        limit: loans per page (default 50, at most 500)
+        cursor: continue from the `next_cursor` of a previous page
+    """
+    min_days = request.args.get('min_days', 0, type=int)
+    max_days = request.args.get('max_days', type=int)
+    limit = request.args.get('limit', OVERDUE_PAGE_SIZE, type=int)
+    if limit < 1 or limit > 500:
+        return jsonify({'error': 'limit must be between 1 and 500'}), 400
+    
+    try:
+        loans, next_cursor = get_overdue_loans(min_days, max_days, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'loans': loans, 'count': len(loans), 'next_cursor': next_cursor})
+
+@api_bp.route('/books/import', methods=['POST'])
+def import_books_api():
+    """
+    Bulk-import books from a CSV or JSONL feed.
+    
+    The feed is either uploaded as the `file` form field or sent as the request body.
+    The format comes from the `format` query parameter, or else the uploaded file name.
+    Rows are validated like the add-book form; the response counts imported books and
+    lists rejected rows with their line number and reason.
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or detect_import_format(upload.filename if upload else '')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    
+    chunk_size = request.args.get('chunk_size', IMPORT_CHUNK_SIZE, type=int)
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be positive'}), 400
+    
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        report = import_catalog_feed(stream, fmt, chunk_size)
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Feed must be UTF-8 encoded'}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(report)
+
+@api_bp.route('/export/<dataset>')
+def export_api(dataset):
+    """
+    Stream an export of books, borrow_records or patron_history.
+    
+    Query parameters:
+        format: 'csv' (default), 'ndjson' or 'columnar'
+        since: only rows inserted or changed after this watermark (incremental export)
+        patron_id: only this patron's loans
+    """
+    fmt = request.args.get('format', 'csv')
+    since = request.args.get('since', 0, type=int)
+    try:
+        chunks = iter_export(dataset, fmt, since, request.args.get('patron_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    extension = 'csv' if fmt == 'csv' else 'jsonl'
+    return Response(chunks, mimetype=EXPORT_MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename={dataset}.{extension}'
     })
@@ -3,7 +3,9 @@ Borrowing Routes - Book borrowing and returning endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.library_service import (
+    borrow_book_by_patron, return_book_by_patron, get_overdue_loans, OVERDUE_PAGE_SIZE
+)
 
 borrowing_bp = Blueprint('borrowing', __name__)
 
@@ -49,3 +51,29 @@ def return_book():
     
     flash(message, 'success' if success else 'error')
     return render_template('return_book.html')
+
+@borrowing_bp.route('/overdue')
+def overdue_loans():
+    """
+    Display the open overdue loans, most overdue first, one page at a time.
+    
+    Query parameters: min_days and max_days (days-overdue range), cursor and limit.
+    """
+    min_days = max(request.args.get('min_days', 0, type=int), 0)
+    max_days = request.args.get('max_days', type=int)
+    cursor = request.args.get('cursor', '').strip() or None
+    limit = max(1, min(request.args.get('limit', OVERDUE_PAGE_SIZE, type=int), 500))
+    
+    if max_days is not None and max_days < min_days:
+        flash('Max days overdue cannot be less than min days overdue.', 'error')
+        max_days = None
+    
+    try:
+        loans, next_cursor = get_overdue_loans(min_days, max_days, cursor, limit)
+    except ValueError:
+        flash('Invalid page cursor; showing the first page.', 'error')
+        cursor = None
+        loans, next_cursor = get_overdue_loans(min_days, max_days, None, limit)
+    
+    return render_template('overdue.html', loans=loans, next_cursor=next_cursor, is_first_page=cursor is None,
+                           min_days=min_days, max_days=max_days, limit=limit)
@@ -3,11 +3,15 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
+from database import get_books_page
 from services.library_service import add_book_to_catalog
 
 catalog_bp = Blueprint('catalog', __name__)
 
+# Books shown per catalog page (clients may ask for up to MAX_PAGE_SIZE via ?limit=)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 @catalog_bp.route('/')
 def index():
     """Home page redirects to catalog."""
@@ -16,11 +20,24 @@ def index():
 @catalog_bp.route('/catalog')
 def catalog():
     """
-    Display all books in the catalog.
+    Display the catalog one page at a time, in title order.
     Implements R2: Book Catalog Display
+    
+    Query parameters: cursor (from the previous page's "Next" link) and limit.
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    cursor = request.args.get('cursor', '').strip() or None
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    try:
+        books, next_cursor = get_books_page(cursor, limit)
+    except ValueError:
+        flash('Invalid page cursor; showing the first page.', 'error')
+        cursor = None
+        books, next_cursor = get_books_page(None, limit)
+    
+    return render_template('catalog.html', books=books, next_cursor=next_cursor,
+                           is_first_page=cursor is None, limit=limit)
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
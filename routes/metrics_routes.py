@@ -0,0 +1,31 @@
+"""
+Metrics Routes - Request timing and the Prometheus /metrics endpoint
+"""
+
+import time
+
+from flask import Blueprint, Response, g, request
+
+import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    """Note when every request (on any blueprint) starts."""
+    g.request_started = time.perf_counter()
+
+@metrics_bp.after_app_request
+def record_request_duration(response):
+    """Record how long the request took, by method, route and status code."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe(metrics.HTTP_REQUEST_SECONDS, time.perf_counter() - started,
+                        method=request.method, endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@metrics_bp.route('/metrics')
+def prometheus_metrics():
+    """Expose request, database and payment gateway metrics in the Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,134 @@
+"""
+Batch Payment Service Module - End-of-Day Late Fee Collection
+Charges every patron's outstanding late fees as one payment per patron
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from database import (
+    create_payment_batch, get_billed_late_fees, get_payment_batch, get_payment_batch_items,
+    claim_payment_batch_item, update_payment_batch_item, mark_stale_payment_batch_items,
+    update_payment_batch_status
+)
+from services.fee_service import outstanding_loan_fees
+from services.payment_service import NOT_SENT_ERRORS, PaymentGateway, get_payment_gateway
+
+# Item statuses. 'pending' and 'error' (the gateway call raised before the charge was
+# sent, see NOT_SENT_ERRORS) are retried when a batch is run again; 'paid' and
+# 'declined' are final. 'unknown' marks items whose charge may or may not have gone
+# through (the call raised after it may have been sent, or a previous run died while
+# submitting it), so they are left for manual reconciliation instead of being charged twice.
+RETRYABLE_STATUSES = ['pending', 'error']
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls at least 1/rate seconds apart."""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+    
+    def wait(self):
+        """Block until the caller may make its next call."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def create_late_fee_batch(as_of: Optional[datetime] = None) -> Tuple[bool, str, Optional[int]]:
+    """
+    Create a collection batch with one charge per patron for all of their outstanding late fees.
+    
+    Each item records the loans it charges for and the fee on each. A loan's late fee
+    keeps growing until it is returned, so a batch only charges the part of it that
+    earlier batches and payments at the desk have not already billed.
+    
+    Returns:
+        tuple: (success: bool, message: str, batch_id: Optional[int])
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    billed = get_billed_late_fees()
+    
+    charges = {}
+    for loan_id, patron_id, fee in outstanding_loan_fees(as_of):
+        amount = round(fee - billed.get(loan_id, 0.0), 2)
+        if amount > 0:
+            charges.setdefault(patron_id, {})[loan_id] = amount
+    
+    batch_id = create_payment_batch(charges, as_of)
+    if batch_id is None:
+        return False, "Database error occurred while creating the payment batch.", None
+    return True, f"Created payment batch {batch_id} with {len(charges)} patron charges.", batch_id
+
+
+def _charge_item(item: Dict, payment_gateway: PaymentGateway, limiter: RateLimiter) -> Optional[str]:
+    """Submit one batch item to the gateway and record its outcome. Returns the new status."""
+    if not claim_payment_batch_item(item['id'], RETRYABLE_STATUSES, datetime.now()):
+        return None  # another runner got to it first
+    
+    limiter.wait()
+    try:
+        success, transaction_id, message = payment_gateway.process_payment(
+            patron_id=item['patron_id'],
+            amount=item['amount'],
+            description=f"Late fees for {item['loan_count']} overdue book(s)"
+        )
+        status = 'paid' if success else 'declined'
+    except Exception as e:
+        status = 'error' if isinstance(e, NOT_SENT_ERRORS) else 'unknown'
+        transaction_id, message = None, f"Payment processing error: {str(e)}"
+    
+    update_payment_batch_item(item['id'], status, transaction_id or None, message, datetime.now())
+    return status
+
+
+def run_late_fee_batch(batch_id: int, payment_gateway: PaymentGateway = None, workers: int = 4,
+                       rate_limit: float = 10.0, stale_after: float = 300.0) -> Tuple[bool, str, Dict]:
+    """
+    Submit a batch's pending charges through a worker pool, at most `rate_limit` charges
+    per second, recording the outcome of every item as it completes.
+    
+    Running a batch again resumes it: only items that are still pending or that hit a
+    gateway error are submitted. Items left 'submitting' for more than `stale_after`
+    seconds by a run that crashed are marked 'unknown' rather than charged again.
+    
+    Args:
+        batch_id: Batch created by create_late_fee_batch
+        payment_gateway: Payment gateway instance (injectable for testing)
+        workers: Number of charges submitted in parallel
+        rate_limit: Maximum charges per second (0 for no limit)
+        stale_after: Seconds after which an in-flight item is considered abandoned
+        
+    Returns:
+        tuple: (success: bool, message: str, batch: dict with item counts per status)
+    """
+    if get_payment_batch(batch_id) is None:
+        return False, "Payment batch not found.", {}
+    
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    mark_stale_payment_batch_items(batch_id, datetime.now() - timedelta(seconds=stale_after), 'unknown')
+    
+    limiter = RateLimiter(rate_limit)
+    items = get_payment_batch_items(batch_id, RETRYABLE_STATUSES)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda item: _charge_item(item, payment_gateway, limiter), items))
+    
+    batch = get_payment_batch(batch_id)
+    remaining = sum(batch['items'].get(status, 0) for status in RETRYABLE_STATUSES + ['submitting'])
+    if remaining == 0:
+        update_payment_batch_status(batch_id, 'completed')
+        batch['status'] = 'completed'
+    
+    counts = ', '.join(f"{count} {status}" for status, count in sorted(batch['items'].items()))
+    return True, f"Payment batch {batch_id} is {batch['status']}: {counts or 'no items'}.", batch
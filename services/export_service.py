@@ -0,0 +1,121 @@
+"""
+Export Service Module - Streaming Catalog and Loan Exports
+Writes books, borrow records and patron histories as CSV, NDJSON or columnar JSON
+"""
+
+import csv
+import io
+import json
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from database import EXPORT_DATASETS, iter_export_rows
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'columnar')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+ROW_GROUP_SIZE = 10000
+CSV_FLUSH_ROWS = 1000
+
+
+def _csv_chunks(columns: List[str], rows: Iterator[Tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(columns: List[str], rows: Iterator[Tuple]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def _columnar_chunks(dataset: str, columns: List[str], rows: Iterator[Tuple],
+                     row_group_size: int) -> Iterator[str]:
+    """
+    Columnar JSON in the spirit of Parquet: a header line with the schema, then one
+    line per row group holding each column as an array, plus the range of its ids.
+    """
+    yield json.dumps({'format': 'columnar-json', 'dataset': dataset, 'columns': columns}) + '\n'
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) >= row_group_size:
+            yield _row_group(columns, group)
+            group = []
+    if group:
+        yield _row_group(columns, group)
+
+
+def _row_group(columns: List[str], group: List[Tuple]) -> str:
+    values = list(zip(*group))
+    return json.dumps({
+        'num_rows': len(group),
+        'min_id': min(values[0]),
+        'max_id': max(values[0]),
+        'columns': {column: list(values[index]) for index, column in enumerate(columns)},
+    }) + '\n'
+
+
+def iter_export(dataset: str, fmt: str = 'csv', since: int = 0, patron_id: Optional[str] = None,
+                row_group_size: int = ROW_GROUP_SIZE, stats: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Stream an export as text chunks, in constant memory.
+
+    Args:
+        dataset: 'books', 'borrow_records' or 'patron_history'
+        fmt: 'csv', 'ndjson' or 'columnar'
+        since: Only export rows inserted or changed after this watermark (a change_seq)
+        patron_id: Only export this patron's rows (loan datasets only)
+        row_group_size: Rows per row group in the columnar format
+        stats: Optional dict updated with 'rows' and 'watermark' (the last exported
+               change_seq, to pass as since next time) as the export is consumed
+
+    Raises:
+        ValueError: for an unknown dataset or format, or a patron filter on books
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset!r} (expected one of {', '.join(EXPORT_DATASETS)})")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+    columns = EXPORT_DATASETS[dataset][0]
+    if patron_id is not None and 'patron_id' not in columns:
+        raise ValueError(f"Dataset {dataset!r} cannot be filtered by patron")
+
+    if stats is None:
+        stats = {}
+    stats.update(rows=0, watermark=since)
+
+    def rows():
+        for row in iter_export_rows(dataset, since, patron_id):
+            stats['rows'] += 1
+            stats['watermark'] = row[-1]
+            yield row
+
+    if fmt == 'csv':
+        return _csv_chunks(columns, rows())
+    if fmt == 'ndjson':
+        return _ndjson_chunks(columns, rows())
+    return _columnar_chunks(dataset, columns, rows(), row_group_size)
+
+
+def export_dataset(out: TextIO, dataset: str, fmt: str = 'csv', since: int = 0,
+                   patron_id: Optional[str] = None, row_group_size: int = ROW_GROUP_SIZE) -> Dict:
+    """
+    Write an export to a text file.
+
+    Returns:
+        dict: rows written and the watermark to resume from
+    """
+    stats = {}
+    for chunk in iter_export(dataset, fmt, since, patron_id, row_group_size, stats):
+        out.write(chunk)
+    return stats
@@ -0,0 +1,157 @@
+"""
+Fee Service Module - Late Fee Calculation
+Implements the R5 late fee rules once, for single loans and for batches of loans
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import get_patron_borrowed_books, iter_overdue_loan_chunks, replace_patron_fee_summary
+
+# R5: books are due 14 days after borrowing; $0.50/day for the first 7 days
+# overdue, $1.00/day after that, capped at $15.00 per book
+LOAN_PERIOD_DAYS = 14
+FIRST_TIER_DAYS = 7
+FIRST_TIER_RATE = 0.50
+SECOND_TIER_RATE = 1.00
+MAX_FEE_PER_BOOK = 15.00
+
+
+def late_fee_for_days(days_overdue: int) -> float:
+    """Return the late fee in dollars for a book that is `days_overdue` days overdue."""
+    if days_overdue <= 0:
+        return 0.00
+    
+    if days_overdue <= FIRST_TIER_DAYS:
+        fee = days_overdue * FIRST_TIER_RATE
+    else:
+        fee = (FIRST_TIER_DAYS * FIRST_TIER_RATE) + ((days_overdue - FIRST_TIER_DAYS) * SECOND_TIER_RATE)
+    
+    return round(min(fee, MAX_FEE_PER_BOOK), 2)
+
+
+def calculate_loan_fee(borrow_date: datetime, today: Optional[datetime] = None) -> Dict:
+    """
+    Calculate the late fee for one loan from its borrow date.
+    
+    Returns:
+        dict: fee_amount, days_overdue and status, as returned by calculate_late_fee_for_book
+    """
+    if today is None:
+        today = datetime.now()
+    due_date = borrow_date + timedelta(days=LOAN_PERIOD_DAYS)
+    
+    if today <= due_date:
+        return {
+            'fee_amount': 0.00,
+            'days_overdue': (today - borrow_date).days,
+            'status': 'Not Overdue'
+        }
+    
+    days_overdue = (today - due_date).days
+    return {
+        'fee_amount': late_fee_for_days(days_overdue),
+        'days_overdue': days_overdue,
+        'status': 'Overdue'
+    }
+
+
+def calculate_late_fees(loans: Iterable[Dict], today: Optional[datetime] = None) -> List[Dict]:
+    """
+    Calculate late fees for any set of loans already fetched from the database
+    (e.g. the rows of get_patron_borrowed_books), without further queries.
+    
+    Args:
+        loans: Loan dicts with at least book_id and borrow_date
+        today: Date to calculate fees at (defaults to now, shared by every loan)
+        
+    Returns:
+        list: One dict per loan, in input order, with book_id, fee_amount,
+              days_overdue and status
+    """
+    if today is None:
+        today = datetime.now()
+    
+    fees = []
+    for loan in loans:
+        fee = calculate_loan_fee(loan['borrow_date'], today)
+        fee['book_id'] = loan['book_id']
+        fees.append(fee)
+    return fees
+
+
+def calculate_patron_late_fees(patron_id: str, today: Optional[datetime] = None) -> Dict:
+    """
+    Calculate late fees for all of a patron's open loans with a single query.
+    
+    Returns:
+        dict: fees (one entry per open loan) and total_late_fees
+    """
+    fees = calculate_late_fees(get_patron_borrowed_books(patron_id), today)
+    return {
+        'fees': fees,
+        'total_late_fees': round(sum(fee['fee_amount'] for fee in fees), 2)
+    }
+
+
+def _fee_table() -> List[float]:
+    """Fee for every number of days overdue up to the day the $15 cap is reached."""
+    table = [late_fee_for_days(0)]
+    while table[-1] < MAX_FEE_PER_BOOK:
+        table.append(late_fee_for_days(len(table)))
+    return table
+
+
+def outstanding_loan_fees(as_of: Optional[datetime] = None, chunk_size: int = 10000) -> Iterator[Tuple[int, str, float]]:
+    """
+    Yield (loan_id, patron_id, late_fee) for every open loan that is overdue at `as_of`.
+    
+    Open overdue loans are streamed in chunks with days overdue already computed
+    by SQLite, and priced with a lookup in a precomputed fee table instead of one
+    calculate_late_fee_for_book call (and its queries) per loan.
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    fee_table = _fee_table()
+    capped_day = len(fee_table) - 1
+    
+    for chunk in iter_overdue_loan_chunks(as_of, chunk_size):
+        for loan_id, patron_id, days_overdue in chunk:
+            yield loan_id, patron_id, fee_table[min(days_overdue, capped_day)]
+
+
+def outstanding_fees_by_patron(as_of: Optional[datetime] = None, chunk_size: int = 10000) -> Dict[str, Tuple[int, float]]:
+    """
+    Compute outstanding late fees for every open overdue loan, grouped by patron.
+    
+    Returns:
+        dict: {patron_id: (overdue_loans, total_late_fees)}
+    """
+    totals = {}
+    for _, patron_id, fee in outstanding_loan_fees(as_of, chunk_size):
+        loans, total = totals.get(patron_id, (0, 0.0))
+        totals[patron_id] = (loans + 1, total + fee)
+    return totals
+
+
+def sweep_overdue_fees(as_of: Optional[datetime] = None, chunk_size: int = 10000) -> Dict:
+    """
+    Compute outstanding late fees for every open loan in the library and store
+    per-patron totals in patron_fee_summary (replacing the previous sweep).
+    
+    Returns:
+        dict: as_of, loans, patrons and total_late_fees for the sweep
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    totals = outstanding_fees_by_patron(as_of, chunk_size)
+    
+    if not replace_patron_fee_summary(totals, as_of):
+        raise RuntimeError('Database error occurred while saving the overdue sweep.')
+    
+    return {
+        'as_of': as_of.isoformat(),
+        'loans': sum(loans for loans, _ in totals.values()),
+        'patrons': len(totals),
+        'total_late_fees': round(sum(total for _, total in totals.values()), 2)
+    }
@@ -0,0 +1,139 @@
+"""
+Import Service Module - Bulk Catalog Import
+Loads CSV or JSONL acquisition feeds into the catalog in chunks
+"""
+
+import csv
+import json
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from database import import_books
+from services.library_service import validate_book
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_CHUNK_SIZE = 5000
+
+DUPLICATE_ISBN = "A book with this ISBN already exists."
+
+
+def detect_import_format(filename: str) -> Optional[str]:
+    """Guess the feed format from a file name (.csv, .jsonl or .ndjson)."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def iter_feed_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Read a feed one record at a time.
+
+    CSV feeds need a header row naming title, author, isbn and total_copies; JSONL
+    feeds have one object with the same keys per line.
+
+    Yields:
+        tuple: (line number, record or None, parse error or None)
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None, "Invalid JSON."
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Each line must be a JSON object."
+                continue
+            yield line_number, row, None
+    else:
+        raise ValueError(f"Unknown import format: {fmt!r} (expected one of {', '.join(IMPORT_FORMATS)})")
+
+
+def _book_from_row(row: Dict) -> Tuple[Optional[Tuple[str, str, str, int]], Optional[str]]:
+    """Normalize a feed record and validate it with the R1 rules."""
+    title = str(row.get('title') or '')
+    author = str(row.get('author') or '')
+    isbn = str(row.get('isbn') or '').strip()
+    total_copies = row.get('total_copies')
+    if isinstance(total_copies, str) and total_copies.strip().isdigit():
+        total_copies = int(total_copies)
+
+    error = validate_book(title, author, isbn, total_copies)
+    if error:
+        return None, error
+    return (title.strip(), author.strip(), isbn, total_copies), None
+
+
+def import_catalog_feed(stream: TextIO, fmt: str = 'csv', chunk_size: int = IMPORT_CHUNK_SIZE,
+                        max_rejects: Optional[int] = 1000) -> Dict:
+    """
+    Stream a CSV or JSONL feed into the catalog.
+
+    Rows are validated like add_book_to_catalog, then inserted chunk by chunk, each
+    chunk in a single transaction that skips ISBNs already in the catalog (or earlier
+    in the feed).
+
+    Args:
+        stream: Text stream with the feed
+        fmt: 'csv' or 'jsonl'
+        chunk_size: Rows inserted per transaction
+        max_rejects: Keep details of at most this many rejected rows (None keeps all)
+
+    Returns:
+        dict: rows read, books imported, rejected_count and the rejected rows
+              (line, isbn, reason)
+
+    Raises:
+        ValueError: for an unknown format
+        RuntimeError: if a chunk cannot be written; earlier chunks stay imported
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt!r} (expected one of {', '.join(IMPORT_FORMATS)})")
+
+    report = {'rows': 0, 'imported': 0, 'rejected_count': 0, 'rejected': []}
+
+    def reject(line_number, isbn, reason):
+        report['rejected_count'] += 1
+        if max_rejects is None or len(report['rejected']) < max_rejects:
+            report['rejected'].append({'line': line_number, 'isbn': isbn, 'reason': reason})
+
+    def flush(chunk: List[Tuple[str, str, str, int]], lines: Dict[str, int]):
+        result = import_books(chunk)
+        if result is None:
+            raise RuntimeError(f"Database error while importing books; "
+                               f"{report['imported']} books were imported before the failure.")
+        imported, duplicates = result
+        report['imported'] += imported
+        for isbn in duplicates:
+            reject(lines[isbn], isbn, DUPLICATE_ISBN)
+
+    chunk, lines = [], {}
+    for line_number, row, error in iter_feed_rows(stream, fmt):
+        report['rows'] += 1
+        if row is not None:
+            book, error = _book_from_row(row)
+        if error:
+            reject(line_number, row.get('isbn') if row else None, error)
+            continue
+
+        isbn = book[2]
+        if isbn in lines:
+            reject(line_number, isbn, DUPLICATE_ISBN)
+            continue
+        chunk.append(book)
+        lines[isbn] = line_number
+        if len(chunk) >= chunk_size:
+            flush(chunk, lines)
+            chunk, lines = [], {}
+
+    if chunk:
+        flush(chunk, lines)
+    return report
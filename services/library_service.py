@@ -4,18 +4,57 @@ Contains all the core business logic for the Library Management System
 """
 
 from services.payment_service import (
-    PaymentGateway
-    
+    PaymentGateway, AsyncPaymentGateway, get_payment_gateway, get_async_payment_gateway
+)
+from services.fee_service import calculate_loan_fee, calculate_late_fees, late_fee_for_days
+from services.payment_ledger import (
+    late_fee_idempotency_key, refund_idempotency_key, billed_late_fee, start_payment, finish_payment,
+    fail_payment, charge_status, get_cached_status, cache_status
 )
+import asyncio
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from database import (
     get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
     insert_book, insert_borrow_record, update_book_availability,
     update_borrow_record_return_date, get_all_books, get_patron_borrowed_books, 
-    get_patron_history
+    get_patron_history, borrow_book_transaction, return_book_transaction, search_books,
+    iter_search_books, get_patron_history_page, iter_patron_history, count_patron_loans_by_year,
+    count_patron_overdue_days, get_overdue_loans_page, get_open_loan
 )
 
+# Loans per page of a patron's borrowing history and of the overdue list
+HISTORY_PAGE_SIZE = 20
+OVERDUE_PAGE_SIZE = 50
+
+def validate_book(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
+    """
+    Check a new book's fields against the R1 rules (shared by single adds and bulk imports).
+    
+    Returns:
+        str: the first validation error, or None if the book is valid
+    """
+    if not title or not title.strip():
+        return "Title is required."
+    
+    if len(title.strip()) > 200:
+        return "Title must be less than 200 characters."
+    
+    if not author or not author.strip():
+        return "Author is required."
+    
+    if len(author.strip()) > 100:
+        return "Author must be less than 100 characters."
+    
+    if not isbn or len(isbn) != 13:
+        return "ISBN must be exactly 13 digits."
+    
+    if not isinstance(total_copies, int) or total_copies <= 0:
+        return "Total copies must be a positive integer."
+    
+    return None
+
 def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
     """
     Add a new book to the catalog.
@@ -31,23 +70,9 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
         tuple: (success: bool, message: str)
     """
     # Input validation
-    if not title or not title.strip():
-        return False, "Title is required."
-    
-    if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
-    
-    if not author or not author.strip():
-        return False, "Author is required."
-    
-    if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
-    
-    if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
-    
-    if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+    error = validate_book(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -77,33 +102,26 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
+    # Books are due 14 days after borrowing
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=14)
+    
+    # Check availability and the borrowing limit, then insert the borrow record and
+    # take a copy, all in one transaction
+    status, book = borrow_book_transaction(patron_id, book_id, borrow_date, due_date, max_borrowed=5)
+    
+    if status == 'not_found':
         return False, "Book not found."
     
-    if book['available_copies'] <= 0:
+    if status == 'unavailable':
         return False, "This book is currently not available."
     
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    if current_borrowed >= 5:
+    if status == 'limit_reached':
         return False, "You have reached the maximum borrowing limit of 5 books."
     
-    # Create borrow record
-    borrow_date = datetime.now()
-    due_date = borrow_date + timedelta(days=14)
-    
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
+    if status != 'borrowed':
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
@@ -117,19 +135,18 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
-
-    if book not in get_patron_borrowed_books(patron_id):
+    # Close the patron's open loan (found through the open-loan index) and give the
+    # copy back in one transaction; the fee is priced from the loan row it returns
+    return_date = datetime.now()
+    status, loan = return_book_transaction(patron_id, book_id, return_date)
+    if status == 'not_borrowed':
+        if not get_book_by_id(book_id):
+            return False, "Book not found."
         return False, "Patron does not currently own book."
-    
-    update_book_availability(book_id, 1)
+    if status != 'returned':
+        return False, "Database error occurred while returning the book."
 
-    update_borrow_record_return_date(patron_id, book_id, datetime.now())
-
-    latefee = calculate_late_fee_for_book(patron_id, book_id)
+    latefee = calculate_loan_fee(datetime.fromisoformat(loan['borrow_date']), return_date)
 
     return True, f"Book returned with {latefee['days_overdue']} days overdue, late fee is {latefee['fee_amount']} dollars." 
 
@@ -156,71 +173,48 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     if not book:
         return None
 
-    fee_amount = 0.00
-
     patron_list = get_patron_borrowed_books(patron_id)
     patron = {}
     for book in patron_list:
         if book['book_id'] == book_id:
             patron = book
 
-    borrow_date = patron['borrow_date']
-    due_date = borrow_date + timedelta(days=14)
-    today = datetime.now()
-
-    if today <= due_date:
-        return {
-            'fee_amount': fee_amount,
-            'days_overdue': (datetime.now() - patron['borrow_date']).days,
-            'status': 'Not Overdue'
-        }
-
-    days_overdue = (today - due_date).days
-
-    # Calculate fee
-    if days_overdue <= 7:
-        fee = days_overdue * 0.50
-    else:
-        fee = (7 * 0.50) + ((days_overdue - 7) * 1.00)
-
-    if fee > 15.00:
-        fee = 15.00
-
-    return {
-        'fee_amount': round(fee, 2),
-        'days_overdue': days_overdue,
-        'status': 'Overdue'
-    }
+    return calculate_loan_fee(patron['borrow_date'])
     
 
-def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
+def _search_field(search_type: str) -> Optional[str]:
+    """Map a user-supplied search type onto the field searched in the database."""
+    for field in ('title', 'isbn', 'author'):
+        if search_type.lower() in field:
+            return field
+    return None
+
+def search_books_in_catalog(search_term: str, search_type: str, limit: Optional[int] = None,
+                            offset: int = 0) -> List[Dict]:
     """
     Search for books in the catalog.
     
     TODO: Implement R6 as per requirements
-    """
     
-    books = get_all_books()
-    result = []
-
-    if search_type.lower() in "title":
-        for book in books:
-            if(search_term.lower() in (book.get("title")).lower()):
-                result.append(book)
-
-    elif search_type.lower() in "isbn":
-        for book in books:
-            if(search_term.lower() in (book.get("isbn")).lower()):
-                result.append(book)
-        
-    elif search_type.lower() in "author":
-        for book in books:
-            if(search_term.lower() in (book.get("author")).lower()):
-                result.append(book)
-    else:
+    Title and author go through the full-text index (word-prefix matching, best
+    matches first); ISBN uses exact/prefix lookups on the unique index.
+    Returns None for an unknown search type.
+    """
+    field = _search_field(search_type)
+    if field is None:
         return None
+    return search_books(search_term, field, limit, offset)
 
-    return result
+def iter_books_in_catalog(search_term: str, search_type: str, limit: Optional[int] = None,
+                          offset: int = 0) -> Optional[Iterator[Dict]]:
+    """
+    Like search_books_in_catalog, but yields results lazily from a database cursor
+    so large result sets can be streamed with bounded memory.
+    """
+    field = _search_field(search_type)
+    if field is None:
+        return None
+    return iter_search_books(search_term, field, limit, offset)
 
 def get_patron_status_report(patron_id: str) -> Dict:
     """
@@ -236,22 +230,100 @@ def get_patron_status_report(patron_id: str) -> Dict:
 
     currently_borrowed = get_patron_borrowed_books(patron_id)
     books_borrowed = get_patron_borrow_count(patron_id)
-    borrowing_history = get_patron_history(patron_id)
-
-    total_late_fees = 0.00
+    # Only the first page of the history; the cursor fetches the rest on demand
+    borrowing_history, history_cursor = get_patron_history_page(patron_id, limit=HISTORY_PAGE_SIZE)
 
-    for book in currently_borrowed:
-        total_late_fees += (calculate_late_fee_for_book(patron_id, book["book_id"]))["fee_amount"]
+    # Fees for every open loan from the rows already fetched, instead of one
+    # calculate_late_fee_for_book call (and its queries) per book
+    total_late_fees = sum(fee['fee_amount'] for fee in calculate_late_fees(currently_borrowed))
 
 
     return {
         "currently_borrowed": currently_borrowed,
         "books_borrowed": books_borrowed,
         "borrowing_history": borrowing_history,
+        "borrowing_history_cursor": history_cursor,
         "total_late_fees": total_late_fees
     }
 
-def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+def get_patron_borrowing_history(patron_id: str, cursor: Optional[str] = None,
+                                 limit: int = HISTORY_PAGE_SIZE) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    """
+    Get one page of a patron's borrowing history, oldest loan first.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        cursor: `next_cursor` from the previous page, or None for the first page
+        limit: Loans per page
+        
+    Returns:
+        tuple: (loans, next_cursor), or None for an invalid patron ID
+        
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return None
+    return get_patron_history_page(patron_id, cursor, limit)
+
+def iter_patron_borrowing_history(patron_id: str) -> Optional[Iterator[Dict]]:
+    """Lazily iterate over a patron's whole borrowing history, or None for an invalid patron ID."""
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return None
+    return iter_patron_history(patron_id)
+
+def get_patron_history_summary(patron_id: str, today: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    Summarize a patron's borrowing history without loading it: loans per year, and
+    late fees over all loans (returned loans by their return date, open loans as of today).
+    
+    Returns:
+        dict: total_loans, loans_per_year, late_loans and total_late_fees, or None for
+              an invalid patron ID
+    """
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return None
+    
+    loans_per_year = count_patron_loans_by_year(patron_id)
+    late_loans = count_patron_overdue_days(patron_id, today or datetime.now())
+    return {
+        "patron_id": patron_id,
+        "total_loans": sum(loans_per_year.values()),
+        "loans_per_year": loans_per_year,
+        "late_loans": sum(loans for _, loans in late_loans),
+        "total_late_fees": round(sum(late_fee_for_days(days) * loans for days, loans in late_loans), 2)
+    }
+
+def get_overdue_loans(min_days: int = 0, max_days: Optional[int] = None, cursor: Optional[str] = None,
+                      limit: int = OVERDUE_PAGE_SIZE,
+                      today: Optional[datetime] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Get one page of the library-wide overdue list, most overdue loan first, with the
+    late fee each loan has run up so far.
+    
+    Args:
+        min_days: Only loans at least this many days overdue (0 = every overdue loan)
+        max_days: Only loans at most this many days overdue
+        cursor: `next_cursor` from the previous page, or None for the first page
+        limit: Loans per page
+        today: Date the list is computed for (defaults to now)
+        
+    Returns:
+        tuple: (loans, next_cursor)
+        
+    Raises:
+        ValueError: for a negative or inverted days range, or a malformed cursor
+    """
+    if min_days < 0 or (max_days is not None and max_days < min_days):
+        raise ValueError("min_days must be non-negative and no larger than max_days.")
+    
+    loans, next_cursor = get_overdue_loans_page(today or datetime.now(), min_days, max_days, cursor, limit)
+    for loan in loans:
+        loan['fee_amount'] = late_fee_for_days(loan['days_overdue'])
+    return loans, next_cursor
+
+def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None,
+                  idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
     """
     Process payment for late fees using external payment gateway.
     
@@ -262,6 +334,10 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         patron_id: 6-digit library card ID
         book_id: ID of the book with late fees
         payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Key identifying this payment in the ledger (defaults to one
+                         derived from patron, book, open loan and the amount of its fee
+                         already billed); resubmitting a payment that already succeeded
+                         returns the recorded result without charging again
         
     Returns:
         tuple: (success: bool, message: str, transaction_id: Optional[str])
@@ -272,51 +348,167 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
         success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
     """
+    result, fee_amount, book, loan_id, billed = _prepare_late_fee_payment(patron_id, book_id)
+    if result:
+        return result
+    
+    # Record the attempt in the ledger; a duplicate submission is answered locally
+    key = idempotency_key or late_fee_idempotency_key(patron_id, book_id, loan_id, billed)
+    proceed, existing = start_payment(key, 'charge', fee_amount, patron_id, book_id, loan_id)
+    if not proceed:
+        return _recorded_payment_result(existing)
+    
+    # Use provided gateway or the shared one
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    # Process payment through external gateway
+    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
+    try:
+        success, transaction_id, message = payment_gateway.process_payment(
+            patron_id=patron_id,
+            amount=fee_amount,
+            description=f"Late fees for '{book['title']}'"
+        )
+    except Exception as e:
+        # Handle payment gateway errors
+        fail_payment(key, e)
+        return False, f"Payment processing error: {str(e)}", None
+    
+    finish_payment(key, success, transaction_id, message,
+                   charge_status(transaction_id, fee_amount) if success else None)
+    return _late_fee_payment_result(success, transaction_id, message)
+
+
+def _prepare_late_fee_payment(patron_id: str, book_id: int) -> Tuple[
+        Optional[Tuple[bool, str, Optional[str]]], float, Optional[Dict], Optional[int], float]:
+    """
+    Validate a late fee payment before it is sent to the gateway, and work out how much
+    of the loan's fee is left to charge.
+    
+    Returns:
+        tuple: (result, amount to charge, book, id of the open loan being paid for, amount
+               of its fee already billed) - result is the final pay_late_fees answer when
+               there is nothing to send to the gateway, else None
+    """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+        return (False, "Invalid patron ID. Must be exactly 6 digits.", None), 0.0, None, None, 0.0
     
     # Calculate late fee first
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
     # Check if there's a fee to pay
     if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
+        return (False, "Unable to calculate late fees.", None), 0.0, None, None, 0.0
     
     fee_amount = fee_info.get('fee_amount', 0.0)
     
     if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
+        return (False, "No late fees to pay for this book.", None), 0.0, None, None, 0.0
     
     # Get book details for payment description
     book = get_book_by_id(book_id)
     if not book:
-        return False, "Book not found.", None
+        return (False, "Book not found.", None), 0.0, None, None, 0.0
+    
+    # The fee keeps growing while the book is out; charge only what earlier payments
+    # and collection batches have not billed for this loan
+    loan = get_open_loan(patron_id, book_id)
+    if not loan:
+        return None, fee_amount, book, None, 0.0
+    billed, last_charge = billed_late_fee(loan['id'])
+    amount = round(fee_amount - billed, 2)
+    if amount <= 0:
+        if last_charge is None:
+            result = (False, "The late fees for this book have already been billed in a fee collection batch.",
+                      None)
+        else:
+            result = _recorded_payment_result(last_charge)
+        return result, 0.0, book, loan['id'], billed
+    return None, amount, book, loan['id'], billed
+
+
+def _recorded_payment_result(payment: Optional[Dict]) -> Tuple[bool, str, Optional[str]]:
+    """Answer a duplicate late fee payment from its ledger entry."""
+    if payment and payment['status'] == 'succeeded':
+        return True, f"Payment successful! {payment['message']}", payment['transaction_id']
+    if payment and payment['status'] == 'unknown':
+        return False, ("An earlier payment for these late fees may have gone through; "
+                       "it must be checked with the payment provider before paying again."), None
+    return False, "A payment for these late fees is already in progress.", None
+
+
+def _late_fee_payment_result(success: bool, transaction_id: str, message: str) -> Tuple[bool, str, Optional[str]]:
+    """Turn a gateway response into the (success, message, transaction_id) result of pay_late_fees."""
+    if success:
+        return True, f"Payment successful! {message}", transaction_id
+    else:
+        return False, f"Payment failed: {message}", None
+
+
+async def pay_late_fees_async(patron_id: str, book_id: int, payment_gateway: AsyncPaymentGateway = None,
+                              idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Async variant of pay_late_fees: many payments can be in flight at once on one
+    AsyncPaymentGateway, within its concurrency limit and per-request timeout.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: Async gateway instance (injectable for testing)
+        idempotency_key: Ledger key for this payment, as for pay_late_fees
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    # The fee lookup and ledger writes are blocking database calls; keep them off the event loop
+    result, fee_amount, book, loan_id, billed = await asyncio.to_thread(
+        _prepare_late_fee_payment, patron_id, book_id)
+    if result:
+        return result
+    
+    key = idempotency_key or late_fee_idempotency_key(patron_id, book_id, loan_id, billed)
+    proceed, existing = await asyncio.to_thread(start_payment, key, 'charge', fee_amount, patron_id, book_id,
+                                                loan_id)
+    if not proceed:
+        return _recorded_payment_result(existing)
     
-    # Use provided gateway or create new one
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_async_payment_gateway()
     
-    # Process payment through external gateway
-    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
     try:
-        success, transaction_id, message = payment_gateway.process_payment(
+        success, transaction_id, message = await payment_gateway.process_payment(
             patron_id=patron_id,
             amount=fee_amount,
             description=f"Late fees for '{book['title']}'"
         )
-        
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
-            
     except Exception as e:
-        # Handle payment gateway errors
+        await asyncio.to_thread(fail_payment, key, e)
         return False, f"Payment processing error: {str(e)}", None
+    
+    await asyncio.to_thread(finish_payment, key, success, transaction_id, message,
+                            charge_status(transaction_id, fee_amount) if success else None)
+    return _late_fee_payment_result(success, transaction_id, message)
 
 
-def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
+async def pay_late_fees_concurrently(payments: Iterable[Tuple[str, int]],
+                                     payment_gateway: AsyncPaymentGateway = None) -> List[Tuple[bool, str, Optional[str]]]:
+    """
+    Pay late fees for many (patron_id, book_id) pairs at once.
+    
+    Returns:
+        list: One pay_late_fees-style result per pair, in input order
+    """
+    if payment_gateway is None:
+        payment_gateway = get_async_payment_gateway()
+    return list(await asyncio.gather(*(
+        pay_late_fees_async(patron_id, book_id, payment_gateway) for patron_id, book_id in payments
+    )))
+
+
+def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None,
+                            idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     """
     Refund a late fee payment (e.g., if book was returned on time but fees were charged in error).
     
@@ -326,6 +518,8 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         transaction_id: Original transaction ID to refund
         amount: Amount to refund
         payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Ledger key for this refund (defaults to one derived from
+                         transaction and amount)
         
     Returns:
         tuple: (success: bool, message: str)
@@ -340,19 +534,64 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     if amount > 15.00:  # Maximum late fee per book
         return False, "Refund amount exceeds maximum late fee."
     
-    # Use provided gateway or create new one
+    # Record the attempt in the ledger; a duplicate refund is answered locally
+    key = idempotency_key or refund_idempotency_key(transaction_id, amount)
+    proceed, existing = start_payment(key, 'refund', amount)
+    if not proceed:
+        if existing and existing['status'] == 'succeeded':
+            return True, existing['message']
+        if existing and existing['status'] == 'unknown':
+            return False, ("An earlier refund for this transaction may have gone through; "
+                           "it must be checked with the payment provider before refunding again.")
+        return False, "A refund for this transaction is already in progress."
+    
+    # Use provided gateway or the shared one
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
     try:
         success, message = payment_gateway.refund_payment(transaction_id, amount)
-        
-        if success:
-            return True, message
-        else:
-            return False, f"Refund failed: {message}"
-            
     except Exception as e:
-        return False, f"Refund processing error: {str(e)}"
\ No newline at end of file
+        fail_payment(key, e)
+        return False, f"Refund processing error: {str(e)}"
+    
+    finish_payment(key, success, transaction_id, message)
+    if success:
+        cache_status(transaction_id, {
+            "transaction_id": transaction_id,
+            "status": "refunded",
+            "amount": amount,
+            "timestamp": time.time()
+        })
+        return True, message
+    else:
+        return False, f"Refund failed: {message}"
+
+
+def verify_late_fee_payment(transaction_id: str, payment_gateway: PaymentGateway = None) -> Dict:
+    """
+    Check the status of a late fee payment.
+    
+    Transactions recorded in the ledger in a terminal state (completed, failed,
+    refunded) are answered locally; anything else is checked with the gateway and
+    the answer cached once it is terminal.
+    
+    Args:
+        transaction_id: Transaction ID to check
+        payment_gateway: Payment gateway instance (injectable for testing)
+        
+    Returns:
+        dict: Payment status information, as from PaymentGateway.verify_payment_status
+    """
+    cached = get_cached_status(transaction_id)
+    if cached:
+        return cached
+    
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    status = payment_gateway.verify_payment_status(transaction_id)
+    cache_status(transaction_id, status)
+    return status
\ No newline at end of file
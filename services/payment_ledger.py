@@ -0,0 +1,118 @@
+"""
+Payment Ledger Module - Local Record of Gateway Transactions
+Records every charge and refund under an idempotency key so that retries and
+status checks can be answered locally instead of going back to the gateway
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from database import (
+    insert_payment, get_payment_by_key, get_payment_by_transaction, get_loan_charges, get_billed_late_fee,
+    reclaim_payment, update_payment, update_payment_gateway_status
+)
+from services.payment_service import NOT_SENT_ERRORS
+
+# Ledger statuses: 'pending' while the gateway call is in flight, then 'succeeded',
+# 'failed' (declined by the gateway), 'error' (the call raised before the request
+# reached the gateway) or 'unknown' (the call raised after it may have been sent, e.g.
+# a timeout, so the charge may have gone through). Failed and errored payments may be
+# retried with the same key; so may a payment left pending for longer than
+# PENDING_TIMEOUT by a process that died mid-call. Unknown payments are never retried
+# automatically: they are left for reconciliation with the gateway, as unknown
+# batch items are (see batch_payment_service).
+RETRYABLE_STATUSES = ['failed', 'error']
+
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+# Gateway transaction states that can no longer change, and so are safe to cache
+TERMINAL_GATEWAY_STATUSES = {'completed', 'failed', 'refunded'}
+
+
+def late_fee_idempotency_key(patron_id: str, book_id: int, loan_id: Optional[int], billed: float) -> str:
+    """
+    Default idempotency key for paying the late fee on one loan (borrow record).
+
+    The key names the loan and how much of its fee was already billed, not the fee
+    itself, which grows every day the book stays out: resubmitting a payment maps to
+    the same entry, and only a top-up after an earlier charge went through is new.
+    """
+    return f"late_fee:{patron_id}:{book_id}:{loan_id}:{billed:.2f}"
+
+
+def billed_late_fee(loan_id: int) -> Tuple[float, Optional[Dict]]:
+    """
+    Get how much of a loan's late fee has already been billed, here or by a collection
+    batch (including charges in flight or whose outcome is unknown), and the latest
+    such charge made through the ledger, if any.
+    """
+    charges = [charge for charge in get_loan_charges(loan_id) if charge['status'] not in RETRYABLE_STATUSES]
+    return get_billed_late_fee(loan_id), charges[-1] if charges else None
+
+
+def refund_idempotency_key(transaction_id: str, amount: float) -> str:
+    """Default idempotency key for refunding a transaction."""
+    return f"refund:{transaction_id}:{amount:.2f}"
+
+
+def start_payment(idempotency_key: str, kind: str, amount: float, patron_id: Optional[str] = None,
+                  book_id: Optional[int] = None, loan_id: Optional[int] = None) -> Tuple[bool, Optional[Dict]]:
+    """
+    Claim an idempotency key before calling the gateway.
+    
+    Returns:
+        tuple: (proceed: bool, existing: Optional[dict]) - proceed is True if the caller
+               should call the gateway; otherwise existing is the ledger entry that
+               already answers this request (succeeded, or still in flight)
+    """
+    now = datetime.now()
+    if insert_payment(idempotency_key, kind, patron_id, book_id, loan_id, amount, now):
+        return True, None
+    
+    if reclaim_payment(idempotency_key, RETRYABLE_STATUSES, now - PENDING_TIMEOUT, now):
+        return True, None
+    
+    return False, get_payment_by_key(idempotency_key)
+
+
+def finish_payment(idempotency_key: str, success: bool, transaction_id: Optional[str], message: str,
+                   gateway_status: Optional[Dict] = None):
+    """Record the gateway's answer for a payment started with start_payment."""
+    update_payment(idempotency_key, 'succeeded' if success else 'failed', transaction_id or None, message,
+                   datetime.now(), json.dumps(gateway_status) if gateway_status else None)
+
+
+def fail_payment(idempotency_key: str, error: Exception):
+    """
+    Record that the gateway call raised: as 'error' (retryable) if the request never
+    reached the gateway, otherwise as 'unknown'.
+    """
+    status = 'error' if isinstance(error, NOT_SENT_ERRORS) else 'unknown'
+    update_payment(idempotency_key, status, None, str(error), datetime.now())
+
+
+def charge_status(transaction_id: str, amount: float) -> Dict:
+    """Status document for a charge the gateway just accepted, in verify_payment_status format."""
+    return {
+        "transaction_id": transaction_id,
+        "status": "completed",
+        "amount": amount,
+        "timestamp": time.time()
+    }
+
+
+def get_cached_status(transaction_id: str) -> Optional[Dict]:
+    """Return the locally cached status of a charge if it is terminal, else None."""
+    payment = get_payment_by_transaction(transaction_id)
+    if not payment or not payment['gateway_status']:
+        return None
+    status = json.loads(payment['gateway_status'])
+    return status if status.get('status') in TERMINAL_GATEWAY_STATUSES else None
+
+
+def cache_status(transaction_id: str, status: Dict):
+    """Cache a gateway status document for a charge if it is terminal."""
+    if status.get('status') in TERMINAL_GATEWAY_STATUSES:
+        update_payment_gateway_status(transaction_id, json.dumps(status), datetime.now())
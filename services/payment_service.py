@@ -7,8 +7,16 @@ since we cannot make actual payment API calls during testing.
 """
 
 
-from typing import Dict, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Dict, Optional, Tuple
+import asyncio
+import random
+import threading
 import time
+import weakref
+
+import metrics
 
 
 class PaymentGateway:
@@ -32,6 +40,7 @@ class PaymentGateway:
         self.api_key = api_key
         self.base_url = "https://api.payment-gateway.example.com"
     
+    @metrics.timed(metrics.GATEWAY_CALL_SECONDS, method='process_payment')
     def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
         """
         Process a payment through the external gateway.
@@ -82,6 +91,7 @@ class PaymentGateway:
         transaction_id = f"txn_{patron_id}_{int(time.time())}"
         return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
     
+    @metrics.timed(metrics.GATEWAY_CALL_SECONDS, method='refund_payment')
     def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
         """
         Refund a previous payment.
@@ -107,6 +117,7 @@ class PaymentGateway:
         refund_id = f"refund_{transaction_id}_{int(time.time())}"
         return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
     
+    @metrics.timed(metrics.GATEWAY_CALL_SECONDS, method='verify_payment_status')
     def verify_payment_status(self, transaction_id: str) -> Dict:
         """
         Check the status of a payment transaction.
@@ -132,3 +143,319 @@ class PaymentGateway:
             "amount": 10.50,
             "timestamp": time.time()
         }
+
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio client for the payment gateway.
+    
+    Gateway calls block, so they run on a worker pool that this client owns and reuses
+    for every request (the equivalent of a pooled HTTP session). At most
+    `max_concurrency` calls are in flight at once and the caller stops waiting for one
+    after `timeout` seconds, so one slow charge cannot hold up the others. A worker
+    thread cannot be interrupted, though: a call that timed out keeps its concurrency
+    slot until the thread really finishes, so later calls wait for a free worker instead
+    of queueing behind a hung one and timing out without ever being sent. A charge that
+    timed out may still go through; callers must treat its outcome as unknown.
+    
+    Example:
+        async with AsyncPaymentGateway(max_concurrency=20) as gateway:
+            success, txn_id, msg = await gateway.process_payment("123456", 10.50, "Late fees")
+    """
+    
+    def __init__(self, gateway: Optional[PaymentGateway] = None, max_concurrency: int = 10,
+                 timeout: float = 5.0):
+        """
+        Args:
+            gateway: Blocking gateway to call (default: a new PaymentGateway)
+            max_concurrency: Maximum number of gateway calls in flight at once
+            timeout: Seconds to wait for a single gateway call
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.gateway = gateway if gateway is not None else PaymentGateway()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix="payment-gateway")
+        # one semaphore per event loop, so the client can be shared across asyncio.run() calls
+        self._semaphores = weakref.WeakKeyDictionary()
+    
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+        
+        def worker_done(future):
+            # the worker thread is free again; consume the result of an abandoned call
+            semaphore.release()
+            if not future.cancelled():
+                future.exception()
+        
+        future.add_done_callback(worker_done)
+        try:
+            # shield, so that giving up on the call does not mark the worker as done
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Payment gateway did not respond within {self.timeout:g}s") from None
+    
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """Async version of PaymentGateway.process_payment."""
+        return await self._call(self.gateway.process_payment, patron_id=patron_id, amount=amount,
+                                description=description)
+    
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """Async version of PaymentGateway.refund_payment."""
+        return await self._call(self.gateway.refund_payment, transaction_id, amount)
+    
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """Async version of PaymentGateway.verify_payment_status."""
+        return await self._call(self.gateway.verify_payment_status, transaction_id)
+    
+    def close(self):
+        """Release the worker pool. Calls still running finish in the background."""
+        self._executor.shutdown(wait=False)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the gateway while the circuit breaker is open."""
+
+
+# Exceptions meaning a charge or refund never reached the provider, so nothing was
+# charged: the connection was refused, or the circuit breaker never sent the call.
+# Other connection errors (reset, broken pipe, aborted) can come after the request
+# was sent, so they leave the outcome unknown.
+NOT_SENT_ERRORS = (ConnectionRefusedError, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to the payment gateway.
+    
+    After `failure_threshold` consecutive failures the circuit opens and calls fail
+    fast. Once `reset_timeout` seconds have passed a single trial call is let through
+    (half-open): if it succeeds the circuit closes again, otherwise it re-opens.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Return True if a call may go to the gateway now."""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+
+class ResilientPaymentGateway:
+    """
+    Wraps a PaymentGateway (same methods) with a circuit breaker, retries with jittered
+    exponential backoff, and hedged status checks.
+    
+    - Exceptions, and calls slower than `slow_call_threshold` seconds, count as failures
+      for the circuit breaker. While the circuit is open, calls raise CircuitOpenError
+      immediately instead of waiting on a struggling provider.
+    - Charges and refunds are only retried on ConnectionRefusedError (the request never
+      reached the provider, see NOT_SENT_ERRORS), so a retry cannot charge twice; a
+      declined payment is an answer, not a failure, and is never retried. Status checks are read-only and are retried
+      on any exception.
+    - A status check that has not answered after `hedge_after` seconds is sent a second
+      time, and whichever answer arrives first is used.
+    """
+    
+    def __init__(self, gateway: Optional[PaymentGateway] = None, max_retries: int = 2,
+                 base_delay: float = 0.1, max_delay: float = 2.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, slow_call_threshold: float = 2.0,
+                 hedge_after: Optional[float] = 0.5, sleep=time.sleep, clock=time.monotonic):
+        self.gateway = gateway if gateway is not None else PaymentGateway()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.slow_call_threshold = slow_call_threshold
+        self.hedge_after = hedge_after
+        self.sleep = sleep
+        self.clock = clock
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="payment-hedge")
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "calls": 0, "successes": 0, "failures": 0, "slow_calls": 0, "retries": 0,
+            "short_circuited": 0, "hedged": 0, "latency_seconds_total": 0.0
+        }
+    
+    def _count(self, name: str, amount=1):
+        with self._metrics_lock:
+            self._metrics[name] += amount
+    
+    def metrics(self) -> Dict:
+        """Counters for calls, failures, retries, fast-fails and hedges, plus breaker state."""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["circuit_state"] = self.breaker.state
+        metrics["consecutive_failures"] = self.breaker.failures
+        return metrics
+    
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def _call_once(self, func):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("Payment gateway unavailable (circuit open); try again later")
+        
+        self._count("calls")
+        start = self.clock()
+        try:
+            result = func()
+        except Exception:
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._count("latency_seconds_total", self.clock() - start)
+        
+        if self.clock() - start > self.slow_call_threshold:
+            self._count("slow_calls")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self._count("successes")
+        return result
+    
+    def _call(self, func, retry_on):
+        attempt = 0
+        while True:
+            try:
+                return self._call_once(func)
+            except CircuitOpenError:
+                raise
+            except retry_on:
+                if attempt >= self.max_retries:
+                    raise
+                self._count("retries")
+                self.sleep(self._backoff(attempt))
+                attempt += 1
+    
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """PaymentGateway.process_payment behind the circuit breaker."""
+        return self._call(lambda: self.gateway.process_payment(patron_id=patron_id, amount=amount,
+                                                               description=description),
+                          retry_on=ConnectionRefusedError)
+    
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """PaymentGateway.refund_payment behind the circuit breaker."""
+        return self._call(lambda: self.gateway.refund_payment(transaction_id, amount),
+                          retry_on=ConnectionRefusedError)
+    
+    def _hedged_status(self, transaction_id: str) -> Dict:
+        if self.hedge_after is None:
+            return self.gateway.verify_payment_status(transaction_id)
+        
+        first = self._hedge_pool.submit(self.gateway.verify_payment_status, transaction_id)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        
+        self._count("hedged")
+        second = self._hedge_pool.submit(self.gateway.verify_payment_status, transaction_id)
+        done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None:
+            # the first answer was an error; fall back to the other request
+            loser = second if winner is first else first
+            return loser.result()
+        return winner.result()
+    
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        """PaymentGateway.verify_payment_status behind the circuit breaker, hedged and retried."""
+        return self._call(lambda: self._hedged_status(transaction_id), retry_on=Exception)
+
+
+_default_gateway = None
+_default_async_gateway = None
+_default_lock = threading.Lock()
+
+def get_payment_gateway() -> ResilientPaymentGateway:
+    """Get the shared gateway (with circuit breaker and retries) used when callers do not inject one."""
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            _default_gateway = ResilientPaymentGateway(PaymentGateway())
+        return _default_gateway
+
+def get_async_payment_gateway() -> AsyncPaymentGateway:
+    """Get the shared AsyncPaymentGateway used when callers do not inject one."""
+    global _default_async_gateway
+    with _default_lock:
+        if _default_async_gateway is None:
+            _default_async_gateway = AsyncPaymentGateway(get_payment_gateway())
+        return _default_async_gateway
+
+
+_GATEWAY_COUNTERS = {
+    'calls': 'Calls sent to the payment gateway.',
+    'failures': 'Payment gateway calls that raised.',
+    'slow_calls': 'Payment gateway calls slower than the slow-call threshold.',
+    'retries': 'Payment gateway calls retried after the connection was refused.',
+    'short_circuited': 'Payment gateway calls rejected while the circuit was open.',
+    'hedged': 'Status checks that sent a second, hedged request.',
+}
+
+def _gateway_gauges():
+    gateway = _default_gateway
+    if gateway is None:
+        return
+    stats = gateway.metrics()
+    yield ('library_gateway_circuit_open', 'gauge', 'Whether the payment gateway circuit breaker is open.',
+           int(stats['circuit_state'] != CircuitBreaker.CLOSED))
+    for name, help_text in _GATEWAY_COUNTERS.items():
+        yield f'library_gateway_{name}_total', 'counter', help_text, stats[name]
+
+metrics.register_collector(_gateway_gauges)
@@ -0,0 +1,12 @@
+import pytest
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def library_db(tmp_path, monkeypatch):
+    """Point the database layer at a fresh, empty library.db for every test."""
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'library.db'))
+    database.init_database()
+    yield database.DATABASE
+    database.close_db_pool()
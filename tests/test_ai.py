@@ -9,6 +9,7 @@ from services.library_service import (
     search_books_in_catalog,
     get_patron_status_report
 )
+from database import insert_book
 
 ### ---------- R1: Add Book To Catalog ---------- ###
 
@@ -53,55 +54,60 @@ def test_add_book_invalid_fields():
 
 ### ---------- R3: Borrow Book ---------- ###
 
-@patch('services.library_service.get_book_by_id')
-@patch('services.library_service.get_patron_borrow_count', return_value=4)
-@patch('services.library_service.insert_borrow_record', return_value=True)
-@patch('services.library_service.update_book_availability', return_value=True)
-def test_borrow_book_success(mock_update, mock_insert, mock_count, mock_get_book):
-    mock_get_book.return_value = {'title': 'Mock Book', 'available_copies': 3}
+@patch('services.library_service.borrow_book_transaction',
+       return_value=('borrowed', {'title': 'Mock Book', 'available_copies': 3}))
+def test_borrow_book_success(mock_borrow):
     success, message = borrow_book_by_patron("123456", 1)
     assert success
     assert "Successfully borrowed" in message
+    patron_id, book_id, borrow_date, due_date = mock_borrow.call_args.args
+    assert (patron_id, book_id) == ("123456", 1)
+    assert due_date - borrow_date == timedelta(days=14)
+    assert mock_borrow.call_args.kwargs == {'max_borrowed': 5}
 
 def test_borrow_book_invalid_patron_id():
     success, msg = borrow_book_by_patron("12A456", 1)
     assert not success and "Invalid patron ID. Must be exactly 6 digits." in msg
 
-@patch('services.library_service.get_book_by_id', return_value=None)
-def test_borrow_book_nonexistent(mock_get_book):
+@patch('services.library_service.borrow_book_transaction', return_value=('not_found', None))
+def test_borrow_book_nonexistent(mock_borrow):
     success, msg = borrow_book_by_patron("123456", 999)
     assert not success and "not found" in msg
 
-@patch('services.library_service.get_book_by_id', return_value={'available_copies': 0})
-def test_borrow_book_unavailable(mock_get_book):
+@patch('services.library_service.borrow_book_transaction', return_value=('unavailable', {'available_copies': 0}))
+def test_borrow_book_unavailable(mock_borrow):
     success, msg = borrow_book_by_patron("123456", 1)
     assert not success and "not available" in msg
 
-@patch('services.library_service.get_book_by_id', return_value={'available_copies': 2, 'title': 'Test'})
-@patch('services.library_service.get_patron_borrow_count', return_value=5)
-def test_borrow_book_limit_exceeded(mock_count, mock_get_book):
+@patch('services.library_service.borrow_book_transaction',
+       return_value=('limit_reached', {'available_copies': 2, 'title': 'Test'}))
+def test_borrow_book_limit_exceeded(mock_borrow):
     success, msg = borrow_book_by_patron("123456", 1)
     assert not success and "maximum borrowing limit" in msg
 
+@patch('services.library_service.borrow_book_transaction', return_value=('error', None))
+def test_borrow_book_database_error(mock_borrow):
+    success, msg = borrow_book_by_patron("123456", 1)
+    assert not success and "Database error" in msg
+
 
 ### ---------- R4: Return Book ---------- ###
 
-@patch('services.library_service.get_book_by_id', return_value={'title': 'Test', 'book_id': 1})
-@patch('services.library_service.get_patron_borrowed_books', return_value=[{'title': 'Test','book_id': 1}])
-@patch('services.library_service.update_book_availability', return_value=True)
-@patch('services.library_service.update_borrow_record_return_date', return_value=True)
-@patch('services.library_service.calculate_late_fee_for_book', return_value={
-    "fee_amount": 3.00,
-    "days_overdue": 6,
-    "status": "Overdue"
-})
-def test_return_book_success(mock_fee, mock_update_return, mock_update_avail, mock_get_borrowed, mock_get_book):
+@patch('services.library_service.get_patron_borrowed_books')
+@patch('services.library_service.return_book_transaction', return_value=('returned', {
+    'book_id': 1,
+    'borrow_date': (datetime.now() - timedelta(days=20)).isoformat()
+}))
+def test_return_book_success(mock_return, mock_get_borrowed):
     success, msg = return_book_by_patron("123456", 1)
     assert success
-    assert "late fee is 3.0 dollars" in msg
+    assert "6 days overdue, late fee is 3.0 dollars" in msg
+    mock_return.assert_called_once()
+    mock_get_borrowed.assert_not_called()
 
+@patch('services.library_service.return_book_transaction', return_value=('not_borrowed', None))
 @patch('services.library_service.get_book_by_id', return_value=None)
-def test_return_book_invalid_book(mock_get_book):
+def test_return_book_invalid_book(mock_get_book, mock_return):
     success, msg = return_book_by_patron("123456", 1)
     assert not success and "Book not found" in msg
 
@@ -111,11 +117,16 @@ def test_return_book_invalid_patron(mock_get_book):
     assert not success and "Invalid patron ID. Must be exactly 6 digits." in msg
 
 @patch('services.library_service.get_book_by_id', return_value={'title': 'Test'})
-@patch('services.library_service.get_patron_borrowed_books', return_value=[{'book_id': 2}])
-def test_return_book_not_borrowed(mock_get_borrowed, mock_get_book):
+@patch('services.library_service.return_book_transaction', return_value=('not_borrowed', None))
+def test_return_book_not_borrowed(mock_return, mock_get_book):
     success, msg = return_book_by_patron("123456", 1)
     assert not success and "does not currently own" in msg
 
+@patch('services.library_service.return_book_transaction', return_value=('error', None))
+def test_return_book_database_error(mock_return):
+    success, msg = return_book_by_patron("123456", 1)
+    assert not success and "Database error" in msg
+
 
 ### ---------- R5: Late Fee Calculation ---------- ###
 
@@ -157,35 +168,51 @@ def test_late_fee_invalid_book(mock_get_borrowed, mock_get_book):
 
 ### ---------- R6: Search Function ---------- ###
 
-@patch('services.library_service.get_all_books')
-def test_search_books_title_partial(mock_get_books):
-    mock_get_books.return_value = [
-        {'title': 'Python 101', 'author': 'John', 'isbn': '1234567890123'},
-        {'title': 'Flask Guide', 'author': 'Jane', 'isbn': '9876543210123'}
-    ]
+def _add_books(*books):
+    for title, author, isbn in books:
+        insert_book(title, author, isbn, 1, 1)
+
+def test_search_books_title_partial():
+    _add_books(('Python 101', 'John', '1234567890123'),
+               ('Flask Guide', 'Jane', '9876543210123'))
     results = search_books_in_catalog("python", "title")
     assert len(results) == 1
     assert results[0]['title'] == 'Python 101'
 
-@patch('services.library_service.get_all_books')
-def test_search_books_author_partial(mock_get_books):
-    mock_get_books.return_value = [
-        {'title': 'Python 101', 'author': 'John Smith', 'isbn': '1234567890123'},
-        {'title': 'Data Science', 'author': 'Johnny Appleseed', 'isbn': '2345678901234'}
-    ]
+def test_search_books_author_partial():
+    _add_books(('Python 101', 'John Smith', '1234567890123'),
+               ('Data Science', 'Johnny Appleseed', '2345678901234'))
     results = search_books_in_catalog("john", "author")
     assert len(results) == 2
 
-@patch('services.library_service.get_all_books')
-def test_search_books_isbn_exact(mock_get_books):
-    mock_get_books.return_value = [
-        {'title': 'Python', 'author': 'John', 'isbn': '1234567890123'},
-        {'title': 'Flask', 'author': 'Jane', 'isbn': '9876543210123'}
-    ]
+def test_search_books_isbn_exact():
+    _add_books(('Python', 'John', '1234567890123'),
+               ('Flask', 'Jane', '9876543210123'))
     results = search_books_in_catalog("1234567890123", "isbn")
     assert len(results) == 1
     assert results[0]['title'] == 'Python'
 
+def test_search_books_isbn_prefix():
+    _add_books(('Python', 'John', '1234567890123'),
+               ('Flask', 'Jane', '1234999999999'),
+               ('Django', 'Jim', '9876543210123'))
+    results = search_books_in_catalog("1234", "isbn")
+    assert [book['title'] for book in results] == ['Python', 'Flask']
+
+def test_search_books_word_prefixes_ranked():
+    _add_books(('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565'),
+               ('Great Expectations', 'Charles Dickens', '9780141439563'),
+               ('Great Great Grandmother', 'Ann Other', '9780000000001'))
+    results = search_books_in_catalog("great gat", "title")
+    assert [book['title'] for book in results] == ['The Great Gatsby']
+
+    results = search_books_in_catalog("great", "title")
+    assert results[0]['title'] == 'Great Great Grandmother'
+    assert len(results) == 3
+
+def test_search_books_unknown_type():
+    assert search_books_in_catalog("python", "publisher") is None
+
 
 ### ---------- R7: Patron Status Report ---------- ###
 
@@ -193,14 +220,13 @@ def test_search_books_isbn_exact(mock_get_books):
     {'book_id': 1, 'borrow_date': datetime.now() - timedelta(days=20)}
 ])
 @patch('services.library_service.get_patron_borrow_count', return_value=1)
-@patch('services.library_service.get_patron_history', return_value=[])
+@patch('services.library_service.get_patron_history_page', return_value=([], None))
 @patch('services.library_service.get_book_by_id', return_value={'title': 'Book'})
-@patch('services.library_service.calculate_late_fee_for_book', return_value={
-    "fee_amount": 5.00,
-    "days_overdue": 6,
-    "status": "Overdue"
-})
-def test_patron_status_with_fees(mock_fee, mock_get_book, mock_history, mock_count, mock_borrowed):
+def test_patron_status_with_fees(mock_get_book, mock_history, mock_count, mock_borrowed):
     result = get_patron_status_report("123456")
     assert result['books_borrowed'] == 1
-    assert result['total_late_fees'] == 5.00
\ No newline at end of file
+    assert result['borrowing_history'] == [] and result['borrowing_history_cursor'] is None
+    mock_history.assert_called_once()
+    assert result['total_late_fees'] == 3.00  # 6 days overdue at $0.50/day
+    mock_get_book.assert_not_called()
+    mock_borrowed.assert_called_once_with("123456")
\ No newline at end of file
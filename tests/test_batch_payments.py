@@ -0,0 +1,128 @@
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from database import insert_book, insert_borrow_record, get_payment_batch_items, claim_payment_batch_item
+from services.batch_payment_service import RateLimiter, create_late_fee_batch, run_late_fee_batch
+from services.library_service import pay_late_fees
+from services.payment_service import PaymentGateway
+
+NOW = datetime.now()
+
+
+def _overdue(patron_id, book_id, days_ago):
+    borrowed = NOW - timedelta(days=days_ago)
+    insert_borrow_record(patron_id, book_id, borrowed, borrowed + timedelta(days=14))
+
+def _gateway(side_effect=None):
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = side_effect or (
+        lambda patron_id, amount, description: (True, f"txn_{patron_id}", "Success"))
+    return gateway
+
+
+def test_batch_groups_fees_into_one_charge_per_patron():
+    _overdue("000001", 1, 20)   # 3.00
+    _overdue("000001", 2, 18)   # 2.00
+    _overdue("000002", 1, 16)   # 1.00
+    success, msg, batch_id = create_late_fee_batch()
+    assert success and "2 patron charges" in msg
+
+    gateway = _gateway()
+    success, msg, batch = run_late_fee_batch(batch_id, gateway, rate_limit=0)
+    assert success and batch['status'] == 'completed'
+    assert batch['items'] == {'paid': 2}
+
+    charges = sorted((c.kwargs['patron_id'], c.kwargs['amount']) for c in gateway.process_payment.call_args_list)
+    assert charges == [("000001", 5.0), ("000002", 1.0)]
+    items = get_payment_batch_items(batch_id)
+    assert [item['transaction_id'] for item in items] == ["txn_000001", "txn_000002"]
+
+def test_batch_records_declines_and_resumes_errors():
+    for n in range(1, 5):
+        _overdue(f"{n:06d}", 1, 20)
+    _, _, batch_id = create_late_fee_batch()
+
+    def flaky(patron_id, amount, description):
+        if patron_id == "000002":
+            raise ConnectionRefusedError("gateway unreachable")
+        if patron_id == "000003":
+            return False, "", "Payment declined"
+        if patron_id == "000004":
+            raise ConnectionResetError("connection reset")  # the charge may have been sent
+        return True, "txn_1", "Success"
+
+    success, msg, batch = run_late_fee_batch(batch_id, _gateway(flaky), rate_limit=0)
+    assert batch['status'] == 'open'
+    assert batch['items'] == {'paid': 1, 'error': 1, 'declined': 1, 'unknown': 1}
+
+    retry = _gateway()
+    success, msg, batch = run_late_fee_batch(batch_id, retry, rate_limit=0)
+    assert retry.process_payment.call_count == 1  # only the item that was never sent
+    assert batch['status'] == 'completed'
+    assert batch['items'] == {'paid': 2, 'declined': 1, 'unknown': 1}
+
+def test_batch_does_not_recharge_items_interrupted_mid_submit():
+    _overdue("000001", 1, 20)
+    _overdue("000002", 1, 20)
+    _, _, batch_id = create_late_fee_batch()
+    first = get_payment_batch_items(batch_id)[0]
+    claim_payment_batch_item(first['id'], ['pending'], NOW - timedelta(hours=1))  # crashed run
+
+    gateway = _gateway()
+    success, msg, batch = run_late_fee_batch(batch_id, gateway, rate_limit=0)
+    assert gateway.process_payment.call_count == 1
+    assert batch['items'] == {'paid': 1, 'unknown': 1}
+    assert batch['status'] == 'completed'
+
+def test_next_batch_only_bills_fees_accrued_since_the_last_one():
+    _overdue("000001", 1, 20)   # 3.00
+    _overdue("000002", 1, 20)   # 3.00
+    _, _, first = create_late_fee_batch(NOW)
+    run_late_fee_batch(first, _gateway(), rate_limit=0)
+
+    success, msg, second = create_late_fee_batch(NOW + timedelta(hours=1))
+    assert success and "0 patron charges" in msg
+
+    _, _, third = create_late_fee_batch(NOW + timedelta(days=2))  # day 7 at $0.50, day 8 at $1.00
+    gateway = _gateway()
+    run_late_fee_batch(third, gateway, rate_limit=0)
+    charges = sorted((c.kwargs['patron_id'], c.kwargs['amount']) for c in gateway.process_payment.call_args_list)
+    assert charges == [("000001", 1.5), ("000002", 1.5)]
+
+def test_declined_fees_are_billed_again_by_the_next_batch():
+    _overdue("000001", 1, 20)   # 3.00
+    _overdue("000002", 1, 20)   # 3.00
+    _, _, first = create_late_fee_batch(NOW)
+    run_late_fee_batch(first, _gateway(lambda patron_id, amount, description: (
+        (False, "", "Payment declined") if patron_id == "000002" else (True, "txn_1", "Success"))), rate_limit=0)
+
+    _, _, second = create_late_fee_batch(NOW)
+    items = get_payment_batch_items(second)
+    assert [(item['patron_id'], item['loan_count'], item['amount']) for item in items] == [("000002", 1, 3.0)]
+
+def test_batch_skips_fees_paid_at_the_desk_and_the_desk_skips_batched_fees():
+    insert_book("Overdue", "Author", "1234567890123", 2, 2)
+    _overdue("000001", 1, 20)   # 3.00
+    _overdue("000002", 1, 20)   # 3.00
+    desk = _gateway()
+    assert pay_late_fees("000001", 1, desk)[0]
+
+    _, _, batch_id = create_late_fee_batch(NOW)
+    items = get_payment_batch_items(batch_id)
+    assert [(item['patron_id'], item['amount']) for item in items] == [("000002", 3.0)]
+
+    success, message, _ = pay_late_fees("000002", 1, desk)
+    assert not success and "fee collection batch" in message
+    desk.process_payment.assert_called_once()
+
+def test_run_unknown_batch():
+    success, msg, batch = run_late_fee_batch(999, _gateway())
+    assert not success and "not found" in msg
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(20)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.wait()
+    assert time.perf_counter() - start >= 0.19
@@ -0,0 +1,401 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from database import (
+    get_db_connection, get_pool, configure_database, close_db_pool,
+    insert_book, get_book_by_isbn, get_book_by_id
+)
+
+
+### ---------- Connection pool ---------- ###
+
+def test_helpers_reuse_pooled_connection():
+    conn = get_db_connection()
+    conn.close()
+
+    insert_book("Pooled", "Author", "1234567890123", 2, 2)
+    book = get_book_by_isbn("1234567890123")
+    assert get_book_by_id(book['id'])['title'] == "Pooled"
+
+    again = get_db_connection()
+    assert again is conn
+    again.close()
+    assert get_pool().stats()['open'] == 1
+
+def test_pool_overflow_connection_is_closed_on_release():
+    configure_database(pool_size=1)
+    try:
+        first = get_db_connection()
+        overflow = get_db_connection()
+        assert overflow is not first
+        overflow.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            overflow.execute('SELECT 1')
+        first.close()
+        assert get_pool().stats() == {'size': 1, 'open': 1, 'idle': 1}
+    finally:
+        configure_database(pool_size=database.POOL_SIZE)
+
+def test_pool_discards_unhealthy_connection(monkeypatch):
+    conn = get_db_connection()
+    conn.close()
+    sqlite3.Connection.close(conn)  # simulate a connection that died while idle
+    monkeypatch.setattr(database, 'HEALTH_CHECK_INTERVAL', 0)
+
+    fresh = get_db_connection()
+    assert fresh is not conn
+    assert fresh.execute('SELECT 1').fetchone()[0] == 1
+    fresh.close()
+
+def test_release_rolls_back_uncommitted_work():
+    conn = get_db_connection()
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) "
+                 "VALUES ('Ghost', 'Nobody', '9999999999999', 1, 1)")
+    conn.close()
+    assert get_book_by_isbn("9999999999999") is None
+
+def test_failing_helper_hands_its_connection_back(monkeypatch):
+    def broken_fetch(cursor):
+        raise sqlite3.OperationalError('disk I/O error')
+    monkeypatch.setattr(database, '_fetch_books', broken_fetch)
+
+    for _ in range(database.POOL_SIZE + 1):
+        with pytest.raises(sqlite3.OperationalError):
+            database.get_books_page()
+    stats = get_pool().stats()
+    assert stats['open'] == stats['idle'] == 1
+
+def test_close_db_pool_disposes_connections():
+    conn = get_db_connection()
+    conn.close()
+    close_db_pool()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+### ---------- Storage pragmas ---------- ###
+
+def test_connections_use_wal_and_busy_timeout():
+    conn = get_db_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    conn.close()
+
+def test_configure_database_overrides_pragmas():
+    try:
+        configure_database(pragmas={'busy_timeout': 250, 'mmap_size': None})
+        conn = get_db_connection()
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 250
+        assert 'mmap_size' not in database.get_sqlite_pragmas()
+        assert database.SQLITE_PRAGMAS['mmap_size'] == 268435456
+        conn.close()
+    finally:
+        configure_database(pragmas={})
+
+def test_pragma_overrides_do_not_leak_into_the_next_app():
+    from app import create_app
+    create_app({'DATABASE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL'}})
+    create_app()
+    conn = get_db_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    conn.close()
+
+def test_invalid_pragma_rejected():
+    conn = sqlite3.connect(':memory:')
+    with pytest.raises(ValueError):
+        database.apply_pragmas(conn, {'journal_mode': 'WAL; DROP TABLE books'})
+    conn.close()
+
+
+### ---------- Schema migrations ---------- ###
+
+def _query_plan(sql, params=()):
+    conn = get_db_connection()
+    plan = ' '.join(row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    conn.close()
+    return plan
+
+def test_init_database_applies_all_migrations():
+    conn = get_db_connection()
+    assert database.get_schema_version(conn) == len(database.MIGRATIONS)
+    conn.close()
+
+    database.init_database()  # re-running is a no-op
+    conn = get_db_connection()
+    assert database.apply_migrations(conn) == len(database.MIGRATIONS)
+    conn.close()
+
+def test_open_loan_lookups_use_partial_index():
+    plan = _query_plan('SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL',
+                       ('123456',))
+    assert 'idx_borrow_records_open_loans' in plan
+
+def test_return_lookup_uses_partial_index():
+    plan = _query_plan('''
+        SELECT * FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+        ORDER BY borrow_date LIMIT 1''', ('123456', 1))
+    assert 'idx_borrow_records_open_loans' in plan
+
+def test_history_lookup_uses_patron_index():
+    plan = _query_plan('SELECT * FROM borrow_records WHERE patron_id = ? ORDER BY borrow_date', ('123456',))
+    assert 'idx_borrow_records_patron_history' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_history_page_uses_patron_index():
+    plan = _query_plan('''
+        SELECT br.id FROM borrow_records br JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ? AND (br.borrow_date, br.id) > (?, ?)
+        ORDER BY br.borrow_date, br.id LIMIT 21''', ('123456', '2026-01-01', 1))
+    assert 'idx_borrow_records_patron_history' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+### ---------- Epoch timestamps ---------- ###
+
+def test_epoch_columns_follow_iso_dates():
+    insert_book("Epoch", "Author", "1234567890123", 1, 1)
+    borrowed = datetime(2026, 3, 1, 12, 30, 15, 250000)
+    database.insert_borrow_record("123456", 1, borrowed, borrowed + timedelta(days=14))
+    conn = get_db_connection()
+    conn.execute("INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) "
+                 "VALUES ('654321', 1, '2026-01-02T03:04:05', '2026-01-16T03:04:05')")
+    conn.commit()
+    rows = conn.execute('SELECT borrow_ts, due_ts, return_ts FROM borrow_records ORDER BY id').fetchall()
+    conn.close()
+
+    assert tuple(rows[0]) == (database.to_epoch(borrowed), database.to_epoch(borrowed) + 14 * 86400, None)
+    assert database.from_epoch(rows[1]['borrow_ts']) == datetime(2026, 1, 2, 3, 4, 5)
+
+    database.update_borrow_record_return_date("123456", 1, borrowed + timedelta(days=1))
+    conn = get_db_connection()
+    assert conn.execute('SELECT return_ts FROM borrow_records WHERE id = 1').fetchone()[0] == \
+        database.to_epoch(borrowed) + 86400
+    conn.close()
+
+def test_overdue_loans_are_an_index_range():
+    plan = _query_plan(f'SELECT id FROM borrow_records WHERE {database.OVERDUE_LOAN_PREDICATE} '
+                       'AND (due_ts, id) > (?, ?) ORDER BY due_ts, id LIMIT 10', (100, 0, 0))
+    assert 'idx_borrow_records_overdue' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_overdue_loans_page_filters_by_days_overdue():
+    as_of = datetime(2026, 6, 1, 12, 0)
+    insert_book("Late", "Author", "1234567890123", 6, 0)
+    for n, days in enumerate([1, 3, 3, 10, 40]):
+        database.insert_borrow_record(f"{n:06d}", 1, as_of - timedelta(days=days + 14),
+                                      as_of - timedelta(days=days))
+    database.insert_borrow_record("999999", 1, as_of, as_of + timedelta(days=14))
+
+    loans, cursor = database.get_overdue_loans_page(as_of, limit=2)
+    assert [loan['days_overdue'] for loan in loans] == [40, 10]
+    seen = loans
+    while cursor:
+        loans, cursor = database.get_overdue_loans_page(as_of, cursor=cursor, limit=2)
+        seen += loans
+    assert [loan['days_overdue'] for loan in seen] == [40, 10, 3, 3, 1]
+    assert seen[0]['title'] and isinstance(seen[0]['due_date'], datetime)
+
+    loans, _ = database.get_overdue_loans_page(as_of, min_days=3, max_days=10)
+    assert [loan['days_overdue'] for loan in loans] == [10, 3, 3]
+    with pytest.raises(ValueError):
+        database.get_overdue_loans_page(as_of, cursor=database.encode_cursor('x', 1))
+
+
+### ---------- Atomic borrow and return ---------- ###
+
+def _add_book(isbn="1234567890123", copies=1):
+    insert_book("Atomic", "Author", isbn, copies, copies)
+    return get_book_by_isbn(isbn)['id']
+
+def test_borrow_transaction_takes_copy_and_records_loan():
+    book_id = _add_book(copies=2)
+    now = datetime.now()
+    status, book = database.borrow_book_transaction("123456", book_id, now, now + timedelta(days=14), 5)
+    assert status == 'borrowed' and book['title'] == "Atomic"
+    assert get_book_by_id(book_id)['available_copies'] == 1
+    assert database.get_patron_borrow_count("123456") == 1
+
+def test_borrow_transaction_rejects_unavailable_and_limit():
+    book_id = _add_book(copies=1)
+    now = datetime.now()
+    assert database.borrow_book_transaction("000001", 999, now, now, 5)[0] == 'not_found'
+    assert database.borrow_book_transaction("000001", book_id, now, now, 0)[0] == 'limit_reached'
+    assert database.borrow_book_transaction("000001", book_id, now, now, 5)[0] == 'borrowed'
+    assert database.borrow_book_transaction("000002", book_id, now, now, 5)[0] == 'unavailable'
+
+def test_concurrent_borrowers_cannot_share_last_copy():
+    book_id = _add_book(copies=1)
+    now = datetime.now()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(
+            lambda n: database.borrow_book_transaction(f"{n:06d}", book_id, now, now, 5)[0], range(8)))
+    assert statuses.count('borrowed') == 1
+    assert statuses.count('unavailable') == 7
+    assert get_book_by_id(book_id)['available_copies'] == 0
+
+def test_return_transaction_closes_loan_and_restores_copy():
+    book_id = _add_book(copies=1)
+    now = datetime.now()
+    database.borrow_book_transaction("123456", book_id, now, now + timedelta(days=14), 5)
+
+    status, loan = database.return_book_transaction("123456", book_id, now)
+    assert status == 'returned'
+    assert loan['return_date'] == now.isoformat()
+    assert get_book_by_id(book_id)['available_copies'] == 1
+    assert database.return_book_transaction("123456", book_id, now) == ('not_borrowed', None)
+
+
+### ---------- Open-loan counters ---------- ###
+
+def test_open_loan_counter_follows_borrow_records():
+    book_id = _add_book(copies=3)
+    now = datetime.now()
+    database.insert_borrow_record("123456", book_id, now, now)
+    database.borrow_book_transaction("123456", book_id, now, now, 5)
+    assert database.get_patron_borrow_count("123456") == 2
+
+    database.update_borrow_record_return_date("123456", book_id, now)
+    assert database.get_patron_borrow_count("123456") == 0
+    assert database.get_patron_borrow_count("654321") == 0
+
+def test_borrow_limit_uses_counter_lookup():
+    plan = _query_plan('SELECT open_loans FROM patrons WHERE patron_id = ?', ('123456',))
+    assert 'PRIMARY KEY' in plan or 'sqlite_autoindex_patrons' in plan
+
+def test_rebuild_patron_loan_counters_repairs_drift():
+    book_id = _add_book(copies=2)
+    now = datetime.now()
+    database.insert_borrow_record("123456", book_id, now, now)
+    conn = get_db_connection()
+    conn.execute("UPDATE patrons SET open_loans = 7")
+    conn.execute("INSERT INTO patrons (patron_id, open_loans) VALUES ('000009', 2)")
+    conn.commit()
+    conn.close()
+
+    assert database.rebuild_patron_loan_counters() == 2
+    assert database.get_patron_borrow_count("123456") == 1
+    assert database.get_patron_borrow_count("000009") == 0
+    assert database.rebuild_patron_loan_counters() == 0
+
+def test_rebuild_loan_counters_cli_command():
+    from app import create_app
+    result = create_app().test_cli_runner().invoke(args=['rebuild-loan-counters'])
+    assert result.exit_code == 0
+    assert "0 patrons were out of step" in result.output
+
+
+### ---------- Full-text search ---------- ###
+
+def test_search_index_follows_book_changes():
+    book_id = _add_book()
+    assert [b['id'] for b in database.search_books("atom", 'title')] == [book_id]
+
+    conn = get_db_connection()
+    conn.execute("UPDATE books SET title = 'Renamed' WHERE id = ?", (book_id,))
+    conn.commit()
+    assert database.search_books("atom", 'title') == []
+    assert database.search_books("renam", 'title')[0]['id'] == book_id
+
+    conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+    conn.commit()
+    conn.close()
+    assert database.search_books("renamed", 'title') == []
+
+def test_search_ignores_fts_syntax_in_input():
+    _add_book()
+    assert database.search_books('"atomic*', 'title')[0]['title'] == "Atomic"
+    assert database.search_books('***', 'author') == []
+
+
+### ---------- Catalog pagination ---------- ###
+
+def test_books_page_walks_catalog_in_title_order():
+    for n, title in enumerate(["Delta", "Alpha", "Charlie", "Alpha", "Bravo"]):
+        insert_book(title, "Author", f"{n:013d}", 1, 1)
+
+    seen = []
+    books, cursor = database.get_books_page(limit=2)
+    seen += books
+    while cursor:
+        books, cursor = database.get_books_page(cursor, limit=2)
+        seen += books
+    assert [(b['title'], b['id']) for b in seen] == [
+        ("Alpha", 2), ("Alpha", 4), ("Bravo", 5), ("Charlie", 3), ("Delta", 1)]
+
+def test_books_page_rejects_bad_cursor():
+    with pytest.raises(ValueError):
+        database.get_books_page("not-a-cursor")
+
+def test_books_page_uses_title_index():
+    plan = _query_plan('SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT 5', ('A', 1))
+    assert 'idx_books_title_id' in plan
+
+
+### ---------- Book lookup cache ---------- ###
+
+def test_book_lookups_are_cached_until_invalidated():
+    book_id = _add_book(copies=2)
+    database.clear_book_cache()
+    before = database.get_book_cache_stats()
+
+    get_book_by_id(book_id)
+    get_book_by_id(book_id)
+    get_book_by_isbn("1234567890123")
+    stats = database.get_book_cache_stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 2
+
+    database.update_book_availability(book_id, -1)
+    assert get_book_by_isbn("1234567890123")['available_copies'] == 1
+    now = datetime.now()
+    database.borrow_book_transaction("123456", book_id, now, now, 5)
+    assert get_book_by_id(book_id)['available_copies'] == 0
+    database.return_book_transaction("123456", book_id, now)
+    assert get_book_by_id(book_id)['available_copies'] == 1
+
+def test_book_cache_shares_read_only_books_and_skips_misses():
+    book_id = _add_book()
+    book = get_book_by_id(book_id)
+    with pytest.raises(TypeError):
+        book['title'] = "Changed"
+    with pytest.raises(AttributeError):
+        book.available_copies = 99
+    assert get_book_by_id(book_id) is book and book.available_copies == 1
+
+    assert get_book_by_isbn("9999999999999") is None
+    insert_book("Late", "Author", "9999999999999", 1, 1)
+    assert get_book_by_isbn("9999999999999")['title'] == "Late"
+
+def test_book_cache_is_bounded_and_expires(monkeypatch):
+    cache = database.BookCache(size=2, ttl=60.0)
+    for n in range(3):
+        cache.put({'id': n, 'isbn': f"{n:013d}"}, cache.generation)
+    assert cache.get(book_id=0) is None
+    assert cache.get(isbn="0000000000002")['id'] == 2
+
+    clock = [0.0]
+    monkeypatch.setattr(database.time, 'monotonic', lambda: clock[0])
+    cache = database.BookCache(size=2, ttl=5.0)
+    cache.put({'id': 1, 'isbn': "1"}, cache.generation)
+    clock[0] = 5.0
+    assert cache.get(book_id=1) is None
+
+def test_book_cache_ignores_reads_that_raced_a_write():
+    cache = database.BookCache()
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put({'id': 1, 'isbn': "1"}, generation)
+    assert cache.get(book_id=1) is None
+
+def test_book_cache_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(database._book_cache, 'size', database._book_cache.size)
+    configure_database(book_cache_size=0)
+    book_id = _add_book()
+    get_book_by_id(book_id)
+    assert database.get_book_cache_stats()['cached'] == 0
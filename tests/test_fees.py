@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import (
+    insert_book, get_book_by_isbn, borrow_book_transaction, insert_borrow_record,
+    update_borrow_record_return_date, get_patron_fee_summary
+)
+from services.fee_service import (
+    late_fee_for_days, calculate_loan_fee, calculate_late_fees, calculate_patron_late_fees,
+    sweep_overdue_fees
+)
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.mark.parametrize('days, fee', [(0, 0.0), (1, 0.5), (7, 3.5), (8, 4.5), (18, 14.5), (19, 15.0), (90, 15.0)])
+def test_late_fee_tiers(days, fee):
+    assert late_fee_for_days(days) == fee
+
+def test_loan_fee_matches_single_book_rules():
+    assert calculate_loan_fee(NOW - timedelta(days=30), NOW) == {
+        'fee_amount': 12.5, 'days_overdue': 16, 'status': 'Overdue'}
+    assert calculate_loan_fee(NOW - timedelta(days=10), NOW)['status'] == 'Not Overdue'
+
+def test_batch_fees_keep_input_order():
+    loans = [{'book_id': 3, 'borrow_date': NOW - timedelta(days=21)},
+             {'book_id': 1, 'borrow_date': NOW - timedelta(days=2)},
+             {'book_id': 3, 'borrow_date': NOW - timedelta(days=60)}]
+    fees = calculate_late_fees(loans, NOW)
+    assert [(fee['book_id'], fee['fee_amount']) for fee in fees] == [(3, 3.5), (1, 0.0), (3, 15.0)]
+
+def test_patron_late_fees_from_database():
+    for n in range(3):
+        insert_book(f"Fee Book {n}", "Author", f"{n:013d}", 1, 1)
+        book_id = get_book_by_isbn(f"{n:013d}")['id']
+        borrowed = datetime.now() - timedelta(days=15 + 5 * n)
+        borrow_book_transaction("123456", book_id, borrowed, borrowed + timedelta(days=14), 5)
+
+    result = calculate_patron_late_fees("123456")
+    assert [fee['fee_amount'] for fee in result['fees']] == [7.5, 3.0, 0.5]
+    assert result['total_late_fees'] == 11.0
+
+
+### ---------- Overdue sweep ---------- ###
+
+def _loan(patron_id, book_id, days_ago, returned=False):
+    borrowed = NOW - timedelta(days=days_ago)
+    insert_borrow_record(patron_id, book_id, borrowed, borrowed + timedelta(days=14))
+    if returned:
+        update_borrow_record_return_date(patron_id, book_id, NOW)
+
+def test_sweep_matches_per_loan_fees():
+    _loan("000001", 1, 20)           # 6 days overdue: 3.00
+    _loan("000001", 2, 60)           # capped: 15.00
+    _loan("000002", 1, 16)           # 2 days overdue: 1.00
+    _loan("000002", 3, 5)            # not overdue
+    _loan("000003", 1, 40, returned=True)
+
+    result = sweep_overdue_fees(as_of=NOW, chunk_size=2)
+    assert result == {'as_of': NOW.isoformat(), 'loans': 3, 'patrons': 2, 'total_late_fees': 19.0}
+    assert get_patron_fee_summary("000001")['total_late_fees'] == 18.0
+    assert get_patron_fee_summary("000002")['overdue_loans'] == 1
+    assert get_patron_fee_summary("000003") is None
+
+def test_sweep_replaces_previous_summary():
+    _loan("000001", 1, 20)
+    sweep_overdue_fees(as_of=NOW)
+    update_borrow_record_return_date("000001", 1, NOW)
+    assert sweep_overdue_fees(as_of=NOW)['patrons'] == 0
+    assert get_patron_fee_summary("000001") is None
+
+def test_sweep_cli_command():
+    from app import create_app
+    _loan("000001", 1, 20)
+    result = create_app().test_cli_runner().invoke(args=['sweep-overdue-fees'])
+    assert result.exit_code == 0
+    assert "overdue loans" in result.output
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+from services.payment_service import CircuitBreaker, CircuitOpenError, ResilientPaymentGateway
+from services.library_service import pay_late_fees
+
+
+class FakeGateway:
+    """Local payment provider that injects latency, failures and stuck status checks on request."""
+
+    def __init__(self, failures=0, error=ConnectionRefusedError, delay=0.0, stuck_status_calls=0):
+        self.failures = failures
+        self.error = error
+        self.delay = delay
+        self.stuck_status_calls = stuck_status_calls
+        self.release = threading.Event()  # unblocks the stuck status checks
+        self.calls = 0
+        self.status_calls = 0
+        self.lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self.lock:
+            self.calls += 1
+            if self.failures > 0:
+                self.failures -= 1
+                raise self.error("provider unavailable")
+        time.sleep(self.delay)
+
+    def process_payment(self, patron_id, amount, description=""):
+        self._maybe_fail()
+        if amount > 1000:
+            return False, "", "Payment declined: amount exceeds limit"
+        return True, f"txn_{patron_id}", f"Payment of ${amount:.2f} processed successfully"
+
+    def refund_payment(self, transaction_id, amount):
+        self._maybe_fail()
+        return True, "Refunded"
+
+    def verify_payment_status(self, transaction_id):
+        with self.lock:
+            self.status_calls += 1
+            call = self.status_calls
+        if call <= self.stuck_status_calls:
+            self.release.wait(timeout=10)
+        return {"transaction_id": transaction_id, "status": "completed", "call": call}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_retries_connection_errors_with_backoff():
+    fake = FakeGateway(failures=2)
+    delays = []
+    gateway = ResilientPaymentGateway(fake, max_retries=2, base_delay=0.1, sleep=delays.append)
+
+    success, txn, _ = gateway.process_payment("123456", 5.0)
+
+    assert success and txn == "txn_123456"
+    assert fake.calls == 3
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 0.1 and 0 <= delays[1] <= 0.2
+    assert gateway.metrics()["retries"] == 2
+
+
+@pytest.mark.parametrize("error", [TimeoutError, ConnectionResetError, BrokenPipeError, ConnectionAbortedError])
+def test_charge_not_retried_on_ambiguous_errors(error):
+    fake = FakeGateway(failures=2, error=error)
+    gateway = ResilientPaymentGateway(fake, sleep=lambda s: None)
+
+    with pytest.raises(error):
+        gateway.process_payment("123456", 5.0)
+    with pytest.raises(error):
+        gateway.refund_payment("txn_123456", 5.0)
+    assert fake.calls == 2
+
+
+def test_declined_payment_is_not_a_failure():
+    fake = FakeGateway()
+    gateway = ResilientPaymentGateway(fake, failure_threshold=1, sleep=lambda s: None)
+
+    success, _, message = gateway.process_payment("123456", 5000.0)
+
+    assert not success and "declined" in message
+    assert fake.calls == 1
+    assert gateway.metrics()["circuit_state"] == "closed"
+
+
+def test_open_circuit_fails_fast_then_recovers():
+    clock = FakeClock()
+    fake = FakeGateway(failures=3)
+    gateway = ResilientPaymentGateway(fake, max_retries=0, failure_threshold=3, reset_timeout=30.0,
+                                      sleep=lambda s: None, clock=clock)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionRefusedError):
+            gateway.process_payment("123456", 5.0)
+    assert gateway.metrics()["circuit_state"] == "open"
+
+    with pytest.raises(CircuitOpenError):
+        gateway.process_payment("123456", 5.0)
+    assert fake.calls == 3
+    assert gateway.metrics()["short_circuited"] == 1
+
+    clock.now = 31.0
+    success, _, _ = gateway.process_payment("123456", 5.0)
+    assert success
+    assert gateway.metrics()["circuit_state"] == "closed"
+
+
+def test_half_open_failure_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call while half-open
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_slow_calls_trip_the_breaker():
+    fake = FakeGateway(delay=0.05)
+    gateway = ResilientPaymentGateway(fake, failure_threshold=2, slow_call_threshold=0.01,
+                                      sleep=lambda s: None)
+
+    gateway.process_payment("123456", 5.0)
+    gateway.process_payment("123456", 5.0)
+
+    metrics = gateway.metrics()
+    assert metrics["slow_calls"] == 2
+    assert metrics["circuit_state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        gateway.process_payment("123456", 5.0)
+
+
+def test_status_check_is_hedged():
+    fake = FakeGateway(stuck_status_calls=1)
+    gateway = ResilientPaymentGateway(fake, hedge_after=0.05)
+
+    status = gateway.verify_payment_status("txn_1")
+    fake.release.set()
+
+    assert status["status"] == "completed"
+    assert status["call"] == 2  # answered by the hedged request while the first was still stuck
+    assert fake.status_calls == 2
+    assert gateway.metrics()["hedged"] == 1
+
+
+def test_pay_late_fees_reports_open_circuit(monkeypatch):
+    monkeypatch.setattr('services.library_service.calculate_late_fee_for_book',
+                        lambda patron_id, book_id: {'fee_amount': 3.0, 'days_overdue': 6, 'status': 'Overdue'})
+    monkeypatch.setattr('services.library_service.get_book_by_id', lambda book_id: {'title': 'Book'})
+    gateway = ResilientPaymentGateway(FakeGateway(), failure_threshold=1)
+    gateway.breaker.record_failure()
+
+    success, message, txn = pay_late_fees("123456", 1, gateway)
+
+    assert not success
+    assert "circuit open" in message
+    assert txn is None
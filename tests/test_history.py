@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from database import insert_book, insert_borrow_record, update_borrow_record_return_date
+from services.library_service import (
+    get_patron_borrowing_history, iter_patron_borrowing_history, get_patron_history_summary,
+    get_patron_status_report
+)
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+def _history(patron_id="123456", loans=5):
+    insert_book("History", "Author", "1234567890123", 10, 10)
+    for n in range(loans):
+        borrowed = NOW - timedelta(days=400 - 60 * n)
+        insert_borrow_record(patron_id, 1, borrowed, borrowed + timedelta(days=14))
+        if n < loans - 1:
+            update_borrow_record_return_date(patron_id, 1, borrowed + timedelta(days=14 + n))
+
+
+def test_history_pages_cover_every_loan_in_order():
+    _history(loans=5)
+    insert_borrow_record("654321", 1, NOW, NOW)
+
+    seen, cursor = [], None
+    while True:
+        loans, cursor = get_patron_borrowing_history("123456", cursor, limit=2)
+        seen += loans
+        if cursor is None:
+            break
+    assert len(seen) == 5
+    assert [loan['borrow_date'] for loan in seen] == sorted(loan['borrow_date'] for loan in seen)
+    assert seen[-1]['return_date'] is None
+    assert [loan['borrow_date'] for loan in iter_patron_borrowing_history("123456")] == \
+        [loan['borrow_date'] for loan in seen]
+
+
+def test_history_rejects_bad_input():
+    assert get_patron_borrowing_history("12345") is None
+    assert iter_patron_borrowing_history("abcdef") is None
+    with pytest.raises(ValueError):
+        get_patron_borrowing_history("123456", cursor="bogus")
+
+
+def test_history_summary_counts_years_and_fees():
+    _history(loans=5)
+    summary = get_patron_history_summary("123456", today=NOW)
+
+    assert summary['total_loans'] == 5
+    assert summary['loans_per_year'] == {2025: 5}
+    # returned 0..3 days late (3 late loans: 1, 2 and 3 days), the open loan 146 days late
+    assert summary['late_loans'] == 4
+    assert summary['total_late_fees'] == 0.5 + 1.0 + 1.5 + 15.0
+
+
+def test_status_report_returns_first_history_page():
+    _history(loans=25)
+    report = get_patron_status_report("123456")
+    assert len(report['borrowing_history']) == 20
+    loans, cursor = get_patron_borrowing_history("123456", report['borrowing_history_cursor'])
+    assert len(loans) == 5 and cursor is None
+
+
+def test_history_api():
+    client = create_app().test_client()
+    _history("654321", loans=3)
+
+    page = client.get('/api/patron/654321/history?limit=2').get_json()
+    assert page['count'] == 2
+    page = client.get(f"/api/patron/654321/history?cursor={page['next_cursor']}").get_json()
+    assert page['count'] == 1 and page['next_cursor'] is None
+
+    assert client.get('/api/patron/654321/history?cursor=bogus').status_code == 400
+    assert client.get('/api/patron/12/history').status_code == 400
+    assert client.get('/api/patron/654321/history/summary').get_json()['total_loans'] == 3
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from database import get_book_by_isbn, insert_book, search_books
+from services.import_service import import_catalog_feed
+
+CSV_FEED = """title,author,isbn,total_copies
+Dune,Frank Herbert,9780441013593,3
+,No Title,9780000000001,1
+Neuromancer,William Gibson,9780441569595,2
+Short ISBN,Someone,123,1
+Dune Again,Frank Herbert,9780441013593,1
+Zero Copies,Someone,9780000000002,0
+"""
+
+
+def test_csv_import_validates_and_dedupes():
+    insert_book("Existing", "Author", "9780441569595", 1, 1)
+
+    report = import_catalog_feed(io.StringIO(CSV_FEED), 'csv', chunk_size=2)
+
+    assert report['rows'] == 6
+    assert report['imported'] == 1
+    assert report['rejected_count'] == 5
+    assert {(r['line'], r['reason']) for r in report['rejected']} == {
+        (3, "Title is required."),
+        (4, "A book with this ISBN already exists."),
+        (5, "ISBN must be exactly 13 digits."),
+        (6, "A book with this ISBN already exists."),
+        (7, "Total copies must be a positive integer."),
+    }
+    dune = get_book_by_isbn("9780441013593")
+    assert (dune['title'], dune['total_copies'], dune['available_copies']) == ("Dune", 3, 3)
+    assert search_books("dune", 'title')[0]['isbn'] == "9780441013593"
+
+
+def test_jsonl_import_reports_bad_lines():
+    feed = "\n".join([
+        json.dumps({'title': 'Emma', 'author': 'Jane Austen', 'isbn': '9780141439587', 'total_copies': 2}),
+        "{not json",
+        "",
+        json.dumps(['a', 'list']),
+        json.dumps({'title': 'Persuasion', 'author': 'Jane Austen', 'isbn': '9780141439686', 'total_copies': '1'}),
+    ])
+
+    report = import_catalog_feed(io.StringIO(feed), 'jsonl')
+
+    assert report['imported'] == 2
+    assert [(r['line'], r['reason']) for r in report['rejected']] == [
+        (2, "Invalid JSON."), (4, "Each line must be a JSON object.")]
+    assert get_book_by_isbn("9780141439686")['total_copies'] == 1
+
+
+def test_import_caps_reported_rejects():
+    feed = "title,author,isbn,total_copies\n" + "Bad,Author,1,1\n" * 5
+    report = import_catalog_feed(io.StringIO(feed), 'csv', max_rejects=2)
+    assert report['rejected_count'] == 5
+    assert len(report['rejected']) == 2
+
+
+def test_import_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        import_catalog_feed(io.StringIO(""), 'xml')
+
+
+def test_import_cli_command(tmp_path):
+    from app import create_app
+    feed = tmp_path / "feed.csv"
+    feed.write_text(CSV_FEED)
+    rejects = tmp_path / "rejects.csv"
+
+    result = create_app().test_cli_runner().invoke(
+        args=['import-books', str(feed), '--rejects', str(rejects)])
+
+    assert result.exit_code == 0
+    assert "Imported 2 of 6 rows; 4 rejected." in result.output
+    assert rejects.read_text().count("\n") == 5
@@ -0,0 +1,93 @@
+import pytest
+
+import database
+import metrics
+from app import create_app
+from database import insert_book, get_book_by_isbn
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _series(name, **labels):
+    for key, data in metrics.HISTOGRAMS[name].series().items():
+        if all(item in key for item in labels.items()):
+            return data
+    return None
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(seconds, kind='x')
+    data = histogram.series()[(('kind', 'x'),)]
+    assert data['buckets'] == [(0.1, 1), (1.0, 3)]
+    assert data['count'] == 4
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{kind="x",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{kind="x"} 6.05' in lines
+
+
+@pytest.mark.parametrize('sql, label', [
+    ('SELECT * FROM books WHERE id = ?', 'SELECT books'),
+    ('\n  UPDATE books SET available_copies = 0', 'UPDATE books'),
+    ('INSERT INTO borrow_records (patron_id) VALUES (?)', 'INSERT borrow_records'),
+    ('PRAGMA busy_timeout = 5000', 'PRAGMA busy_timeout'),
+    ('BEGIN IMMEDIATE', 'BEGIN'),
+])
+def test_statement_labels(sql, label):
+    assert metrics.statement_label(sql) == label
+
+
+def test_timed_records_outcome_and_generators():
+    @metrics.timed(metrics.GATEWAY_CALL_SECONDS, method='boom')
+    def boom():
+        raise ConnectionError
+
+    @metrics.timed(metrics.DB_HELPER_SECONDS, helper='numbers')
+    def numbers():
+        yield from range(3)
+
+    with pytest.raises(ConnectionError):
+        boom()
+    assert list(numbers()) == [0, 1, 2]
+    assert _series(metrics.GATEWAY_CALL_SECONDS, method='boom', outcome='error')['count'] == 1
+    assert _series(metrics.DB_HELPER_SECONDS, helper='numbers', outcome='ok')['count'] == 1
+
+
+def test_database_helpers_and_queries_are_timed():
+    insert_book("Timed", "Author", "1234567890123", 1, 1)
+    database.clear_book_cache()
+    get_book_by_isbn("1234567890123")
+
+    assert _series(metrics.DB_HELPER_SECONDS, helper='insert_book', outcome='ok')['count'] == 1
+    assert _series(metrics.DB_HELPER_SECONDS, helper='get_book_by_isbn')['count'] == 1
+    assert _series(metrics.DB_QUERY_SECONDS, statement='INSERT books')['count'] == 1
+    assert _series(metrics.DB_QUERY_SECONDS, statement='SELECT books')['count'] >= 1
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    insert_book("Untimed", "Author", "1234567890123", 1, 1)
+    assert metrics.HISTOGRAMS[metrics.DB_HELPER_SECONDS].series() == {}
+
+
+def test_metrics_endpoint_exposes_request_timings():
+    client = create_app().test_client()
+    client.get('/catalog')
+    client.get('/no-such-page')
+
+    response = client.get('/metrics')
+    body = response.data.decode()
+    assert response.status_code == 200
+    assert '# TYPE library_http_request_duration_seconds histogram' in body
+    assert 'library_http_request_duration_seconds_count{endpoint="/catalog",method="GET",status="200"} 1' in body
+    assert 'endpoint="unmatched"' in body
+    assert 'helper="get_books_page"' in body
+    assert 'library_book_cache_hits_total' in body
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from database import get_payment_by_key
+from services.payment_service import AsyncPaymentGateway
+from services.library_service import pay_late_fees_async, pay_late_fees_concurrently
+
+
+class StubGateway:
+    """Local stand-in for the payment provider that answers after a fixed delay."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def process_payment(self, patron_id, amount, description=""):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return True, f"txn_{patron_id}", f"Payment of ${amount:.2f} processed successfully"
+
+    def refund_payment(self, transaction_id, amount):
+        return True, "Refunded"
+
+    def verify_payment_status(self, transaction_id):
+        return {"transaction_id": transaction_id, "status": "completed"}
+
+
+class BarrierGateway(StubGateway):
+    """Stub whose charges only complete once `parties` of them are at the gateway at once."""
+
+    def __init__(self, parties):
+        super().__init__(delay=0)
+        self.barrier = threading.Barrier(parties, timeout=10)
+
+    def process_payment(self, patron_id, amount, description=""):
+        self.barrier.wait()  # raises BrokenBarrierError if the calls were not concurrent
+        return super().process_payment(patron_id, amount, description)
+
+
+def test_async_gateway_runs_payments_concurrently():
+    stub = BarrierGateway(10)
+
+    async def run():
+        async with AsyncPaymentGateway(stub, max_concurrency=10) as gateway:
+            return await asyncio.gather(*(
+                gateway.process_payment(f"{n:06d}", 1.0) for n in range(10)))
+
+    results = asyncio.run(run())
+    assert [txn for _, txn, _ in results] == [f"txn_{n:06d}" for n in range(10)]
+
+def test_async_gateway_respects_concurrency_limit():
+    stub = StubGateway(delay=0.05)
+
+    async def run():
+        async with AsyncPaymentGateway(stub, max_concurrency=3) as gateway:
+            await asyncio.gather(*(gateway.process_payment("123456", 1.0) for _ in range(9)))
+
+    asyncio.run(run())
+    assert stub.max_in_flight == 3
+
+def test_async_gateway_times_out_slow_calls():
+    async def run():
+        async with AsyncPaymentGateway(StubGateway(delay=0.5), timeout=0.05) as gateway:
+            await gateway.process_payment("123456", 1.0)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+
+def test_timed_out_calls_keep_their_worker_until_it_is_free():
+    class HungThenFastGateway(StubGateway):
+        def process_payment(self, patron_id, amount, description=""):
+            if patron_id == "999999":
+                time.sleep(0.3)
+            return True, f"txn_{patron_id}", "Success"
+
+    async def run():
+        async with AsyncPaymentGateway(HungThenFastGateway(), max_concurrency=2, timeout=0.1) as gateway:
+            hung = await asyncio.gather(*(gateway.process_payment("999999", 1.0) for _ in range(2)),
+                                        return_exceptions=True)
+            return hung, await gateway.process_payment("123456", 1.0)
+
+    hung, fast = asyncio.run(run())
+    assert all(isinstance(result, TimeoutError) for result in hung)
+    assert fast == (True, "txn_123456", "Success")
+
+def test_async_gateway_reusable_across_event_loops():
+    gateway = AsyncPaymentGateway(StubGateway(delay=0), max_concurrency=1)
+
+    async def run():
+        return await asyncio.gather(gateway.verify_payment_status("txn_1"),
+                                    gateway.verify_payment_status("txn_2"))
+
+    for _ in range(2):
+        statuses = asyncio.run(run())
+        assert [s["status"] for s in statuses] == ["completed", "completed"]
+    gateway.close()
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_pay_late_fees_concurrently(mock_get_book, mock_calc_fee):
+    gateway = AsyncPaymentGateway(BarrierGateway(5), max_concurrency=5)  # all five charges in flight at once
+    results = asyncio.run(pay_late_fees_concurrently(
+        [(f"{n:06d}", 1) for n in range(5)] + [("12345", 1)], gateway))
+    assert all(success for success, _, _ in results[:5])
+    assert results[0] == (True, "Payment successful! Payment of $5.00 processed successfully", "txn_000000")
+    assert results[5] == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    gateway.close()
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_pay_late_fees_async_reports_timeout(mock_get_book, mock_calc_fee):
+    gateway = AsyncPaymentGateway(StubGateway(delay=0.5), timeout=0.05)
+    success, msg, txn = asyncio.run(pay_late_fees_async("123456", 1, gateway, idempotency_key="key-1"))
+    assert not success and txn is None
+    assert "Payment processing error" in msg and "did not respond" in msg
+    # the charge may still complete, so it is not retryable
+    assert get_payment_by_key("key-1")['status'] == 'unknown'
+    assert not asyncio.run(pay_late_fees_async("123456", 1, gateway, idempotency_key="key-1"))[0]
+    gateway.close()
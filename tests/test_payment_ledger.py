@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+from database import get_payment_by_key, insert_book, insert_borrow_record, return_book_transaction
+from services.library_service import pay_late_fees, refund_late_fee_payment, verify_late_fee_payment
+from services.payment_ledger import late_fee_idempotency_key
+from services.payment_service import PaymentGateway
+
+
+def _gateway():
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123", "Payment of $5.00 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund of $5.00 processed successfully.")
+    gateway.verify_payment_status.return_value = {"transaction_id": "txn_999", "status": "completed"}
+    return gateway
+
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_duplicate_payment_answered_from_ledger(mock_get_book, mock_calc_fee):
+    gateway = _gateway()
+    first = pay_late_fees("123456", 1, gateway)
+    second = pay_late_fees("123456", 1, gateway)
+
+    assert first == second == (True, "Payment successful! Payment of $5.00 processed successfully", "txn_123")
+    gateway.process_payment.assert_called_once()
+    payment = get_payment_by_key(late_fee_idempotency_key("123456", 1, None, 0.0))
+    assert payment['status'] == 'succeeded' and payment['transaction_id'] == "txn_123"
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_declined_or_errored_payment_can_be_retried(mock_get_book, mock_calc_fee):
+    gateway = _gateway()
+    gateway.process_payment.side_effect = [ConnectionRefusedError("connection refused"),
+                                           (False, "", "Payment declined"),
+                                           (True, "txn_123", "Success")]
+    assert pay_late_fees("123456", 1, gateway, idempotency_key="key-1")[0] is False
+    assert get_payment_by_key("key-1")['status'] == 'error'
+    assert pay_late_fees("123456", 1, gateway, idempotency_key="key-1")[0] is False
+    assert get_payment_by_key("key-1")['status'] == 'failed'
+    assert pay_late_fees("123456", 1, gateway, idempotency_key="key-1") == (True, "Payment successful! Success", "txn_123")
+    assert gateway.process_payment.call_count == 3
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_in_flight_payment_is_not_submitted_twice(mock_get_book, mock_calc_fee):
+    gateway = _gateway()
+
+    def reentrant_charge(**kwargs):
+        # a second submission arriving while the first is still at the gateway
+        assert pay_late_fees("123456", 1, gateway) == (
+            False, "A payment for these late fees is already in progress.", None)
+        return True, "txn_123", "Success"
+
+    gateway.process_payment.side_effect = reentrant_charge
+    assert pay_late_fees("123456", 1, gateway)[0] is True
+    gateway.process_payment.assert_called_once()
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_status_checks_use_cached_terminal_state(mock_get_book, mock_calc_fee):
+    gateway = _gateway()
+    pay_late_fees("123456", 1, gateway)
+
+    status = verify_late_fee_payment("txn_123", gateway)
+    assert status['status'] == 'completed' and status['amount'] == 5.0
+    gateway.verify_payment_status.assert_not_called()
+
+    assert refund_late_fee_payment("txn_123", 5.0, gateway)[0] is True
+    assert refund_late_fee_payment("txn_123", 5.0, gateway)[0] is True
+    gateway.refund_payment.assert_called_once()
+    assert verify_late_fee_payment("txn_123", gateway)['status'] == 'refunded'
+    gateway.verify_payment_status.assert_not_called()
+
+def test_same_fee_on_a_new_loan_is_a_new_payment():
+    insert_book("Overdue", "Author", "1234567890123", 1, 1)
+    gateway = _gateway()
+    gateway.process_payment.side_effect = [(True, "txn_1", "Success"), (True, "txn_2", "Success")]
+
+    long_ago = datetime.now() - timedelta(days=60)
+    insert_borrow_record("123456", 1, long_ago, long_ago + timedelta(days=14))
+    assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_1")
+    return_book_transaction("123456", 1, datetime.now())
+
+    insert_borrow_record("123456", 1, long_ago, long_ago + timedelta(days=14))
+    assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_2")
+    assert gateway.process_payment.call_count == 2
+
+def test_growing_fee_is_topped_up_not_charged_again():
+    insert_book("Overdue", "Author", "1234567890123", 1, 1)
+    long_ago = datetime.now() - timedelta(days=60)
+    insert_borrow_record("123456", 1, long_ago, long_ago + timedelta(days=14))
+    gateway = _gateway()
+    gateway.process_payment.side_effect = [(True, "txn_1", "Success"), (True, "txn_2", "Success")]
+
+    with patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 3.0}):
+        assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_1")
+        assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_1")
+    with patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 3.5}):
+        assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_2")
+        assert pay_late_fees("123456", 1, gateway) == (True, "Payment successful! Success", "txn_2")
+
+    amounts = [call.kwargs['amount'] for call in gateway.process_payment.call_args_list]
+    assert amounts == [3.0, 0.5]
+
+@patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+@patch("services.library_service.get_book_by_id", return_value={"title": "book"})
+def test_timed_out_payment_is_not_retried(mock_get_book, mock_calc_fee):
+    gateway = _gateway()
+    gateway.process_payment.side_effect = TimeoutError("read timed out")
+    assert pay_late_fees("123456", 1, gateway, idempotency_key="key-1")[0] is False
+    assert get_payment_by_key("key-1")['status'] == 'unknown'
+
+    success, message, _ = pay_late_fees("123456", 1, gateway, idempotency_key="key-1")
+    assert not success and "may have gone through" in message
+    gateway.process_payment.assert_called_once()
+
+def test_unknown_transactions_go_to_gateway():
+    gateway = _gateway()
+    assert verify_late_fee_payment("txn_999", gateway)['status'] == 'completed'
+    assert verify_late_fee_payment("txn_999", gateway)['status'] == 'completed'
+    assert gateway.verify_payment_status.call_count == 2  # not ours, so nothing is cached
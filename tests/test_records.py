@@ -0,0 +1,65 @@
+import copy
+import pickle
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from database import insert_book, get_book_by_isbn, get_all_books, get_patron_borrowed_books, insert_borrow_record
+from records import Book, Loan
+
+
+def test_book_reads_like_a_dict():
+    book = Book(1, "Title", "Author", "1234567890123", 3, 2)
+    assert book.title == book['title'] == book.get('title') == "Title"
+    assert 'isbn' in book and 'keys' not in book
+    assert book.get('missing') is None
+    with pytest.raises(KeyError):
+        book['keys']
+    assert dict(book) == book.to_dict() == {
+        'id': 1, 'title': "Title", 'author': "Author", 'isbn': "1234567890123",
+        'total_copies': 3, 'available_copies': 2,
+    }
+    assert book == Book(**book.to_dict())
+    assert not hasattr(book, '__dict__')
+
+def test_book_is_read_only_mapping():
+    book = Book(1, "Title", "Author", "1234567890123", 3, 2)
+    with pytest.raises(TypeError):
+        book['title'] = "Changed"
+    with pytest.raises(AttributeError):
+        book.extra = 1
+    with pytest.raises(AttributeError):
+        book.title = "Changed"
+    with pytest.raises(AttributeError):
+        del book.title
+    assert book.title == "Title"
+
+def test_records_copy_and_pickle():
+    book = Book(1, "Title", "Author", "1234567890123", 3, 2)
+    loan = Loan(1, "Title", "Author", datetime(2026, 1, 1), datetime(2026, 1, 15), None, True)
+    for record in (book, loan):
+        for clone in (copy.copy(record), copy.deepcopy(record), pickle.loads(pickle.dumps(record))):
+            assert type(clone) is type(record) and clone == record and clone is not record
+    with pytest.raises(AttributeError):
+        copy.copy(book).title = "Changed"
+
+def test_database_returns_records():
+    insert_book("Record", "Author", "1234567890123", 2, 2)
+    book = get_book_by_isbn("1234567890123")
+    assert isinstance(book, Book) and book.available_copies == 2
+    assert get_all_books() == [book]
+
+    now = datetime.now()
+    insert_borrow_record("123456", book.id, now - timedelta(days=20), now - timedelta(days=6))
+    loan, = get_patron_borrowed_books("123456")
+    assert isinstance(loan, Loan)
+    assert loan.title == "Record" and loan['is_overdue'] and loan.return_date is None
+
+def test_records_are_serialized_by_jsonify():
+    app = create_app()
+    book = get_book_by_isbn("9780451524935")
+    with app.app_context():
+        assert app.json.loads(app.json.dumps({'book': book}))['book']['title'] == "1984"
+    report = app.test_client().get('/api/patron/123456/history').get_json()
+    assert report['loans'][0]['title'] == "1984"
@@ -0,0 +1,136 @@
+import io
+import json
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from database import insert_book, insert_borrow_record, encode_cursor
+
+
+@pytest.fixture
+def client():
+    app = create_app()
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+### ---------- Catalog ---------- ###
+
+def test_catalog_pages_through_books(client):
+    for n in range(5):
+        insert_book(f"Zebra {n}", "Author", f"{n:013d}", 1, 1)
+
+    page = client.get('/catalog?limit=4')
+    assert page.status_code == 200
+    assert b'The Great Gatsby' in page.data
+    assert b'Zebra 4' not in page.data
+    assert b'Next Page' in page.data
+
+    next_url = page.data.split(b'href="/catalog?cursor=')[1].split(b'"')[0].decode().replace('&amp;', '&')
+    page = client.get('/catalog?cursor=' + next_url)
+    assert b'Zebra 4' in page.data
+    assert b'The Great Gatsby' not in page.data
+    assert b'Next Page' not in page.data
+    assert b'First Page' in page.data
+
+def test_catalog_invalid_cursor_falls_back_to_first_page(client):
+    page = client.get('/catalog?cursor=garbage')
+    assert page.status_code == 200
+    assert b'Invalid page cursor' in page.data
+    assert b'The Great Gatsby' in page.data
+
+def test_catalog_tampered_cursor_falls_back_to_first_page(client):
+    for values in ([{}, 1], [[1], 2], ["Title"]):
+        page = client.get(f'/catalog?cursor={encode_cursor(*values)}')
+        assert page.status_code == 200
+        assert b'Invalid page cursor' in page.data
+
+
+### ---------- Search API ---------- ###
+
+def _add_books(count):
+    for n in range(count):
+        insert_book(f"Streaming Book {n:02d}", "Author", f"{n:013d}", 1, 1)
+
+def test_search_api_pages_with_cursor(client):
+    _add_books(5)
+    titles = []
+    response = client.get('/api/search?q=streaming&limit=2').get_json()
+    while True:
+        assert response['count'] <= 2
+        titles += [book['title'] for book in response['results']]
+        if not response['next_cursor']:
+            break
+        response = client.get(f"/api/search?q=streaming&limit=2&cursor={response['next_cursor']}").get_json()
+    assert titles == [f"Streaming Book {n:02d}" for n in range(5)]
+
+def test_search_api_streams_ndjson(client):
+    _add_books(3)
+    response = client.get('/api/search?q=streaming&format=ndjson&offset=1')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['isbn'] for line in lines] == ["0000000000001", "0000000000002"]
+
+def test_search_api_rejects_bad_paging(client):
+    assert client.get('/api/search?q=a&cursor=nope').status_code == 400
+    assert client.get('/api/search?q=a&limit=0').status_code == 400
+    assert client.get('/api/search?q=a&type=publisher').status_code == 400
+
+def test_search_api_without_limit_returns_everything(client):
+    _add_books(3)
+    response = client.get('/api/search?q=streaming').get_json()
+    assert response['count'] == 3 and response['next_cursor'] is None
+
+
+### ---------- Overdue loans ---------- ###
+
+def _add_overdue_loans(days_overdue):
+    now = datetime.now()
+    for n, days in enumerate(days_overdue):
+        insert_borrow_record(f"{n:06d}", 1, now - timedelta(days=days + 14), now - timedelta(days=days, hours=1))
+
+def test_overdue_api_lists_most_overdue_first(client):
+    _add_overdue_loans([2, 20, 5])
+    data = client.get('/api/overdue?min_days=3').get_json()
+    assert [loan['days_overdue'] for loan in data['loans']] == [20, 5]
+    assert data['loans'][0]['fee_amount'] == 15.00
+    assert data['next_cursor'] is None
+
+    data = client.get('/api/overdue?limit=1').get_json()
+    assert data['count'] == 1 and data['next_cursor']
+    data = client.get(f"/api/overdue?limit=5&cursor={data['next_cursor']}").get_json()
+    assert [loan['days_overdue'] for loan in data['loans']] == [5, 2]
+
+def test_overdue_api_rejects_bad_filters(client):
+    assert client.get('/api/overdue?min_days=5&max_days=2').status_code == 400
+    assert client.get('/api/overdue?cursor=nope').status_code == 400
+    assert client.get('/api/overdue?limit=0').status_code == 400
+
+def test_overdue_page_renders_loans(client):
+    _add_overdue_loans([4])
+    response = client.get('/overdue')
+    assert response.status_code == 200
+    assert b'Overdue Loans' in response.data and b'$2.00' in response.data
+
+
+### ---------- Bulk import API ---------- ###
+
+def test_import_api_accepts_uploaded_csv(client):
+    feed = b"title,author,isbn,total_copies\nDune,Frank Herbert,9780441013593,3\nBad,Author,1,1\n"
+    response = client.post('/api/books/import',
+                           data={'file': (io.BytesIO(feed), 'feed.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['imported'] == 1
+    assert report['rejected'] == [{'line': 3, 'isbn': '1', 'reason': 'ISBN must be exactly 13 digits.'}]
+
+def test_import_api_accepts_jsonl_body(client):
+    body = json.dumps({'title': 'Emma', 'author': 'Jane Austen', 'isbn': '9780141439587', 'total_copies': 2})
+    response = client.post('/api/books/import?format=jsonl', data=body)
+    assert response.get_json()['imported'] == 1
+
+def test_import_api_requires_known_format(client):
+    assert client.post('/api/books/import', data=b"x").status_code == 400